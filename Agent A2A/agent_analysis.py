@@ -1,11 +1,22 @@
+import time
+INICIO_IMPORT = time.perf_counter()  # startup_import_seconds: do início do import até a app pronta para o lifespan
+
 import os
 import re
-import httpx
+from contextlib import asynccontextmanager
+from pathlib import Path
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
-from pydantic_ai import Agent
-import uvicorn
-from schemas.schemas import AgentCard
+from schemas.schemas import AgentCard, ToolResult
+from shared.deadline import DeadlineExceeded, install_deadline
+from shared.llm_cache import CachedAgent
+from shared.memory import contexto_para_prompt, resultado_cep_do_contexto
+from shared.registry import AgentHeartbeat, get_agent_registry
+from shared.streaming import responder_agente, responder_texto, wants_stream
+from shared.telemetry import instrument_app, metrics
+from shared.transport import create_http_client
+from shared.upstream import register_overload_handler, upstream_stats
+from shared.warmup import WARMUP_LLM, ServiceReadiness, aquecer_conexoes
 
 load_dotenv()
 os.getenv("OPENAI_API_KEY")
@@ -18,27 +29,100 @@ AGENT_CARD_ANALYSIS = AgentCard(
     invocation_endpoint="http://localhost:8001/sse",
 )
 
-http_client: httpx.AsyncClient | None = None
-agent = Agent(
+# Modo de análise:
+#   "single" -> busca os dados estruturados no MCP e faz UMA chamada ao LLM aqui
+#   "mcp"    -> usa a análise do MCP Server (LLM) e a complementa com um segundo LLM
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "single")
+
+# Endereço anunciado no registro de agentes (cada réplica publica o seu)
+AGENT_PUBLIC_URL = os.getenv("AGENT_PUBLIC_URL", "http://localhost:8001")
+
+agent = CachedAgent(
     "openai:gpt-4o-mini",
+    name="analysis",
     instructions="""📜 Você é um assistente especialista em ANÁLISE DETALHADA de CEP. 
-              Sua tarefa é receber uma análise do MCP Server e complementá-la com insights sobre desenvolvimento, tendências e oportunidades.""",
+              Sua tarefa é analisar endereços a partir dos dados do CEP (ou complementar uma análise do MCP Server) com insights sobre desenvolvimento, tendências e oportunidades.""",
 )
-app = FastAPI(title=AGENT_CARD_ANALYSIS.name)
 
 
-async def chamar_mcp_analisar_endereco(cep: str) -> str:
-    """Chama ferramenta de análise no MCP Server."""
+# ✅ Ciclo de vida: o estado do serviço fica em app.state, um por worker
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with readiness.phase("lifespan"):
+        app.state.http_client = create_http_client(timeout=45.0)
+    app.state.heartbeat = AgentHeartbeat(
+        get_agent_registry(),
+        AGENT_PUBLIC_URL,
+        AGENT_CARD_ANALYSIS,
+        interval=float(os.getenv("REGISTRY_HEARTBEAT_INTERVAL", "5")),
+    )
+    print(f"\n🚀 {AGENT_CARD_ANALYSIS.name} FUNCIONANDO INICIADO! (porta 8001)")
+    # Warm-up (WARMUP=1): conexões com o MCP e a primeira chamada ao modelo; só então entra no registro
+    await readiness.start_warmup(
+        lambda: aquecer_conexoes(app.state.http_client, ["http://localhost:8000/"]),
+        lambda: agent.warm_up(llm=WARMUP_LLM),
+        on_ready=app.state.heartbeat.start,
+    )
+    try:
+        yield
+    finally:
+        await readiness.stop()
+        await app.state.heartbeat.stop()
+        await app.state.http_client.aclose()
+
+
+app = FastAPI(title=AGENT_CARD_ANALYSIS.name, lifespan=lifespan)
+instrument_app(app, "agent_analysis")
+register_overload_handler(app)
+install_deadline(app)
+readiness = ServiceReadiness("agent_analysis", started_at=INICIO_IMPORT)
+readiness.install(app)
+metrics.register_collector("agent_analysis", upstream_stats)
+
+
+async def chamar_mcp(ferramenta: str, cep: str, timeout: float, **extras) -> ToolResult:
+    """Chama uma ferramenta do MCP Server e retorna o resultado estruturado."""
+    http_client = getattr(app.state, "http_client", None)
     assert http_client is not None, "HTTP Client não inicializado"
     try:
         response = await http_client.post(
-            "http://localhost:8000/mcp/analisar_endereco", json={"cep": cep}, timeout=30
+            f"http://localhost:8000/mcp/{ferramenta}", json={"cep": cep, **extras}, timeout=timeout
         )
         response.raise_for_status()
-        data: dict = response.json()
-        return data.get("output", "Erro na resposta do MCP")
+        return ToolResult(**response.json())
     except Exception as e:
-        return f"❌ Erro ao chamar MCP: {str(e)}"
+        return ToolResult(
+            success=False,
+            tool=f"mcp:{ferramenta}",
+            input=cep,
+            output=f"❌ Erro ao chamar MCP: {str(e)}",
+            error_code="deadline_exceeded" if isinstance(e, DeadlineExceeded) else "upstream_error",
+        )
+
+
+async def chamar_mcp_analisar_endereco(cep: str, context: dict | None = None) -> ToolResult:
+    """Chama ferramenta de análise no MCP Server, repassando a consulta que o coordenador já trouxe."""
+    pronto = resultado_cep_do_contexto(context, cep)
+    if pronto is not None:
+        return await chamar_mcp("analisar_endereco", cep, timeout=30, consulta=pronto)
+    return await chamar_mcp("analisar_endereco", cep, timeout=30)
+
+
+async def chamar_mcp_consultar_cep(cep: str, context: dict | None = None) -> ToolResult:
+    """Chama ferramenta de consulta (sem LLM) no MCP Server, a menos que o coordenador já tenha trazido o resultado."""
+    pronto = resultado_cep_do_contexto(context, cep)
+    if pronto is not None:
+        return ToolResult(**pronto)
+    return await chamar_mcp("consultar_cep", cep, timeout=15)
+
+
+def prompt_analise_unica(resultado: ToolResult) -> str:
+    """Prompt da análise em uma única chamada ao LLM, sobre os dados estruturados do CEP."""
+    return (
+        f"Analise este endereço brasileiro a partir dos dados do CEP (JSON): {resultado.dados.model_dump_json()}. "
+        "Forneça uma análise que inclua: Tipo de região, Características da área, Contexto geográfico, "
+        "Informações úteis e insights sobre desenvolvimento, tendências e oportunidades. Use emojis e seja conciso."
+    )
 
 
 @app.get("/card", response_model=AgentCard)
@@ -59,42 +143,52 @@ async def health():
 
 @app.post("/sse")
 async def a2a_endpoint(request: Request):
-    """Endpoint principal de invocação do agente."""
+    """Endpoint principal de invocação do agente. Responde em SSE quando o cliente pede streaming."""
     data = await request.json()
     message = data.get("message", "")
+    stream = wants_stream(request, data)
+    # Contexto enviado pelo coordenador: permite continuações sem CEP ("e o bairro?")
+    context = data.get("context") or {}
     cep_match = re.search(r"\b\d{5}-?\d{3}\b", message)
-    if cep_match:
-        cep = cep_match.group()
-        resultado_mcp = await chamar_mcp_analisar_endereco(cep)
-        if "❌" in resultado_mcp:
-            return {"success": False, "response": resultado_mcp}
+    cep = cep_match.group() if cep_match else context.get("cep")
+    # Só mensagens de continuação levam o histórico ao LLM, para não diluir o cache de respostas
+    historico = "" if cep_match else contexto_para_prompt(context)
+    if cep:
+        if ANALYSIS_MODE == "single":
+            resultado_mcp = await chamar_mcp_consultar_cep(cep, context)
+            if not resultado_mcp.success:
+                return responder_texto(resultado_mcp.output, success=False, stream=stream)
+            prefixo = f"🧠 **Análise Completa de Endereço**\n\n📊 **DADOS BÁSICOS**\n{resultado_mcp.output}\n\n🤖 **ANÁLISE INTELIGENTE**\n\n"
+            prompt = prompt_analise_unica(resultado_mcp) + (f"\n\nPedido do usuário: {message}{historico}" if historico else "")
+            return await responder_agente(agent, prompt, stream, prefixo=prefixo)
+
+        resultado_mcp = await chamar_mcp_analisar_endereco(cep, context)
+        if not resultado_mcp.success:
+            return responder_texto(resultado_mcp.output, success=False, stream=stream)
         prompt_complemento = (
-            f"Como especialista, complemente esta análise de CEP: {resultado_mcp}."
+            f"Como especialista, complemente esta análise de CEP: {resultado_mcp.output}.{historico}"
+        )
+        return await responder_agente(
+            agent, prompt_complemento, stream, prefixo="🧠 **ANÁLISE ADICIONAL**\n\n"
         )
-        result_agent = await agent.run(prompt_complemento)
-        return {
-            "success": True,
-            "response": f"🧠 **ANÁLISE ADICIONAL**\n\n{result_agent.output}",
-        }
     else:
-        result = await agent.run(
-            f"O usuário disse: '{message}'. Responda que você é um especialista em análises detalhadas e peça um CEP."
+        return await responder_agente(
+            agent,
+            f"O usuário disse: '{message}'. Responda que você é um especialista em análises detalhadas e peça um CEP.{historico}",
+            stream,
         )
-        return {"success": True, "response": result.output}
-
-
-@app.on_event("startup")
-async def startup_event():
-    global http_client
-    http_client = httpx.AsyncClient(timeout=45.0)
-    print(f"\n🚀 {AGENT_CARD_ANALYSIS.name} FUNCIONANDO INICIADO! (porta 8001)")
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    if http_client:
-        await http_client.aclose()
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")
+    import uvicorn
+
+    # WORKERS > 1 sobe vários processos; cada um registra o mesmo endereço no registro de agentes
+    workers = int(os.getenv("WORKERS", "1"))
+    uvicorn.run(
+        "agent_analysis:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=8001,
+        log_level="info",
+        workers=workers,
+        app_dir=str(Path(__file__).resolve().parent),
+    )
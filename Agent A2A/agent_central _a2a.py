@@ -1,66 +1,174 @@
+import time
+INICIO_IMPORT = time.perf_counter()  # startup_import_seconds: do início do import até a app pronta para o lifespan
+
 import os
+import io
+import csv
+import asyncio
 import logging
+from contextlib import asynccontextmanager, nullcontext
+from pathlib import Path
 import httpx
-import uvicorn
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-from pydantic_ai import Agent
+from fastapi.responses import JSONResponse, Response
 from dotenv import load_dotenv
 from typing import List, Dict
 from schemas.schemas import AgentCard
+from shared.deadline import install_deadline
+from shared.discovery import AgentDirectory, AgentEndpoint
+from shared.jobs import JOB_FINAL_STATUS, JobManager, JobRowRetry, JobStore, linhas_de_csv, linhas_de_lista
+from shared.llm_cache import CachedAgent
+from shared.local_router import CEP_PATTERN, SUBTASK_TEMPLATES, ExecutionPlan, LocalRouter, PlanStep, RoutingDecision
+from shared.memory import ConversationSession, ConversationStore
+from shared.registry import get_agent_registry
+from shared.scheduler import PriorityScheduler
+from shared.streaming import iter_sse, sse_event, sse_response, wants_stream
+from shared.telemetry import instrument_app, metrics, span
+from shared.transport import create_http_client
+from shared.upstream import UpstreamOverloaded, register_overload_handler, upstream_stats
+from shared.warmup import WARMUP_LLM, ServiceReadiness, aquecer_conexoes
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 load_dotenv()
 os.getenv("OPENAI_API_KEY")
 
-# Lista de endereços base dos agentes que o coordenador tentará descobrir
-SPECIALIST_AGENT_URLS = [
-    "http://localhost:8001", # Agent Analysis
-    "http://localhost:8002", # Agent Consult
-]
-
-# Esta lista será preenchida dinamicamente na inicialização
-AVAILABLE_AGENTS: List[AgentCard] = []
+# Lista de endereços base dos agentes que o coordenador tentará descobrir.
+# Várias réplicas do mesmo agent_id podem ser listadas (separadas por vírgula em SPECIALIST_AGENT_URLS).
+SPECIALIST_AGENT_URLS = os.getenv(
+    "SPECIALIST_AGENT_URLS",
+    ",".join([
+        "http://localhost:8001", # Agent Analysis
+        "http://localhost:8002", # Agent Consult
+    ]),
+).split(",")
 
-http_client: httpx.AsyncClient | None = None
+# Roteador local: decide sem LLM quando a confiança é alta
+local_router = LocalRouter(threshold=float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.75")))
+# Limites por requisição para pedidos compostos (um ramo por CEP e intenção)
+FANOUT_MAX_STEPS = int(os.getenv("FANOUT_MAX_STEPS", "8"))
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "4"))
+# MCP Server usado na consulta especulativa do CEP (em paralelo com o roteamento)
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://localhost:8000").rstrip("/")
+CEP_PREFETCH = os.getenv("CEP_PREFETCH", "1") != "0"
+# Jobs em lote: cada tipo de job usa um especialista; o progresso fica em SQLite (checkpoint por linha)
+JOB_AGENTS = {"consult": "consult_specialist_v1", "analysis": "analysis_specialist_v1"}
+JOBS_MAX_ROWS = int(os.getenv("JOBS_MAX_ROWS", "50000"))
+# Prazo padrão (s) de uma requisição ao /sse; cada salto recebe o que resta dele
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "45"))
+# Escalonador das chamadas aos especialistas: um pool e uma fila por classe (SCHED_<CLASSE>_*).
+# A consulta (rápida) tem prioridade e peso maiores; a análise (duas chamadas ao LLM) tem um pool
+# menor, para não ocupar todas as conexões; os jobs em lote ficam com o que sobrar
+scheduler = PriorityScheduler(
+    max_concurrency=int(os.getenv("SCHED_MAX_CONCURRENCY", "64")),
+    max_wait=float(os.getenv("SCHED_MAX_WAIT", "10")),
+    classes={
+        "consult_specialist_v1": {"priority": 1, "weight": 3, "concurrency": 32, "max_queue": 200},
+        "analysis_specialist_v1": {"priority": 0, "weight": 1, "concurrency": 12, "max_queue": 50},
+        # Linhas de job não têm pressa: esperam a vez em vez de falhar por sobrecarga
+        "jobs": {"priority": -1, "weight": 1, "concurrency": 8, "max_queue": 10_000, "max_wait": 3600},
+    },
+)
+# Memória das conversas por session_id: o cliente envia só o turno novo
+memory = ConversationStore(
+    max_tokens=int(os.getenv("MEMORY_MAX_TOKENS", "1500")),
+    min_recent_turns=int(os.getenv("MEMORY_RECENT_TURNS", "4")),
+    max_sessions=int(os.getenv("MEMORY_MAX_SESSIONS", "1000")),
+    ttl=float(os.getenv("MEMORY_SESSION_TTL", "3600")),
+)
 # O prompt do agente central agora é dinâmico, construído em tempo real
-agent = Agent("openai:gpt-4o-mini")
-app = FastAPI(title="Agent Central - Dynamic Coordinator")
+agent = CachedAgent("openai:gpt-4o-mini", name="central")
+
+
+# ✅ Ciclo de vida: cliente HTTP e diretório de especialistas ficam em app.state, um por worker
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Na inicialização, descobre os agentes disponíveis e inicia a redescoberta periódica."""
+    with readiness.phase("lifespan"):
+        app.state.http_client = create_http_client()
+        # Diretório de especialistas: redescoberta periódica, saúde e balanceamento entre réplicas
+        app.state.directory = AgentDirectory(
+            SPECIALIST_AGENT_URLS,
+            app.state.http_client,
+            interval=float(os.getenv("DISCOVERY_INTERVAL", "15")),
+            strategy=os.getenv("BALANCING_STRATEGY", "least_in_flight"),
+            failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3")),
+            reset_timeout=float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30")),
+            registry=get_agent_registry(),
+            registry_max_age=float(os.getenv("REGISTRY_MAX_AGE", "15")),
+        )
+
+        print("\n🚀 Iniciando Coordenador Dinâmico...")
+        print("🔍 Descobrindo agentes especialistas na rede...")
+        await app.state.directory.discover()
+        app.state.directory.start()
+        print(f"✨ Descoberta concluída. {len(app.state.directory.cards())} agentes disponíveis.")
+        # Jobs em lote: retoma os que foram interrompidos de onde pararam
+        app.state.jobs = JobManager(
+            JobStore(os.getenv("JOBS_DB", "jobs.sqlite3")),
+            processar_linha_job,
+            max_running_jobs=int(os.getenv("JOBS_MAX_RUNNING", "2")),
+            row_concurrency=int(os.getenv("JOBS_ROW_CONCURRENCY", "4")),
+        )
+        await app.state.jobs.start()
+    # Warm-up (WARMUP=1): conexão com o MCP (prefetch de CEP) e a primeira chamada ao modelo de roteamento;
+    # as conexões com os especialistas já foram abertas pela descoberta
+    await readiness.start_warmup(
+        lambda: aquecer_conexoes(app.state.http_client, [f"{MCP_SERVER_URL}/"]),
+        lambda: agent.warm_up(llm=WARMUP_LLM),
+    )
+    try:
+        yield
+    finally:
+        await readiness.stop()
+        await app.state.jobs.stop()
+        app.state.jobs.store.close()
+        await app.state.directory.stop()
+        await app.state.http_client.aclose()
+
+
+app = FastAPI(title="Agent Central - Dynamic Coordinator", lifespan=lifespan)
+instrument_app(app, "agent_central")
+register_overload_handler(app)
+# Prazo de ponta a ponta: vale para o /sse quando o cliente não envia X-Request-Timeout
+install_deadline(app, REQUEST_DEADLINE, default_paths=("/sse",))
+readiness = ServiceReadiness("agent_central", started_at=INICIO_IMPORT)
+readiness.install(app)
+metrics.register_collector("agent_central", lambda: {
+    "conversation_sessions": len(memory),
+    "available_agents": len(available_agents()),
+    **upstream_stats(),
+    **scheduler.stats(),
+})
 
 @app.get("/")
 async def health():
     """Mostra o status e os agentes que foram descobertos com sucesso."""
+    directory: AgentDirectory | None = getattr(app.state, "directory", None)
     return {
         "status": "✅ ONLINE",
         "service": "Agent Central Dynamic Coordinator",
-        "discovered_agents": [agent.agent_id for agent in AVAILABLE_AGENTS]
+        "discovered_agents": [agent.agent_id for agent in available_agents()],
+        "endpoints": directory.snapshot() if directory else [],
+        "scheduler": scheduler.snapshot(),
+        "sessions": len(memory),
     }
 
-@app.post("/sse")
-async def a2a_endpoint(request: Request):
-    """
-    Endpoint que usa um LLM para rotear a tarefa para o melhor agente
-    descoberto na rede.
-    """
-    assert http_client is not None, "HTTP Client não inicializado"
-    data = await request.json()
-    
-    input_data = data.get("input", {})
-    message = input_data.get("input", "")
+def available_agents() -> List[AgentCard]:
+    """Cartões dos especialistas com pelo menos uma réplica saudável."""
+    directory: AgentDirectory | None = getattr(app.state, "directory", None)
+    return directory.cards() if directory else []
 
-    if not message:
-        return JSONResponse(status_code=400, content={"error": "Campo 'message' ou 'input' obrigatório no payload."})
 
-    if not AVAILABLE_AGENTS:
-        return JSONResponse(status_code=503, content={"error": "Nenhum agente especialista disponível no momento."})
-
-    # 1. Monta a lista de ferramentas a partir dos cartões descobertos
+async def rotear_com_llm(message: str) -> RoutingDecision:
+    """Usa o LLM para escolher o especialista quando o roteador local não tem confiança."""
+    # Monta a lista de ferramentas a partir dos cartões descobertos
+    cards = available_agents()
     tools_description = "\n".join(
-        [f"- ID do Agente: '{card.agent_id}', Nome: '{card.name}', Descrição: {card.description}" for card in AVAILABLE_AGENTS]
+        [f"- ID do Agente: '{card.agent_id}', Nome: '{card.name}', Descrição: {card.description}" for card in cards]
     )
 
-    # 2. Cria o prompt de roteamento dinâmico para o LLM
+    # Cria o prompt de roteamento dinâmico para o LLM
     routing_prompt = f"""
     Você é um roteador inteligente de tarefas. Sua função é analisar um pedido do usuário e escolher o melhor especialista de uma lista.
 
@@ -73,68 +181,523 @@ async def a2a_endpoint(request: Request):
     Se nenhum especialista for claramente adequado, responda com a palavra 'NONE'.
     """
 
-    # 3. Primeira chamada ao LLM: Decidir qual agente usar
     logger.info("Decidindo rota com LLM...")
     chosen_agent_id = (await agent.run(routing_prompt)).output.strip().replace("'", "")
-    logger.info(f"LLM escolheu o agente: {chosen_agent_id}")
+    if not any(card.agent_id == chosen_agent_id for card in cards):
+        chosen_agent_id = None
+    return RoutingDecision(agent_id=chosen_agent_id, router="llm")
+
+
+def prompt_sem_especialista(message: str) -> str:
+    return f"O usuário disse: '{message}'. Responda que você é um coordenador de agentes de CEP, mas não encontrou um especialista para esta tarefa específica no momento. Peça para o usuário ser mais específico."
+
+
+async def relay_especialista(endpoint: AgentEndpoint, payload: dict, router: str, session: ConversationSession):
+    """Repassa o stream SSE do especialista escolhido, acrescentando o rodapé do coordenador."""
+    http_client: httpx.AsyncClient | None = getattr(app.state, "http_client", None)
+    directory: AgentDirectory | None = getattr(app.state, "directory", None)
+    assert http_client is not None and directory is not None, "HTTP Client não inicializado"
+    card = endpoint.card
+    logger.info(f"Invocando o endpoint (streaming): {endpoint.invocation_url}")
+    yield sse_event({"type": "meta", "agent": card.name, "router": router, "session_id": session.session_id})
+    success, cached, erro = False, False, None
+    partes = []
+    try:
+        async with scheduler.slot(card.agent_id, card.name), directory.track(endpoint), http_client.stream(
+            "POST", endpoint.invocation_url, json={**payload, "stream": True}, timeout=45
+        ) as response:
+            response.raise_for_status()
+            async for evento in iter_sse(response):
+                if evento.get("type") == "delta":
+                    partes.append(evento.get("text", ""))
+                    yield sse_event(evento)
+                elif evento.get("type") == "done":
+                    success = evento.get("success", False)
+                    cached = evento.get("cached", False)
+                    erro = evento.get("error")
+    except Exception as e:
+        logger.error(f"Erro ao contatar o agente {card.name}: {e}")
+        aviso = str(e) if isinstance(e, UpstreamOverloaded) else f"Desculpe, houve um erro ao tentar contatar o {card.name}."
+        yield sse_event({"type": "delta", "text": aviso})
+        yield sse_event({"type": "done", "success": False, "router": router, "error": aviso})
+        return
+    await memory.add_turn(session, "assistant", "".join(partes))
+    yield sse_event({"type": "delta", "text": f"\n\n---\n*Agente utilizado: {card.name} (roteador: {router})*"})
+    fim = {"type": "done", "success": success, "router": router, "cached": cached}
+    if not success:
+        fim["error"] = erro or f"O {card.name} não conseguiu responder."
+    yield sse_event(fim)
+
+
+async def responder_direto_stream(message: str, router: str, session: ConversationSession):
+    """Resposta do próprio coordenador, em streaming, quando nenhum especialista serve."""
+    logger.info("Nenhum especialista adequado. Respondendo diretamente (streaming).")
+    yield sse_event({"type": "meta", "agent": "Agent Central (GPT)", "router": router, "session_id": session.session_id})
+    partes = []
+    try:
+        async with agent.run_stream(prompt_sem_especialista(message)) as result:
+            async for delta in result.stream_text(delta=True):
+                partes.append(delta)
+                yield sse_event({"type": "delta", "text": delta})
+    except Exception as e:
+        logger.error(f"Erro na resposta do coordenador: {e}")
+        aviso = str(e) if isinstance(e, UpstreamOverloaded) else f"❌ Erro na resposta do coordenador: {str(e)}"
+        yield sse_event({"type": "delta", "text": ("\n\n" if partes else "") + aviso})
+        yield sse_event({"type": "done", "success": False, "router": router, "error": aviso})
+        return
+    await memory.add_turn(session, "assistant", "".join(partes))
+    yield sse_event({"type": "delta", "text": f"\n\n---\n*Agente utilizado: Agent Central (GPT) (roteador: {router})*"})
+    yield sse_event({"type": "done", "success": True, "router": router, "cached": result.cached})
+
+
+# ✅ Consulta especulativa do CEP
+def digitos_cep(cep: str) -> str:
+    return "".join(filter(str.isdigit, cep))
+
+
+async def prefetch_cep(cep: str) -> dict | None:
+    """Busca o CEP no MCP Server enquanto o roteamento acontece; falhas só desativam o atalho."""
+    http_client: httpx.AsyncClient | None = getattr(app.state, "http_client", None)
+    if http_client is None:
+        return None
+    try:
+        with span("prefetch", desc=cep):
+            response = await http_client.post(f"{MCP_SERVER_URL}/mcp/consultar_cep", json={"cep": cep}, timeout=15)
+            response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        logger.warning(f"Consulta especulativa do CEP {cep} falhou: {e}")
+        return None
+
+
+def iniciar_prefetch(ceps: List[str]) -> Dict[str, asyncio.Future]:
+    """Uma tarefa por CEP distinto, indexada pelos dígitos."""
+    if not CEP_PREFETCH:
+        return {}
+    tarefas: Dict[str, asyncio.Future] = {}
+    for cep in ceps:
+        if cep and digitos_cep(cep) not in tarefas:
+            tarefas[digitos_cep(cep)] = asyncio.ensure_future(prefetch_cep(cep))
+    return tarefas
+
+
+def cancelar_prefetch(prefetch: Dict[str, asyncio.Future]) -> None:
+    for tarefa in prefetch.values():
+        if not tarefa.done():
+            tarefa.cancel()
+    if prefetch:
+        metrics.inc("cep_prefetch_total", result="cancelled")
+
+
+async def contexto_com_cep(context: dict, cep: str | None, prefetch: Dict[str, asyncio.Future]) -> dict:
+    """Acrescenta ao contexto o resultado da consulta especulativa, para o especialista não buscar de novo."""
+    tarefa = prefetch.get(digitos_cep(cep)) if cep else None
+    resultado = await tarefa if tarefa is not None else None
+    if resultado is None:
+        metrics.inc("cep_prefetch_total", result="miss")
+        return context
+    metrics.inc("cep_prefetch_total", result="hit")
+    return {**context, "cep_result": resultado}
+
+
+# ✅ Plano com vários especialistas em paralelo
+async def executar_ramo(
+    step: PlanStep,
+    card: AgentCard,
+    context: dict,
+    semaforo: asyncio.Semaphore | None,
+    prefetch: Dict[str, asyncio.Future],
+    classe: str | None = None,
+) -> dict:
+    """
+    Executa um ramo do plano; falhas viram um resultado com ``success=False`` em vez de exceção.
+    A chamada ocupa uma vaga do escalonador na classe ``classe`` (por padrão, a do especialista).
+    """
+    http_client: httpx.AsyncClient | None = getattr(app.state, "http_client", None)
+    directory: AgentDirectory | None = getattr(app.state, "directory", None)
+    assert http_client is not None and directory is not None, "HTTP Client não inicializado"
+    resultado = {"agent_id": step.agent_id, "agent": card.name, "cep": step.cep, "success": False, "response": "", "cached": False}
+    contexto_ramo = await contexto_com_cep({**context, "cep": step.cep}, step.cep, prefetch)
+    async with semaforo or nullcontext():
+        endpoint = directory.pick(step.agent_id)
+        if endpoint is None:
+            resultado["response"] = f"Nenhuma réplica disponível para {card.name}."
+            return resultado
+        try:
+            with span("specialist", desc=f"{step.agent_id}:{step.cep}"):
+                async with scheduler.slot(classe or step.agent_id, card.name), directory.track(endpoint):
+                    response = await http_client.post(
+                        endpoint.invocation_url,
+                        json={"message": step.message, "context": contexto_ramo},
+                        timeout=45,
+                    )
+                    response.raise_for_status()
+            dados = response.json()
+            resultado.update(
+                success=dados.get("success", True),
+                response=dados.get("response", "O agente especialista não retornou uma resposta."),
+                cached=dados.get("cached", False),
+            )
+        except Exception as e:
+            logger.error(f"Erro ao contatar o agente {card.name} (CEP {step.cep}): {e}")
+            resultado["response"] = str(e) if isinstance(e, UpstreamOverloaded) else f"Desculpe, houve um erro ao tentar contatar o {card.name}."
+    metrics.inc("fanout_steps_total", agent=step.agent_id, success=resultado["success"])
+    return resultado
+
+
+def secao_do_ramo(resultado: dict) -> str:
+    icone = "✅" if resultado["success"] else "⚠️"
+    return f"### {icone} {resultado['agent']} · CEP {resultado['cep']}\n\n{resultado['response']}"
+
+
+def avisos_do_plano(plano: ExecutionPlan, resultados: List[dict]) -> List[str]:
+    avisos = []
+    falhas = sum(1 for r in resultados if not r["success"])
+    if falhas:
+        avisos.append(f"⚠️ {falhas} de {len(resultados)} partes do pedido falharam; as demais estão acima.")
+    if plano.truncated:
+        avisos.append(f"⚠️ Pedido limitado a {len(plano.steps)} tarefas; envie o restante em outra mensagem.")
+    return avisos
+
+
+def rodape_do_plano(resultados: List[dict], router: str) -> str:
+    agentes = ", ".join(dict.fromkeys(r["agent"] for r in resultados))
+    return f"\n\n---\n*Agentes utilizados: {agentes} (roteador: {router}, {len(resultados)} tarefas em paralelo)*"
+
+
+def resumo_do_plano(plano: ExecutionPlan) -> List[dict]:
+    return [step.model_dump(exclude={"message"}) for step in plano.steps]
+
+
+async def responder_plano(
+    plano: ExecutionPlan,
+    cards: List[AgentCard],
+    context: dict,
+    router: str,
+    session: ConversationSession,
+    prefetch: Dict[str, asyncio.Future],
+) -> dict:
+    """Executa todos os ramos ao mesmo tempo e junta as respostas na ordem do plano."""
+    por_id = {card.agent_id: card for card in cards}
+    semaforo = asyncio.Semaphore(FANOUT_CONCURRENCY)
+    resultados = await asyncio.gather(
+        *(executar_ramo(step, por_id[step.agent_id], context, semaforo, prefetch) for step in plano.steps)
+    )
+    corpo = "\n\n".join([secao_do_ramo(r) for r in resultados] + avisos_do_plano(plano, resultados))
+    await memory.add_turn(session, "assistant", corpo)
+    return {"output": {
+        "output": corpo + rodape_do_plano(resultados, router),
+        "router": router,
+        "cached": all(r["cached"] for r in resultados),
+        "session_id": session.session_id,
+        "plan": [{**passo, "success": r["success"]} for passo, r in zip(resumo_do_plano(plano), resultados)],
+    }}
+
+
+async def responder_plano_stream(
+    plano: ExecutionPlan,
+    cards: List[AgentCard],
+    context: dict,
+    router: str,
+    session: ConversationSession,
+    prefetch: Dict[str, asyncio.Future],
+):
+    """Versão SSE: cada ramo é enviado assim que termina."""
+    por_id = {card.agent_id: card for card in cards}
+    agentes = ", ".join(dict.fromkeys(por_id[step.agent_id].name for step in plano.steps))
+    yield sse_event({"type": "meta", "agent": agentes, "router": router, "session_id": session.session_id, "plan": resumo_do_plano(plano)})
+    semaforo = asyncio.Semaphore(FANOUT_CONCURRENCY)
+    tarefas = [
+        asyncio.ensure_future(executar_ramo(step, por_id[step.agent_id], context, semaforo, prefetch))
+        for step in plano.steps
+    ]
+    resultados, secoes = [], []
+    try:
+        for proxima in asyncio.as_completed(tarefas):
+            resultado = await proxima
+            resultados.append(resultado)
+            secoes.append(secao_do_ramo(resultado))
+            yield sse_event({"type": "delta", "text": ("\n\n" if len(secoes) > 1 else "") + secoes[-1]})
+    finally:
+        # Cliente desconectou: não espera os ramos que ninguém vai ler
+        for tarefa in tarefas:
+            tarefa.cancel()
+    avisos = avisos_do_plano(plano, resultados)
+    if avisos:
+        yield sse_event({"type": "delta", "text": "\n\n" + "\n\n".join(avisos)})
+    await memory.add_turn(session, "assistant", "\n\n".join(secoes + avisos))
+    yield sse_event({"type": "delta", "text": rodape_do_plano(resultados, router)})
+    yield sse_event({
+        "type": "done",
+        "success": any(r["success"] for r in resultados),
+        "router": router,
+        "cached": all(r["cached"] for r in resultados),
+    })
+
+
+@app.post("/sse")
+async def a2a_endpoint(request: Request):
+    """
+    Endpoint que usa um LLM para rotear a tarefa para o melhor agente
+    descoberto na rede. Com streaming, repassa os eventos SSE do especialista.
+    """
+    http_client: httpx.AsyncClient | None = getattr(app.state, "http_client", None)
+    directory: AgentDirectory | None = getattr(app.state, "directory", None)
+    assert http_client is not None and directory is not None, "HTTP Client não inicializado"
+    data = await request.json()
+    stream = wants_stream(request, data)
+    
+    input_data = data.get("input", {})
+    message = input_data.get("input", "")
+
+    if not message:
+        return JSONResponse(status_code=400, content={"error": "Campo 'message' ou 'input' obrigatório no payload."})
+
+    cards = available_agents()
+    if not cards:
+        return JSONResponse(status_code=503, content={"error": "Nenhum agente especialista disponível no momento."})
+
+    # 0. Memória da conversa: contexto anterior + turno novo
+    session = memory.get(data.get("session_id") or input_data.get("session_id"))
+    context = session.context()
+    await memory.add_turn(session, "user", message)
+    context["cep"] = session.last_cep
+    # Perguntas de continuação ("e o bairro?") são roteadas com o último CEP da conversa
+    routing_message = message
+    if session.last_cep and not CEP_PATTERN.search(message):
+        routing_message = f"{message} (CEP {session.last_cep})"
+
+    # Consulta especulativa: os CEPs da mensagem (ou o da conversa) são buscados durante o roteamento
+    ceps_mensagem = CEP_PATTERN.findall(message)
+    prefetch = iniciar_prefetch(ceps_mensagem or [session.last_cep])
+
+    local_router.update_agents(cards)
+    decision = None
+    with span("routing") as attrs:
+        # 1. Pedidos compostos (vários CEPs e/ou intenções) viram um plano executado em paralelo
+        plano = local_router.plan(message, max_steps=FANOUT_MAX_STEPS)
+        if plano is None:
+            # 2. Decisão em cache ou roteamento local (sem LLM) quando a confiança é alta
+            decision = local_router.cached(routing_message)
+            if decision is None:
+                # 3. Mensagem ambígua: o LLM decide
+                decision = local_router.route(routing_message) or await rotear_com_llm(routing_message)
+                local_router.remember(routing_message, decision)
+            if decision.agent_id:
+                # Vários CEPs sem palavra de intenção: todos vão para o especialista escolhido
+                plano = local_router.plan(message, fallback_agent_id=decision.agent_id, max_steps=FANOUT_MAX_STEPS)
+        router = "plan" if decision is None else decision.router
+        attrs["desc"] = router
+    metrics.inc("routing_decisions_total", router=router.split(":")[-1], cached=router.startswith("cache:"))
+
+    if plano is not None:
+        logger.info(f"Plano com {len(plano.steps)} tarefas: {[(s.agent_id, s.cep) for s in plano.steps]}")
+        metrics.inc("fanout_plans_total")
+        if stream:
+            return sse_response(responder_plano_stream(plano, cards, context, router, session, prefetch))
+        return await responder_plano(plano, cards, context, router, session, prefetch)
+
+    chosen_agent_id = decision.agent_id
+    logger.info(f"Roteador '{decision.router}' escolheu o agente: {chosen_agent_id}")
 
     # 4. Encontra o cartão do agente escolhido
-    chosen_agent_card = next((card for card in AVAILABLE_AGENTS if card.agent_id == chosen_agent_id), None)
+    chosen_agent_card = next((card for card in cards if card.agent_id == chosen_agent_id), None)
+    endpoint = directory.pick(chosen_agent_card.agent_id) if chosen_agent_card and directory else None
+    if chosen_agent_card is None or endpoint is None:
+        # O coordenador responde sem especialista (ou recusa): a consulta especulativa não tem mais uso
+        cancelar_prefetch(prefetch)
+    if chosen_agent_card and endpoint is None:
+        return JSONResponse(status_code=503, content={"error": f"Nenhuma réplica disponível para {chosen_agent_card.name}."})
 
+    # O endpoint do especialista espera "message" e, opcionalmente, o contexto da conversa
     if chosen_agent_card:
-        # 5. Segunda chamada: Invoca o agente especialista escolhido
-        logger.info(f"Invocando o endpoint: {chosen_agent_card.invocation_endpoint}")
+        cep_especialista = ceps_mensagem[0] if ceps_mensagem else session.last_cep
+        specialist_payload = {"message": message, "context": await contexto_com_cep(context, cep_especialista, prefetch)}
+
+    if stream:
+        if chosen_agent_card:
+            return sse_response(relay_especialista(endpoint, specialist_payload, decision.router, session))
+        return sse_response(responder_direto_stream(message, decision.router, session))
+
+    if chosen_agent_card:
+        # 5. Invoca o agente especialista escolhido
+        logger.info(f"Invocando o endpoint: {endpoint.invocation_url}")
         try:
-            # O endpoint do especialista espera um payload simples com "message"
-            specialist_payload = {"message": message}
-            response = await http_client.post(chosen_agent_card.invocation_endpoint, json=specialist_payload, timeout=45)
-            response.raise_for_status()
+            with span("specialist", desc=chosen_agent_card.agent_id):
+                async with scheduler.slot(chosen_agent_card.agent_id, chosen_agent_card.name), directory.track(endpoint):
+                    response = await http_client.post(endpoint.invocation_url, json=specialist_payload, timeout=45)
+                    response.raise_for_status()
             specialist_response = response.json()
+            response_text = specialist_response.get('response', 'O agente especialista não retornou uma resposta.')
+            await memory.add_turn(session, "assistant", response_text)
             
             # Combina a resposta do especialista com o nome do agente usado
-            final_response = f"{specialist_response.get('response', 'O agente especialista não retornou uma resposta.')}\n\n---\n*Agente utilizado: {chosen_agent_card.name}*"
-            return {"output": {"output": final_response}}
-            
+            final_response = f"{response_text}\n\n---\n*Agente utilizado: {chosen_agent_card.name} (roteador: {decision.router})*"
+            return {"output": {"output": final_response, "router": decision.router, "cached": specialist_response.get("cached", False), "session_id": session.session_id}}
+
+        except UpstreamOverloaded:
+            # Fila do especialista cheia: 503 com Retry-After (register_overload_handler)
+            raise
         except Exception as e:
             logger.error(f"Erro ao contatar o agente {chosen_agent_card.name}: {e}")
             error_response = f"Desculpe, houve um erro ao tentar contatar o {chosen_agent_card.name}."
-            return {"output": {"output": error_response}}
+            if (
+                isinstance(e, httpx.HTTPStatusError)
+                and e.response.status_code == 503
+                and e.response.headers.get("content-type", "").startswith("application/json")
+            ):
+                # Especialista sem capacidade no upstream: repassa o aviso explícito de sobrecarga
+                error_response = e.response.json().get("error", error_response)
+            return {"output": {"output": error_response, "router": decision.router, "session_id": session.session_id}}
     else:
         # Nenhum especialista foi escolhido, o coordenador responde diretamente
         logger.info("Nenhum especialista adequado. Respondendo diretamente.")
-        response_text = (await agent.run(f"O usuário disse: '{message}'. Responda que você é um coordenador de agentes de CEP, mas não encontrou um especialista para esta tarefa específica no momento. Peça para o usuário ser mais específico.")).output
+        result = await agent.run(prompt_sem_especialista(message))
+        response_text = result.output
+        await memory.add_turn(session, "assistant", response_text)
         
         # Combina a resposta com o nome do agente usado
-        final_response = f"{response_text}\n\n---\n*Agente utilizado: Agent Central (GPT)*"
-        return {"output": {"output": final_response}}
-
-@app.on_event("startup")
-async def startup_event():
-    """Na inicialização, descobre os agentes disponíveis lendo seus cartões."""
-    global http_client, AVAILABLE_AGENTS
-    http_client = httpx.AsyncClient()
-    
-    print("\n🚀 Iniciando Coordenador Dinâmico...")
-    print("🔍 Descobrindo agentes especialistas na rede...")
+        final_response = f"{response_text}\n\n---\n*Agente utilizado: Agent Central (GPT) (roteador: {decision.router})*"
+        return {"output": {"output": final_response, "router": decision.router, "cached": result.cached, "session_id": session.session_id}}
 
-    for url in SPECIALIST_AGENT_URLS:
-        try:
-            response = await http_client.get(f"{url}/card", timeout=5)
-            if response.status_code == 200:
-                card = AgentCard(**response.json())
-                AVAILABLE_AGENTS.append(card)
-                print(f"✅ Agente '{card.name}' descoberto em {url}")
-            else:
-                print(f"⚠️ Resposta inesperada de {url}/card: {response.status_code}")
-        except Exception as e:
-            print(f"❌ Falha ao descobrir agente em {url}: {e}")
-    
-    print(f"✨ Descoberta concluída. {len(AVAILABLE_AGENTS)} agentes disponíveis.")
+# ✅ Jobs em lote (planilhas de CEPs)
+async def processar_linha_job(job: dict, linha: dict) -> dict:
+    """Uma linha do job: consulta estruturada no MCP e, com o resultado no contexto, o especialista do tipo do job."""
+    agent_id = JOB_AGENTS.get(job["kind"], job["kind"])
+    card = next((c for c in available_agents() if c.agent_id == agent_id), None)
+    if card is None:
+        # Especialista ainda não descoberto (ou fora do ar): a linha espera em vez de falhar
+        raise JobRowRetry(f"Nenhum especialista '{agent_id}' disponível no momento.")
+    cep = linha["cep"]
+    prefetch = {digitos_cep(cep): asyncio.ensure_future(prefetch_cep(cep))}
+    step = PlanStep(agent_id=agent_id, cep=cep, message=SUBTASK_TEMPLATES.get(agent_id, "CEP {cep}").format(cep=cep))
+    resultado = await executar_ramo(step, card, {"cep": cep}, None, prefetch, classe="jobs")
+    consulta = await prefetch[digitos_cep(cep)] or {}
+    metrics.inc("job_rows_total", kind=job["kind"], success=resultado["success"])
+    return {
+        "success": resultado["success"],
+        "agent": card.name,
+        "response": resultado["response"],
+        "dados": consulta.get("dados"),
+        "degraded": consulta.get("degraded", False),
+        "error_code": consulta.get("error_code"),
+    }
+
+
+def resultados_em_csv(resultados: List[dict]) -> str:
+    campos = ["linha", "entrada", "cep", "status", "logradouro", "bairro", "localidade", "uf", "ddd", "degradado", "erro", "resposta"]
+    saida = io.StringIO()
+    escritor = csv.writer(saida)
+    escritor.writerow(campos)
+    for r in resultados:
+        dados = r.get("dados") or {}
+        escritor.writerow([
+            r["idx"] + 1, r["input"], r.get("cep") or "", r["status"],
+            dados.get("logradouro", ""), dados.get("bairro", ""), dados.get("localidade", ""), dados.get("uf", ""), dados.get("ddd", ""),
+            "sim" if r.get("degraded") else "", r.get("error") or r.get("error_code") or "", r.get("response", ""),
+        ])
+    return saida.getvalue()
+
+
+def job_manager() -> JobManager:
+    jobs: JobManager | None = getattr(app.state, "jobs", None)
+    assert jobs is not None, "Jobs não inicializados"
+    return jobs
+
+
+@app.post("/jobs")
+async def criar_job(request: Request):
+    """
+    Cria um job em lote. Aceita JSON ``{"ceps": [...], "kind": "consult"|"analysis"}``
+    ou uma planilha CSV no corpo (com ``?kind=``). Responde na hora com o ``job_id``.
+    """
+    if request.headers.get("content-type", "").startswith("application/json"):
+        data = await request.json()
+        kind = data.get("kind", "consult")
+        linhas = linhas_de_lista(data.get("ceps", []))
+    else:
+        kind = request.query_params.get("kind", "consult")
+        linhas = linhas_de_csv((await request.body()).decode("utf-8-sig", errors="ignore"))
+    if kind not in JOB_AGENTS:
+        return JSONResponse(status_code=400, content={"error": f"Tipo de job inválido: '{kind}'. Use {list(JOB_AGENTS)}."})
+    if not linhas:
+        return JSONResponse(status_code=400, content={"error": "Nenhum CEP informado."})
+    if len(linhas) > JOBS_MAX_ROWS:
+        return JSONResponse(status_code=413, content={"error": f"Limite de {JOBS_MAX_ROWS} linhas por job."})
+    job = await job_manager().submit(kind, linhas)
+    logger.info(f"Job {job['job_id']} criado: {job['total']} linhas ({kind})")
+    return JSONResponse(status_code=202, content=job)
+
+
+@app.get("/jobs")
+async def listar_jobs(limit: int = 20):
+    return await asyncio.to_thread(job_manager().store.list, limit)
+
+
+@app.get("/jobs/{job_id}")
+async def status_job(job_id: str):
+    job = await asyncio.to_thread(job_manager().store.get, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job não encontrado."})
+    return job
+
+
+@app.get("/jobs/{job_id}/events")
+async def eventos_job(job_id: str):
+    """Progresso do job em SSE: um evento a cada linha concluída, até o job terminar."""
+    jobs = job_manager()
+    if await asyncio.to_thread(jobs.store.get, job_id) is None:
+        return JSONResponse(status_code=404, content={"error": "Job não encontrado."})
+
+    async def eventos():
+        ultimo = None
+        while True:
+            job = await asyncio.to_thread(jobs.store.get, job_id)
+            estado = (job["status"], job["pending"])
+            if estado != ultimo:
+                ultimo = estado
+                yield sse_event({"type": "progress", **job})
+            if job["status"] in JOB_FINAL_STATUS:
+                yield sse_event({"type": "done", **job})
+                return
+            await jobs.wait_update(timeout=2.0)
+
+    return sse_response(eventos())
+
+
+@app.get("/jobs/{job_id}/results")
+async def resultados_job(job_id: str, format: str = "json", offset: int = 0, limit: int = -1):
+    """Resultados linha a linha (JSON) ou a planilha pronta para download (``format=csv``)."""
+    store = job_manager().store
+    if await asyncio.to_thread(store.get, job_id) is None:
+        return JSONResponse(status_code=404, content={"error": "Job não encontrado."})
+    resultados = await asyncio.to_thread(store.results, job_id, offset, limit)
+    if format == "csv":
+        return Response(
+            content=resultados_em_csv(resultados),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="job_{job_id}.csv"'},
+        )
+    return resultados
+
+
+@app.delete("/jobs/{job_id}")
+async def cancelar_job(job_id: str):
+    if not await job_manager().cancel(job_id):
+        return JSONResponse(status_code=409, content={"error": "Job não encontrado ou já finalizado."})
+    return await asyncio.to_thread(job_manager().store.get, job_id)
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    if http_client:
-        await http_client.aclose()
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8004, log_level="info")
+    import uvicorn
+
+    # WORKERS > 1 sobe vários processos; com AGENT_REGISTRY_DB todos leem o mesmo registro de agentes
+    workers = int(os.getenv("WORKERS", "1"))
+    uvicorn.run(
+        "agent_central _a2a:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=8004,
+        log_level="info",
+        workers=workers,
+        app_dir=str(Path(__file__).resolve().parent),
+    )
@@ -1,11 +1,23 @@
+import time
+INICIO_IMPORT = time.perf_counter()  # startup_import_seconds: do início do import até a app pronta para o lifespan
+
 import os
 import re
-import httpx
+from contextlib import asynccontextmanager
+from pathlib import Path
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
-from pydantic_ai import Agent
-import uvicorn
-from schemas.schemas import AgentCard
+from schemas.schemas import AgentCard, ToolResult
+from shared.deadline import DeadlineExceeded, install_deadline
+from shared.llm_cache import CachedAgent
+from shared.memory import contexto_para_prompt, resultado_cep_do_contexto
+from shared.registry import AgentHeartbeat, get_agent_registry
+from shared.cep_templates import carregar_templates, pedido_simples, renderizar_endereco
+from shared.streaming import responder_agente, responder_texto, wants_stream
+from shared.telemetry import instrument_app, metrics
+from shared.transport import create_http_client
+from shared.upstream import register_overload_handler, upstream_stats
+from shared.warmup import WARMUP_LLM, ServiceReadiness, aquecer_conexoes
 
 load_dotenv()
 os.getenv("OPENAI_API_KEY")
@@ -18,28 +30,89 @@ AGENT_CARD_CONSULT = AgentCard(
     invocation_endpoint="http://localhost:8002/sse",
 )
 
-http_client: httpx.AsyncClient | None = None
+# Modo de renderização:
+#   "auto"     -> modelo determinístico para consultas simples, LLM quando o pedido vai além
+#   "template" -> sempre o modelo determinístico
+#   "llm"      -> sempre formata com o LLM
+CONSULT_RENDER_MODE = os.getenv("CONSULT_RENDER_MODE", "auto")
+CONSULT_LOCALE = os.getenv("CONSULT_LOCALE", "pt-BR")
+CEP_TEMPLATES = carregar_templates()
+
+# Endereço anunciado no registro de agentes (cada réplica publica o seu)
+AGENT_PUBLIC_URL = os.getenv("AGENT_PUBLIC_URL", "http://localhost:8002")
+
 # O prompt do agente pode ser simplificado, pois a lógica de quando usá-lo está no seu cartão.
-agent = Agent(
+agent = CachedAgent(
     "openai:gpt-4o-mini",
+    name="consult",
     instructions="""📜 Você é um assistente especialista em CONSULTAS BÁSICAS de CEP. 
               Sua tarefa é receber dados de CEP já consultados e formatá-los de maneira clara e útil para o usuário.""",
 )
-app = FastAPI(title=AGENT_CARD_CONSULT.name)
 
 
-async def chamar_mcp_consultar_cep(cep: str) -> str:
-    """Chama ferramenta de consulta no MCP Server."""
+# ✅ Ciclo de vida: o estado do serviço fica em app.state, um por worker
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with readiness.phase("lifespan"):
+        app.state.http_client = create_http_client(timeout=20.0)
+    app.state.heartbeat = AgentHeartbeat(
+        get_agent_registry(),
+        AGENT_PUBLIC_URL,
+        AGENT_CARD_CONSULT,
+        interval=float(os.getenv("REGISTRY_HEARTBEAT_INTERVAL", "5")),
+    )
+    print(f"\n🚀 {AGENT_CARD_CONSULT.name} FUNCIONANDO INICIADO! (porta 8002)")
+    # Warm-up (WARMUP=1): conexões com o MCP e a primeira chamada ao modelo; só então entra no registro
+    await readiness.start_warmup(
+        lambda: aquecer_conexoes(app.state.http_client, ["http://localhost:8000/"]),
+        lambda: agent.warm_up(llm=WARMUP_LLM),
+        on_ready=app.state.heartbeat.start,
+    )
+    try:
+        yield
+    finally:
+        await readiness.stop()
+        await app.state.heartbeat.stop()
+        await app.state.http_client.aclose()
+
+
+app = FastAPI(title=AGENT_CARD_CONSULT.name, lifespan=lifespan)
+instrument_app(app, "agent_consult")
+register_overload_handler(app)
+install_deadline(app)
+readiness = ServiceReadiness("agent_consult", started_at=INICIO_IMPORT)
+readiness.install(app)
+metrics.register_collector("agent_consult", upstream_stats)
+
+
+async def chamar_mcp_consultar_cep(cep: str, context: dict | None = None) -> ToolResult:
+    """Chama ferramenta de consulta no MCP Server, a menos que o coordenador já tenha trazido o resultado."""
+    pronto = resultado_cep_do_contexto(context, cep)
+    if pronto is not None:
+        return ToolResult(**pronto)
+    http_client = getattr(app.state, "http_client", None)
     assert http_client is not None, "HTTP Client não inicializado"
     try:
         response = await http_client.post(
             "http://localhost:8000/mcp/consultar_cep", json={"cep": cep}, timeout=15
         )
         response.raise_for_status()
-        data: dict = response.json()
-        return data.get("output", "Erro na resposta do MCP")
+        return ToolResult(**response.json())
     except Exception as e:
-        return f"❌ Erro ao chamar MCP: {str(e)}"
+        return ToolResult(
+            success=False,
+            tool="mcp:consultar_cep",
+            input=cep,
+            output=f"❌ Erro ao chamar MCP: {str(e)}",
+            error_code="deadline_exceeded" if isinstance(e, DeadlineExceeded) else "upstream_error",
+        )
+
+
+def usar_template(message: str) -> bool:
+    """True quando a resposta pode ser renderizada pelo template, sem LLM."""
+    if CONSULT_RENDER_MODE == "llm":
+        return False
+    return CONSULT_RENDER_MODE == "template" or pedido_simples(message)
 
 
 @app.get("/card", response_model=AgentCard)
@@ -60,40 +133,51 @@ async def health():
 
 @app.post("/sse")
 async def a2a_endpoint(request: Request):
-    """Endpoint principal de invocação do agente."""
+    """Endpoint principal de invocação do agente. Responde em SSE quando o cliente pede streaming."""
     data = await request.json()
     message = data.get("message", "")
+    stream = wants_stream(request, data)
+    # Contexto enviado pelo coordenador: permite continuações sem CEP ("e o bairro?")
+    context = data.get("context") or {}
     cep_match = re.search(r"\b\d{5}-?\d{3}\b", message)
-    if cep_match:
-        cep = cep_match.group()
-        resultado_mcp = await chamar_mcp_consultar_cep(cep)
-        if "❌" in resultado_mcp:
-            return {"success": False, "response": resultado_mcp}
+    cep = cep_match.group() if cep_match else context.get("cep")
+    # Só mensagens de continuação levam o histórico ao LLM, para não diluir o cache de respostas
+    historico = "" if cep_match else contexto_para_prompt(context)
+    if cep:
+        resultado_mcp = await chamar_mcp_consultar_cep(cep, context)
+        if not resultado_mcp.success:
+            return responder_texto(resultado_mcp.output, success=False, stream=stream)
+        if resultado_mcp.degraded:
+            # ViaCEP fora do ar: o MCP já devolve o texto com o aviso de dados parciais
+            return responder_texto(resultado_mcp.output, success=True, stream=stream)
+        if usar_template(message):
+            locale = data.get("locale", CONSULT_LOCALE)
+            texto = renderizar_endereco(resultado_mcp.dados, locale, CEP_TEMPLATES)
+            return responder_texto(texto, success=True, stream=stream)
         prompt_formatacao = (
-            f"Formate esta resposta de CEP de forma clara e útil: {resultado_mcp}"
+            f"Formate esta resposta de CEP de forma clara e útil: {resultado_mcp.output}"
+            f"\n\nPedido do usuário: {message}{historico}"
         )
-        result_agent = await agent.run(prompt_formatacao)
-        return {"success": True, "response": result_agent.output}
+        return await responder_agente(agent, prompt_formatacao, stream)
     else:
         # Se chamado sem CEP, ele se apresenta.
-        result = await agent.run(
-            f"O usuário disse: '{message}'. Responda que você é um especialista em consultas de CEP e peça um CEP."
+        return await responder_agente(
+            agent,
+            f"O usuário disse: '{message}'. Responda que você é um especialista em consultas de CEP e peça um CEP.{historico}",
+            stream,
         )
-        return {"success": True, "response": result.output}
-
-
-@app.on_event("startup")
-async def startup_event():
-    global http_client
-    http_client = httpx.AsyncClient(timeout=20.0)
-    print(f"\n🚀 {AGENT_CARD_CONSULT.name} FUNCIONANDO INICIADO! (porta 8002)")
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    if http_client:
-        await http_client.aclose()
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8002, log_level="info")
+    import uvicorn
+
+    # WORKERS > 1 sobe vários processos; cada um registra o mesmo endereço no registro de agentes
+    workers = int(os.getenv("WORKERS", "1"))
+    uvicorn.run(
+        "agent_consult:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=8002,
+        log_level="info",
+        workers=workers,
+        app_dir=str(Path(__file__).resolve().parent),
+    )
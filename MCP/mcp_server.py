@@ -1,11 +1,28 @@
+import time
+INICIO_IMPORT = time.perf_counter()  # startup_import_seconds: do início do import até a app pronta para o lifespan
+
 import os
+import re
+import json
+import asyncio
 import httpx
-import uvicorn
 import datetime
+from contextlib import asynccontextmanager
+from pathlib import Path
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-from pydantic_ai import Agent
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from schemas.schemas import EnderecoCEP, ToolResult
+from shared.cep_cache import CepCache
+from shared.cep_index import CepRangeIndex
+from shared.deadline import install_deadline
+from shared.llm_cache import CachedAgent, get_llm_cache
+from shared.single_flight import SingleFlight
+from shared.telemetry import instrument_app, metrics, numeric_stats
+from shared.transport import create_http_client
+from shared.upstream import UpstreamOverloaded, get_upstream, register_overload_handler, upstream_stats
+from shared.warmup import WARMUP_LLM, ServiceReadiness, aquecer_conexoes
 
 # ✅ Configuração
 load_dotenv()
@@ -14,61 +31,230 @@ if not openai_key:
     raise RuntimeError("❌ ERRO: OPENAI_API_KEY não encontrada!")
 print(f"✅ OpenAI API Key: {openai_key[:10]}...")
 
-# ✅ Cliente HTTP e Agente IA
-http_client: httpx.AsyncClient | None = None
-server_agent = Agent(
+# ✅ Agente IA (o cliente HTTP fica em app.state, criado no lifespan)
+server_agent = CachedAgent(
     "openai:gpt-4o-mini",
+    name="mcp",
     instructions="""🏠 Assistente Especialista em Endereços Brasileiros. Analise informações de CEP, identifique características da região e forneça insights úteis. Use emojis e seja conciso.""",
 )
 
+# ✅ Cache de CEP (memória + SQLite)
+cep_cache = CepCache(
+    max_entries=int(os.getenv("CEP_CACHE_MAX_ENTRIES", "10000")),
+    ttl=float(os.getenv("CEP_CACHE_TTL", str(24 * 3600))),
+    negative_ttl=float(os.getenv("CEP_CACHE_NEGATIVE_TTL", "3600")),
+    db_path=os.getenv("CEP_CACHE_DB", "cep_cache.sqlite3") or None,
+)
+
+# ✅ Índice local de faixas de CEP (validação sem rede e modo degradado)
+cep_index = CepRangeIndex()
+
+# ✅ Chamadas idênticas em andamento compartilham uma única tarefa
+single_flight = SingleFlight()
+
+# ✅ Endereço do ViaCEP (pode apontar para um servidor local em benchmarks)
+VIACEP_URL = os.getenv("VIACEP_URL", "https://viacep.com.br/ws").rstrip("/")
+
+# ✅ Limites de acesso ao ViaCEP (concorrência, taxa, retry e hedge; UPSTREAM_VIACEP_*)
+viacep_upstream = get_upstream("viacep", max_concurrency=20, rate=50, burst=50, max_wait=2.0, retries=2, hedge=True)
+
+# ✅ Limites da consulta em lote
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "10"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "50"))
+
+
+# ✅ Ciclo de vida: o estado do serviço fica em app.state, um por worker
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with readiness.phase("lifespan"):
+        app.state.http_client = create_http_client(timeout=10.0)
+    print(
+        "\n"
+        + "=" * 60
+        + "\n🚀 MCP SERVER FUNCIONANDO INICIADO! (porta 8000)\n"
+        + "=" * 60
+    )
+    # Warm-up (WARMUP=1): conexões com o ViaCEP e a primeira chamada ao modelo antes do /ready
+    await readiness.start_warmup(
+        lambda: aquecer_conexoes(app.state.http_client, [f"{VIACEP_URL}/01001000/json/"]),
+        lambda: server_agent.warm_up(llm=WARMUP_LLM),
+    )
+    try:
+        yield
+    finally:
+        await readiness.stop()
+        await app.state.http_client.aclose()
+        print("\n⏹️ Cliente HTTP do MCP Server fechado.")
+        cep_cache.close()
+
+
 app = FastAPI(
     title="MCP Server - CEP Tools",
     description="Servidor com ferramentas de CEP funcionando via FastAPI",
     version="1.0.0",
+    lifespan=lifespan,
 )
+instrument_app(app, "mcp_server")
+register_overload_handler(app)
+install_deadline(app)
+readiness = ServiceReadiness("mcp_server", started_at=INICIO_IMPORT)
+readiness.install(app)
+metrics.register_collector("mcp_server", lambda: {
+    **numeric_stats("cep_cache", cep_cache.stats()),
+    **numeric_stats("llm_cache", get_llm_cache().stats()),
+    "single_flight_coalesced": single_flight.coalesced,
+    "single_flight_in_flight": single_flight.in_flight(),
+    **upstream_stats(),
+})
+
+
+def normalizar_cep(cep: str) -> str:
+    """Mantém apenas os dígitos do CEP."""
+    return "".join(filter(str.isdigit, cep))
+
+
+# ✅ BUSCA NO VIACEP (com cache)
+async def buscar_dados_viacep(cep_limpo: str) -> dict | None:
+    """Retorna os dados do ViaCEP, ou None se o CEP não existir. Usa o cache antes da rede."""
+    encontrado, dados = cep_cache.get(cep_limpo)
+    if encontrado:
+        print(f"⚡ [MCP] CEP {cep_limpo} servido pelo cache")
+        return dados
+    return await single_flight.run(("viacep", cep_limpo), lambda: _buscar_viacep(cep_limpo))
+
+
+async def _buscar_viacep(cep_limpo: str) -> dict | None:
+    http_client: httpx.AsyncClient | None = getattr(app.state, "http_client", None)
+    if http_client is None:
+        app.state.http_client = http_client = create_http_client(timeout=10.0)
+    url = f"{VIACEP_URL}/{cep_limpo}/json/"
+
+    async def requisitar() -> dict:
+        response = await http_client.get(url)
+        response.raise_for_status()
+        return response.json()
+
+    dados = await viacep_upstream.call(requisitar)
+    if dados.get("erro"):
+        dados = None
+    cep_cache.set(cep_limpo, dados)
+    return dados
+
+
+def formatar_endereco(endereco: EnderecoCEP) -> str:
+    """Texto padrão exibido para um CEP encontrado."""
+    return f"""📍 **CEP Encontrado: {endereco.cep}**
+🛣️ **Logradouro:** {endereco.logradouro or '⚠️ Não informado'}
+🏘️ **Bairro:** {endereco.bairro or '⚠️ Não informado'}
+🏙️ **Cidade:** {endereco.localidade or '⚠️ Não informado'}
+🗺️ **Estado:** {endereco.uf or '⚠️ Não informado'}
+📮 **DDD:** {endereco.ddd or '⚠️ Não informado'}
+✅ **Consulta realizada via ViaCEP**"""
 
 
 # ✅ FUNÇÃO 1: CONSULTAR CEP
-async def consultar_cep_funcao(cep: str) -> str:
-    """🔍 Consulta CEP via ViaCEP"""
+async def consultar_cep_estruturado(cep: str) -> ToolResult:
+    """🔍 Consulta CEP via ViaCEP e retorna o resultado estruturado"""
     print(f"🔍 [MCP] Consultando CEP: {cep}")
-    cep_limpo = "".join(filter(str.isdigit, cep))
+    cep_limpo = normalizar_cep(cep)
     if len(cep_limpo) != 8:
-        return f"❌ CEP inválido: '{cep}'. Use formato: 01310-100"
+        return ToolResult(
+            success=False,
+            tool="mcp:consultar_cep",
+            input=cep,
+            output=f"❌ CEP inválido: '{cep}'. Use formato: 01310-100",
+            error_code="invalid_cep",
+        )
+    if cep_index.lookup(cep_limpo) is None:
+        return ToolResult(
+            success=False,
+            tool="mcp:consultar_cep",
+            input=cep,
+            output=f"❌ CEP {cep_limpo} não existe: fora de todas as faixas de CEP",
+            error_code="out_of_range",
+        )
+    resultado = await single_flight.run(("consultar_cep", cep_limpo), lambda: _consultar_cep(cep_limpo))
+    return resultado.model_copy(update={"input": cep})
+
 
+async def consultar_cep_funcao(cep: str) -> str:
+    """🔍 Consulta CEP via ViaCEP"""
+    return (await consultar_cep_estruturado(cep)).output
+
+
+async def _consultar_cep(cep_limpo: str) -> ToolResult:
+    resultado = ToolResult(success=False, tool="mcp:consultar_cep", input=cep_limpo, output="")
     try:
-        global http_client
-        if http_client is None:
-            http_client = httpx.AsyncClient(timeout=10.0)
-        url = f"https://viacep.com.br/ws/{cep_limpo}/json/"
-        response = await http_client.get(url)
-        response.raise_for_status()
-        dados = response.json()
+        dados = await buscar_dados_viacep(cep_limpo)
 
-        if dados.get("erro"):
-            return f"❌ CEP {cep_limpo} não encontrado"
+        if dados is None:
+            resultado.output = f"❌ CEP {cep_limpo} não encontrado"
+            resultado.error_code = "not_found"
+            return resultado
 
-        resultado = f"""📍 **CEP Encontrado: {dados.get('cep', cep_limpo)}**
-🛣️ **Logradouro:** {dados.get('logradouro') or '⚠️ Não informado'}
-🏘️ **Bairro:** {dados.get('bairro') or '⚠️ Não informado'}
-🏙️ **Cidade:** {dados.get('localidade') or '⚠️ Não informado'}
-🗺️ **Estado:** {dados.get('uf') or '⚠️ Não informado'}
-📮 **DDD:** {dados.get('ddd') or '⚠️ Não informado'}
-✅ **Consulta realizada via ViaCEP**"""
-        print(f"✅ [MCP] CEP encontrado: {dados.get('localidade')}/{dados.get('uf')}")
+        endereco = EnderecoCEP(**{**dados, "cep": dados.get("cep") or cep_limpo})
+        print(f"✅ [MCP] CEP encontrado: {endereco.localidade}/{endereco.uf}")
+        resultado.success = True
+        resultado.output = formatar_endereco(endereco)
+        resultado.dados = endereco
         return resultado
 
     except Exception as e:
-        return f"❌ Erro na consulta: {str(e)}"
+        faixa = cep_index.lookup(cep_limpo)
+        if faixa is None:
+            resultado.output = f"❌ Erro na consulta: {str(e)}"
+            resultado.error_code = "upstream_error"
+            return resultado
+        # Modo degradado: responde com a UF/cidade do índice local
+        print(f"⚠️ [MCP] ViaCEP indisponível, usando índice local para {cep_limpo}: {e}")
+        endereco = EnderecoCEP(cep=f"{cep_limpo[:5]}-{cep_limpo[5:]}", uf=faixa.uf, localidade=faixa.localidade or "")
+        resultado.success = True
+        resultado.degraded = True
+        resultado.dados = endereco
+        resultado.output = (
+            formatar_endereco(endereco).replace("✅ **Consulta realizada via ViaCEP**", "")
+            + "⚠️ **ViaCEP indisponível: dados parciais do índice local de faixas de CEP**"
+        )
+        return resultado
 
 
 # ✅ FUNÇÃO 2: ANALISAR ENDEREÇO
+async def analisar_endereco_estruturado(cep: str, consulta: ToolResult | None = None) -> ToolResult:
+    """
+    🧠 Análise completa do endereço, com os dados estruturados. ``consulta`` é o
+    resultado de ``consultar_cep`` já obtido por quem chamou (evita buscar de novo).
+    """
+    print(f"🧠 [MCP] Analisando CEP: {cep}")
+    cep_limpo = normalizar_cep(cep)
+    if consulta is not None and normalizar_cep(consulta.input) != cep_limpo:
+        consulta = None
+    if len(cep_limpo) != 8:
+        resultado = await _analisar_endereco(cep)
+    else:
+        resultado = await single_flight.run(("analisar_endereco", cep_limpo), lambda: _analisar_endereco(cep_limpo, consulta))
+    return resultado.model_copy(update={"input": cep})
+
+
 async def analisar_endereco_funcao(cep: str) -> str:
     """🧠 Análise completa do endereço"""
-    print(f"🧠 [MCP] Analisando CEP: {cep}")
-    dados_cep = await consultar_cep_funcao(cep)
-    if "❌" in dados_cep:
-        return f"🧠 **Análise de Endereço**\n\n⚠️ Não foi possível analisar pois a consulta básica falhou:\n\n{dados_cep}"
+    return (await analisar_endereco_estruturado(cep)).output
+
+
+async def _analisar_endereco(cep: str, consulta: ToolResult | None = None) -> ToolResult:
+    if consulta is None:
+        consulta = await consultar_cep_estruturado(cep)
+    resultado = ToolResult(
+        success=False,
+        tool="mcp:analisar_endereco",
+        input=cep,
+        output="",
+        dados=consulta.dados,
+        error_code=consulta.error_code,
+    )
+    dados_cep = consulta.output
+    if not consulta.success:
+        resultado.output = f"🧠 **Análise de Endereço**\n\n⚠️ Não foi possível analisar pois a consulta básica falhou:\n\n{dados_cep}"
+        return resultado
 
     try:
         prompt = f"""Analise as informações de endereço brasileiro: {dados_cep}. Forneça uma análise que inclua: Tipo de região, Características da área, Contexto geográfico e Informações úteis. Use emojis e seja conciso."""
@@ -79,58 +265,156 @@ async def analisar_endereco_funcao(cep: str) -> str:
         🤖 **ANÁLISE INTELIGENTE** 
         {resultado_ia.output}"""
         print("✅ [MCP] Análise completa finalizada")
-        return resposta_final
+        resultado.success = True
+        resultado.output = resposta_final
+        resultado.analise = resultado_ia.output
+        resultado.llm_cached = resultado_ia.cached
+        return resultado
 
     except Exception as e:
-        return f"🧠 **Análise de Endereço**\n\n✅ **Dados básicos:**\n{dados_cep}\n\n❌ **Erro na análise IA:** {str(e)}"
+        resultado.output = f"🧠 **Análise de Endereço**\n\n✅ **Dados básicos:**\n{dados_cep}\n\n❌ **Erro na análise IA:** {str(e)}"
+        resultado.error_code = "overloaded" if isinstance(e, UpstreamOverloaded) else "llm_error"
+        return resultado
 
 
-@app.post("/mcp/consultar_cep")
+@app.post("/mcp/consultar_cep", response_model=ToolResult)
 async def mcp_consultar_cep(request: Request):
     data = await request.json()
     cep = data.get("cep", "")
-    resultado = await consultar_cep_funcao(cep)
-    return {
-        "success": "❌" not in resultado,
-        "tool": "mcp:consultar_cep",
-        "input": cep,
-        "output": resultado,
-    }
+    return await consultar_cep_estruturado(cep)
 
 
-@app.post("/mcp/analisar_endereco")
+@app.post("/mcp/analisar_endereco", response_model=ToolResult)
 async def mcp_analisar_endereco(request: Request):
     data = await request.json()
     cep = data.get("cep", "")
-    resultado = await analisar_endereco_funcao(cep)
-    return {
-        "success": "❌" not in resultado,
-        "tool": "mcp:analisar_endereco",
-        "input": cep,
-        "output": resultado,
-    }
+    return await analisar_endereco_estruturado(cep, consulta_do_cliente(cep, data.get("consulta")))
 
 
-# ✅ EVENTOS DE STARTUP E SHUTDOWN
-@app.on_event("startup")
-async def startup_event():
-    global http_client
-    http_client = httpx.AsyncClient(timeout=10.0)
-    print(
-        "\n"
-        + "=" * 60
-        + "\n🚀 MCP SERVER FUNCIONANDO INICIADO! (porta 8000)\n"
-        + "=" * 60
+def consulta_do_cliente(cep: str, bruto) -> ToolResult | None:
+    """
+    Reaproveita a consulta enviada por quem chamou só quando ela é válida, bem-sucedida
+    e do mesmo CEP; o texto é refeito a partir dos dados estruturados, nunca copiado do
+    cliente. Qualquer outro caso vira None e a análise faz a própria consulta.
+    """
+    if not bruto:
+        return None
+    try:
+        consulta = ToolResult.model_validate(bruto)
+    except ValidationError:
+        return None
+    if not consulta.success or consulta.degraded or consulta.dados is None:
+        return None
+    if normalizar_cep(consulta.dados.cep) != normalizar_cep(cep):
+        return None
+    return consulta.model_copy(update={"output": formatar_endereco(consulta.dados), "error_code": None})
+
+
+# ✅ FUNÇÃO 3: CONSULTA EM LOTE
+async def consultar_lote_funcao(ceps: list[str], concorrencia: int):
+    """
+    📦 Consulta vários CEPs no ViaCEP e gera os resultados (NDJSON) na ordem em que terminam.
+    Cada entrada gera uma linha com ``index`` (posição na entrada) e ``input``; CEPs
+    repetidos são consultados uma única vez e o resultado sai para cada repetição.
+    """
+    print(f"📦 [MCP] Consulta em lote: {len(ceps)} CEPs (concorrência {concorrencia})")
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def consultar_item(cep_limpo: str) -> dict:
+        item = {"cep": cep_limpo, "success": False, "dados": None, "error": None}
+        async with semaforo:
+            try:
+                dados = await buscar_dados_viacep(cep_limpo)
+            except Exception as e:
+                item["error"] = f"Erro na consulta: {str(e)}"
+                return item
+        if dados is None:
+            item["error"] = "CEP não encontrado"
+        else:
+            item["success"] = True
+            item["dados"] = dados
+        return item
+
+    def linha(indice: int, entrada: str, item: dict) -> str:
+        return json.dumps({"index": indice, "input": entrada, **item}, ensure_ascii=False) + "\n"
+
+    # Entradas de cada CEP único: (posição, texto original)
+    entradas_por_cep: dict[str, list[tuple[int, str]]] = {}
+    for indice, entrada in enumerate(ceps):
+        cep_limpo = normalizar_cep(entrada)
+        if len(cep_limpo) != 8 or cep_index.lookup(cep_limpo) is None:
+            erro = "CEP inválido" if len(cep_limpo) != 8 else "CEP fora de todas as faixas de CEP"
+            yield linha(indice, entrada, {"cep": cep_limpo, "success": False, "dados": None, "error": erro})
+            continue
+        entradas_por_cep.setdefault(cep_limpo, []).append((indice, entrada))
+
+    tarefas = {asyncio.ensure_future(consultar_item(cep_limpo)): cep_limpo for cep_limpo in entradas_por_cep}
+    try:
+        pendentes = set(tarefas)
+        while pendentes:
+            prontas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+            for tarefa in prontas:
+                for indice, entrada in entradas_por_cep[tarefas[tarefa]]:
+                    yield linha(indice, entrada, tarefa.result())
+        print(f"✅ [MCP] Lote finalizado: {len(tarefas)} CEPs únicos")
+    finally:
+        # Cliente desconectou: não continua consultando CEPs que ninguém vai ler
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+
+@app.post("/mcp/consultar_ceps_lote")
+async def mcp_consultar_ceps_lote(request: Request):
+    """
+    Aceita JSON ``{"ceps": [...], "concurrency": N}`` ou um arquivo de texto/CSV
+    enviado no corpo da requisição (um ou mais CEPs por linha). Cada CEP da entrada
+    gera uma linha de resultado, identificada por ``index`` e ``input``.
+    """
+    if request.headers.get("content-type", "").startswith("application/json"):
+        data = await request.json()
+        ceps = [str(cep) for cep in data.get("ceps", [])]
+        concorrencia = data.get("concurrency")
+    else:
+        texto = (await request.body()).decode("utf-8", errors="ignore")
+        # Ignora cabeçalhos e outras colunas sem dígitos
+        ceps = [t for t in re.split(r"[\s,;]+", texto) if any(c.isdigit() for c in t)]
+        concorrencia = request.query_params.get("concurrency")
+
+    if not ceps:
+        return JSONResponse(status_code=400, content={"error": "Nenhum CEP informado."})
+    try:
+        concorrencia = BATCH_CONCURRENCY if concorrencia is None else int(concorrencia)
+    except (TypeError, ValueError):
+        return JSONResponse(status_code=400, content={"error": "Campo 'concurrency' deve ser um número inteiro."})
+
+    concorrencia = max(1, min(concorrencia, BATCH_MAX_CONCURRENCY))
+    return StreamingResponse(
+        consultar_lote_funcao(ceps, concorrencia), media_type="application/x-ndjson"
     )
 
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    if http_client:
-        await http_client.aclose()
-        print("\n⏹️ Cliente HTTP do MCP Server fechado.")
+@app.get("/mcp/cache/stats")
+async def mcp_cache_stats():
+    """Contadores de hit, miss e eviction do cache de CEP."""
+    return {
+        **cep_cache.stats(),
+        "coalesced": single_flight.coalesced,
+        "in_flight": single_flight.in_flight(),
+        "llm_cache": get_llm_cache().stats(),
+    }
 
 
 # ✅ MAIN
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
+    import uvicorn
+
+    # WORKERS > 1 sobe vários processos, que dividem o cache de CEP em SQLite
+    workers = int(os.getenv("WORKERS", "1"))
+    uvicorn.run(
+        "mcp_server:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=8000,
+        log_level="info",
+        workers=workers,
+        app_dir=str(Path(__file__).resolve().parent),
+    )
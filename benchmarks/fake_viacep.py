@@ -0,0 +1,44 @@
+# fake_viacep.py - ViaCEP local com latência e taxa de erro configuráveis
+import asyncio
+import os
+import random
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+VIACEP_LATENCY = float(os.getenv("BENCH_VIACEP_LATENCY", "0.08"))
+VIACEP_ERROR_RATE = float(os.getenv("BENCH_VIACEP_ERROR_RATE", "0.0"))
+PORT = int(os.getenv("BENCH_VIACEP_PORT", "8010"))
+
+app = FastAPI(title="Fake ViaCEP")
+_random = random.Random(42)
+
+
+@app.get("/")
+async def health():
+    return {"status": "✅ ONLINE", "service": "Fake ViaCEP"}
+
+
+@app.get("/ws/{cep}/json/")
+async def consultar(cep: str):
+    await asyncio.sleep(VIACEP_LATENCY)
+    if _random.random() < VIACEP_ERROR_RATE:
+        return JSONResponse(status_code=503, content={"error": "indisponível"})
+    # CEPs terminados em 999 simulam "CEP não encontrado"
+    if cep.endswith("999"):
+        return {"erro": True}
+    return {
+        "cep": f"{cep[:5]}-{cep[5:]}",
+        "logradouro": f"Rua Benchmark {int(cep[-3:])}",
+        "complemento": "",
+        "bairro": "Centro",
+        "localidade": "São Paulo",
+        "uf": "SP",
+        "ibge": "3550308",
+        "ddd": "11",
+    }
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=PORT, log_level="warning")
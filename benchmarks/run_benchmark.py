@@ -0,0 +1,277 @@
+# run_benchmark.py - teste de carga offline da sociedade de agentes (LLM e ViaCEP simulados)
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from statistics import quantiles
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent
+REPO = ROOT.parent
+
+# Ordem de inicialização: dependências primeiro, coordenador por último (ele descobre os especialistas)
+SERVICOS = [
+    ("viacep", [sys.executable, str(ROOT / "fake_viacep.py")], "http://127.0.0.1:8010"),
+    ("mcp", [sys.executable, str(ROOT / "run_service.py"), "mcp"], "http://127.0.0.1:8000"),
+    ("analysis", [sys.executable, str(ROOT / "run_service.py"), "analysis"], "http://127.0.0.1:8001"),
+    ("consult", [sys.executable, str(ROOT / "run_service.py"), "consult"], "http://127.0.0.1:8002"),
+    ("central", [sys.executable, str(ROOT / "run_service.py"), "central"], "http://127.0.0.1:8004"),
+]
+CENTRAL_URL = "http://127.0.0.1:8004/sse"
+
+MENSAGENS = {
+    "consult": ["Consulte o CEP {cep}", "Verifique o CEP {cep}", "Qual o endereço do CEP {cep}?"],
+    "analysis": ["Analise o CEP {cep}", "Faça uma análise detalhada do endereço do CEP {cep}"],
+    "chat": ["Olá, o que você faz?", "Quem é você?", "Obrigado!"],
+}
+
+
+def percentis(valores: List[float]) -> Dict[str, Optional[float]]:
+    if not valores:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    if len(valores) == 1:
+        v = round(valores[0] * 1000, 2)
+        return {"p50": v, "p95": v, "p99": v, "mean": v}
+    q = quantiles(valores, n=100, method="inclusive")
+    return {
+        "p50": round(q[49] * 1000, 2),
+        "p95": round(q[94] * 1000, 2),
+        "p99": round(q[98] * 1000, 2),
+        "mean": round(sum(valores) / len(valores) * 1000, 2),
+    }
+
+
+def percentil_histograma(buckets: List[tuple], total: float, p: float) -> Optional[float]:
+    """Percentil aproximado (ms) a partir dos buckets cumulativos de um histograma do Prometheus."""
+    if not total:
+        return None
+    alvo = total * p
+    anterior_limite, anterior_contagem = 0.0, 0.0
+    for limite, contagem in buckets:
+        if contagem >= alvo:
+            if limite == float("inf"):
+                return round(anterior_limite * 1000, 2)
+            fracao = (alvo - anterior_contagem) / ((contagem - anterior_contagem) or 1)
+            return round((anterior_limite + (limite - anterior_limite) * fracao) * 1000, 2)
+        anterior_limite, anterior_contagem = limite, contagem
+    return None
+
+
+def latencias_do_servico(texto_metrics: str) -> Dict[str, dict]:
+    """p50/p95/p99 por rota a partir de http_request_duration_seconds (somando os status)."""
+    buckets: Dict[str, Dict[float, float]] = {}
+    padrao = re.compile(r'^http_request_duration_seconds_bucket\{(.*)\} ([0-9.e+-]+)$')
+    for linha in texto_metrics.splitlines():
+        m = padrao.match(linha)
+        if not m:
+            continue
+        labels = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', m.group(1)))
+        limite = float("inf") if labels["le"] == "+Inf" else float(labels["le"])
+        rota = buckets.setdefault(labels.get("path", ""), {})
+        rota[limite] = rota.get(limite, 0.0) + float(m.group(2))
+    resultado = {}
+    for rota, por_limite in buckets.items():
+        ordenado = sorted(por_limite.items())
+        total = ordenado[-1][1]
+        resultado[rota] = {
+            "count": total,
+            "p50": percentil_histograma(ordenado, total, 0.50),
+            "p95": percentil_histograma(ordenado, total, 0.95),
+            "p99": percentil_histograma(ordenado, total, 0.99),
+        }
+    return resultado
+
+
+def memoria_rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as arquivo:
+            for linha in arquivo:
+                if linha.startswith("VmRSS:"):
+                    return round(int(linha.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+def parse_server_timing(cabecalho: str) -> Dict[str, float]:
+    tempos: Dict[str, float] = {}
+    for item in filter(None, (parte.strip() for parte in cabecalho.split(","))):
+        campos = item.split(";")
+        nome = re.sub(r"-\d+$", "", campos[0])
+        for campo in campos[1:]:
+            if campo.startswith("dur="):
+                tempos[nome] = tempos.get(nome, 0.0) + float(campo[4:]) / 1000
+    return tempos
+
+
+async def esperar_servico(url: str, caminho: str = "/ready", timeout: float = 60.0) -> Optional[dict]:
+    """Espera o serviço ficar pronto e devolve o corpo do /ready (tempos de startup)."""
+    limite = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < limite:
+            try:
+                response = await client.get(url + caminho, timeout=2)
+                if response.status_code == 200:
+                    return response.json()
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Serviço {url} não respondeu em {timeout}s")
+
+
+def gerar_workload(args, rng: random.Random) -> List[tuple]:
+    ceps = [f"{rng.randint(1000, 19999):05d}{rng.randint(0, 998):03d}" for _ in range(args.cep_pool)]
+    ceps += ["01001999"]  # "CEP não encontrado"
+    tipos = ["consult"] * args.mix[0] + ["analysis"] * args.mix[1] + ["chat"] * args.mix[2]
+    workload = []
+    for _ in range(args.requests):
+        tipo = rng.choice(tipos)
+        cep = rng.choice(ceps)
+        workload.append((tipo, rng.choice(MENSAGENS[tipo]).format(cep=f"{cep[:5]}-{cep[5:]}")))
+    return workload
+
+
+async def executar_carga(workload: List[tuple], concurrency: int, stream: bool) -> tuple:
+    semaforo = asyncio.Semaphore(concurrency)
+    e2e: Dict[str, List[float]] = {"all": []}
+    ttft: List[float] = []
+    hops: Dict[str, List[float]] = {}
+    erros = 0
+
+    async with httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_connections=concurrency)) as client:
+
+        async def uma(tipo: str, mensagem: str) -> None:
+            nonlocal erros
+            payload = {"input": {"input": mensagem}, "session_id": uuid.uuid4().hex, "stream": stream}
+            async with semaforo:
+                inicio = time.perf_counter()
+                try:
+                    if stream:
+                        async with client.stream("POST", CENTRAL_URL, json=payload) as response:
+                            primeiro = None
+                            async for linha in response.aiter_lines():
+                                if primeiro is None and '"type": "delta"' in linha:
+                                    primeiro = time.perf_counter() - inicio
+                            if primeiro is not None:
+                                ttft.append(primeiro)
+                    else:
+                        response = await client.post(CENTRAL_URL, json=payload)
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                duracao = time.perf_counter() - inicio
+            if not ok:
+                erros += 1
+                return
+            e2e["all"].append(duracao)
+            e2e.setdefault(tipo, []).append(duracao)
+            if stream:
+                # Em SSE o Server-Timing sai com os cabeçalhos, antes do trabalho do corpo: não mede os saltos
+                return
+            for nome, valor in parse_server_timing(response.headers.get("server-timing", "")).items():
+                hops.setdefault(nome, []).append(valor)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(uma(tipo, mensagem) for tipo, mensagem in workload))
+        duracao_total = time.perf_counter() - inicio
+    return e2e, ttft, hops, erros, duracao_total
+
+
+async def main(args) -> None:
+    pasta = Path(tempfile.mkdtemp(prefix="bench_"))
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([str(REPO), os.environ.get("PYTHONPATH", "")]),
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-benchmark"),
+        "VIACEP_URL": "http://127.0.0.1:8010/ws",
+        "BENCH_LLM_LATENCY": str(args.llm_latency),
+        "BENCH_LLM_TOKEN_DELAY": str(args.llm_token_delay),
+        "BENCH_VIACEP_LATENCY": str(args.viacep_latency),
+        "BENCH_VIACEP_ERROR_RATE": str(args.viacep_error_rate),
+        "CEP_CACHE_DB": str(pasta / "cep_cache.sqlite3"),
+        "LLM_CACHE_DB": "",
+        "LLM_CACHE_ENABLED": "0" if args.no_llm_cache else "1",
+        "SPECIALIST_AGENT_URLS": "http://127.0.0.1:8001,http://127.0.0.1:8002",
+    }
+    processos = {}
+    prontos: Dict[str, Optional[dict]] = {}
+    try:
+        for nome, comando, url in SERVICOS:
+            processos[nome] = (subprocess.Popen(comando, env=env, cwd=str(REPO)), url)
+            prontos[nome] = await esperar_servico(url, "/" if nome == "viacep" else "/ready")
+            print(f"✅ {nome} pronto em {url}")
+
+        rng = random.Random(args.seed)
+        workload = gerar_workload(args, rng)
+        print(f"🏁 {len(workload)} requisições, concorrência {args.concurrency}...")
+        e2e, ttft, hops, erros, duracao_total = await executar_carga(workload, args.concurrency, args.stream)
+
+        servicos = {}
+        async with httpx.AsyncClient() as client:
+            for nome, (processo, url) in processos.items():
+                info: Dict[str, object] = {"rss_mb": memoria_rss_mb(processo.pid)}
+                if nome != "viacep":
+                    info["startup_s"] = (prontos.get(nome) or {}).get("startup")
+                    try:
+                        info["latency_ms"] = latencias_do_servico((await client.get(url + "/metrics", timeout=5)).text)
+                    except httpx.HTTPError:
+                        info["latency_ms"] = None
+                servicos[nome] = info
+    finally:
+        for processo, _ in processos.values():
+            processo.terminate()
+        for processo, _ in processos.values():
+            processo.wait(timeout=10)
+
+    concluidas = len(e2e["all"])
+    resultado = {
+        "commit": subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True, text=True).stdout.strip(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "requests": len(workload),
+        "completed": concluidas,
+        "errors": erros,
+        "duration_s": round(duracao_total, 3),
+        "throughput_rps": round(concluidas / duracao_total, 2) if duracao_total else None,
+        "end_to_end_ms": {tipo: percentis(valores) for tipo, valores in e2e.items()},
+        "time_to_first_token_ms": percentis(ttft) if args.stream else None,
+        "coordinator_hops_ms": None if args.stream else {nome: percentis(valores) for nome, valores in hops.items()},
+        "services": servicos,
+    }
+    saida = Path(args.output or REPO / "bench_results" / f"bench_{resultado['commit'] or 'local'}_{int(time.time())}.json")
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    saida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False))
+    print(json.dumps({k: resultado[k] for k in ("completed", "errors", "throughput_rps", "end_to_end_ms")}, indent=2, ensure_ascii=False))
+    print(f"📄 Resultado salvo em {saida}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline da sociedade de agentes")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mix", type=int, nargs=3, default=[6, 3, 1], metavar=("CONSULT", "ANALYSIS", "CHAT"),
+                        help="peso de cada tipo de mensagem")
+    parser.add_argument("--cep-pool", type=int, default=50, help="quantidade de CEPs distintos")
+    parser.add_argument("--stream", action="store_true", help="usa SSE e mede o tempo até o primeiro token")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-token-delay", type=float, default=0.005)
+    parser.add_argument("--viacep-latency", type=float, default=0.08)
+    parser.add_argument("--viacep-error-rate", type=float, default=0.0)
+    parser.add_argument("--no-llm-cache", action="store_true")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: bench_results/)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
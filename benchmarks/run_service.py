@@ -0,0 +1,45 @@
+# run_service.py - sobe um serviço da sociedade trocando o LLM pelo modelo de benchmark
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+import uvicorn
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+SERVICOS = {
+    "mcp": (ROOT / "MCP" / "mcp_server.py", 8000),
+    "analysis": (ROOT / "Agent A2A" / "agent_analysis.py", 8001),
+    "consult": (ROOT / "Agent A2A" / "agent_consult.py", 8002),
+    "central": (ROOT / "Agent A2A" / "agent_central _a2a.py", 8004),
+}
+
+
+def carregar_servico(nome: str, caminho: Path):
+    spec = importlib.util.spec_from_file_location(nome, caminho)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nome] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def main(nome: str) -> None:
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    from pydantic_ai import Agent
+
+    from shared.llm_cache import CachedAgent
+    from stub_llm import stub_model
+
+    caminho, porta = SERVICOS[nome]
+    modulo = carregar_servico(f"bench_{nome}", caminho)
+    for valor in list(vars(modulo).values()):
+        if isinstance(valor, CachedAgent):
+            valor.agent = Agent(stub_model(), instructions=valor.instructions or None)
+    uvicorn.run(modulo.app, host="127.0.0.1", port=porta, log_level="warning")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
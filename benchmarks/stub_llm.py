@@ -0,0 +1,52 @@
+# stub_llm.py - modelo determinístico do pydantic-ai para benchmarks sem a OpenAI
+import asyncio
+import os
+import re
+from typing import AsyncIterator, List
+
+from pydantic_ai.messages import ModelMessage, ModelResponse, TextPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+CEP_PATTERN = re.compile(r"\b\d{5}-?\d{3}\b")
+
+# Latência simulada: tempo até o primeiro token e intervalo entre tokens (segundos)
+LLM_LATENCY = float(os.getenv("BENCH_LLM_LATENCY", "0.3"))
+LLM_TOKEN_DELAY = float(os.getenv("BENCH_LLM_TOKEN_DELAY", "0.005"))
+LLM_TOKENS = int(os.getenv("BENCH_LLM_TOKENS", "60"))
+
+
+def _ultimo_prompt(messages: List[ModelMessage]) -> str:
+    for mensagem in reversed(messages):
+        for parte in getattr(mensagem, "parts", []):
+            if getattr(parte, "part_kind", "") == "user-prompt":
+                return str(parte.content)
+    return ""
+
+
+def responder(prompt: str) -> str:
+    """Resposta determinística: escolhe o especialista no prompt de roteamento e gera texto nos demais."""
+    if "ID do Agente" in prompt:
+        pedido = prompt.split("Pedido do usuário:", 1)[-1].split("Especialistas disponíveis:", 1)[0].lower()
+        if "anali" in pedido or "detal" in pedido:
+            return "analysis_specialist_v1"
+        if CEP_PATTERN.search(pedido):
+            return "consult_specialist_v1"
+        return "NONE"
+    palavras = ["📍 resposta", "simulada", "do", "modelo", "de", "benchmark"]
+    return " ".join(palavras[i % len(palavras)] for i in range(LLM_TOKENS))
+
+
+async def _funcao(messages: List[ModelMessage], info: AgentInfo) -> ModelResponse:
+    await asyncio.sleep(LLM_LATENCY + LLM_TOKEN_DELAY * LLM_TOKENS)
+    return ModelResponse(parts=[TextPart(responder(_ultimo_prompt(messages)))])
+
+
+async def _stream(messages: List[ModelMessage], info: AgentInfo) -> AsyncIterator[str]:
+    await asyncio.sleep(LLM_LATENCY)
+    for palavra in responder(_ultimo_prompt(messages)).split(" "):
+        await asyncio.sleep(LLM_TOKEN_DELAY)
+        yield palavra + " "
+
+
+def stub_model() -> FunctionModel:
+    return FunctionModel(_funcao, stream_function=_stream)
@@ -1,4 +1,6 @@
 # schemas.py (VERSÃO CORRIGIDA)
+from typing import Literal, Optional
+
 from pydantic import BaseModel
 
 # A importação de HttpUrl não é mais necessária
@@ -12,4 +14,36 @@ class AgentCard(BaseModel):
     name: str
     description: str
     version: str
-    invocation_endpoint: str
\ No newline at end of file
+    invocation_endpoint: str
+
+class EnderecoCEP(BaseModel):
+    """Campos de endereço retornados pelo ViaCEP para um CEP."""
+    cep: str
+    logradouro: str = ""
+    complemento: str = ""
+    bairro: str = ""
+    localidade: str = ""
+    uf: str = ""
+    ddd: str = ""
+    ibge: str = ""
+
+
+# Códigos de erro das ferramentas do MCP Server
+ToolErrorCode = Literal["invalid_cep", "out_of_range", "not_found", "upstream_error", "llm_error", "overloaded", "deadline_exceeded"]
+
+
+class ToolResult(BaseModel):
+    """
+    Resultado estruturado de uma ferramenta do MCP Server. ``output`` mantém o
+    texto formatado; ``dados`` e ``error_code`` servem para decisões de máquina.
+    """
+    success: bool
+    tool: str
+    input: str
+    output: str
+    dados: Optional[EnderecoCEP] = None
+    analise: Optional[str] = None
+    llm_cached: Optional[bool] = None
+    # True quando o ViaCEP falhou e os dados (UF/cidade) vieram do índice local de faixas
+    degraded: bool = False
+    error_code: Optional[ToolErrorCode] = None
@@ -0,0 +1,133 @@
+# cep_cache.py
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Valor gravado para respostas "CEP não encontrado" (cache negativo)
+_NAO_ENCONTRADO = None
+
+
+class CepCache:
+    """
+    Cache em dois níveis para respostas do ViaCEP: um LRU em memória com TTL
+    na frente de um armazenamento SQLite que sobrevive a reinícios.
+
+    Respostas de "CEP não encontrado" são guardadas como ``None`` com um TTL
+    menor (cache negativo).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        ttl: float = 24 * 3600,
+        negative_ttl: float = 3600,
+        db_path: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._memoria: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if db_path:
+            # WAL e timeout: vários workers do MCP Server dividem o mesmo arquivo
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cep_cache ("
+                "cep TEXT PRIMARY KEY, dados TEXT, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM cep_cache WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+
+    def get(self, cep: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Retorna ``(encontrado, dados)``. ``dados`` é ``None`` quando o cache
+        guarda um "CEP não encontrado".
+        """
+        agora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(cep)
+            if entrada is not None:
+                expires_at, dados = entrada
+                if expires_at > agora:
+                    self._memoria.move_to_end(cep)
+                    self._contar_hit(dados)
+                    return True, dados
+                del self._memoria[cep]
+                self.expirations += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT dados, expires_at FROM cep_cache WHERE cep = ?", (cep,)
+                ).fetchone()
+                if row is not None:
+                    dados_json, expires_at = row
+                    if expires_at > agora:
+                        dados = json.loads(dados_json) if dados_json is not None else _NAO_ENCONTRADO
+                        self._guardar_memoria(cep, expires_at, dados)
+                        self.disk_hits += 1
+                        self._contar_hit(dados)
+                        return True, dados
+                    self._db.execute("DELETE FROM cep_cache WHERE cep = ?", (cep,))
+                    self._db.commit()
+                    self.expirations += 1
+
+            self.misses += 1
+            return False, None
+
+    def set(self, cep: str, dados: Optional[Dict[str, Any]]) -> None:
+        """Guarda a resposta do ViaCEP; ``None`` registra um "CEP não encontrado"."""
+        ttl = self.ttl if dados is not None else self.negative_ttl
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._guardar_memoria(cep, expires_at, dados)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cep_cache (cep, dados, expires_at) VALUES (?, ?, ?)",
+                    (cep, json.dumps(dados) if dados is not None else None, expires_at),
+                )
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de uso do cache."""
+        with self._lock:
+            return {
+                "entries": len(self._memoria),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "persistent": self._db is not None,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _contar_hit(self, dados: Optional[Dict[str, Any]]) -> None:
+        self.hits += 1
+        if dados is None:
+            self.negative_hits += 1
+
+    def _guardar_memoria(self, cep: str, expires_at: float, dados: Optional[Dict[str, Any]]) -> None:
+        self._memoria[cep] = (expires_at, dados)
+        self._memoria.move_to_end(cep)
+        while len(self._memoria) > self.max_entries:
+            self._memoria.popitem(last=False)
+            self.evictions += 1
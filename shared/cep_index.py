@@ -0,0 +1,145 @@
+# cep_index.py
+import csv
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+DEFAULT_DATA_FILE = Path(__file__).resolve().parent.parent / "data" / "faixas_cep.csv"
+
+# Formato binário do índice compilado:
+#   MAGIC | n_uf, n_loc, tamanho_nomes (uint32)
+#   uf_inicio[n_uf] uf_fim[n_uf] uf_nome[n_uf] loc_inicio[n_loc] loc_fim[n_loc] loc_nome[n_loc] (uint32)
+#   nomes (JSON UTF-8; os campos *_nome são índices nesta lista)
+MAGIC = b"CEPIDX1\0"
+_CABECALHO = struct.Struct("<III")
+
+
+@dataclass(frozen=True)
+class FaixaCEP:
+    """UF (e, quando conhecida, a localidade) a que um CEP pertence."""
+    uf: str
+    localidade: Optional[str] = None
+
+
+def _ler_csv(caminho: Path) -> Tuple[List[Tuple[int, int, str]], List[Tuple[int, int, str]]]:
+    faixas_uf, faixas_loc = [], []
+    with open(caminho, encoding="utf-8") as arquivo:
+        linhas = (linha for linha in arquivo if not linha.startswith("#"))
+        for row in csv.DictReader(linhas):
+            inicio, fim = int(row["inicio"]), int(row["fim"])
+            if row["tipo"] == "uf":
+                faixas_uf.append((inicio, fim, row["uf"]))
+            else:
+                faixas_loc.append((inicio, fim, f"{row['uf']}|{row['localidade']}"))
+    faixas_uf.sort()
+    faixas_loc.sort()
+    return faixas_uf, faixas_loc
+
+
+def compilar_indice(origem: Path, destino: Path) -> None:
+    """Gera o arquivo binário do índice a partir do CSV de faixas."""
+    faixas_uf, faixas_loc = _ler_csv(origem)
+    nomes = sorted({nome for _, _, nome in faixas_uf + faixas_loc})
+    posicao = {nome: i for i, nome in enumerate(nomes)}
+    nomes_json = json.dumps(nomes, ensure_ascii=False).encode("utf-8")
+
+    corpo = array("I")
+    for faixas in (faixas_uf, faixas_loc):
+        corpo.extend(inicio for inicio, _, _ in faixas)
+        corpo.extend(fim for _, fim, _ in faixas)
+        corpo.extend(posicao[nome] for _, _, nome in faixas)
+    if corpo.itemsize != 4:
+        raise RuntimeError("array('I') precisa ter 4 bytes nesta plataforma")
+
+    # Temporário com nome único: vários processos podem compilar o índice ao mesmo tempo
+    descritor, temporario = tempfile.mkstemp(dir=destino.parent, prefix=f".{destino.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(descritor, "wb") as arquivo:
+            arquivo.write(MAGIC)
+            arquivo.write(_CABECALHO.pack(len(faixas_uf), len(faixas_loc), len(nomes_json)))
+            arquivo.write(corpo.tobytes())
+            arquivo.write(nomes_json)
+        # mkstemp cria com 0600; o índice é lido por qualquer serviço
+        os.chmod(temporario, 0o644)
+        os.replace(temporario, destino)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+
+
+class CepRangeIndex:
+    """
+    Índice local de faixas de CEP por UF e localidade, carregado de um arquivo
+    binário mapeado em memória. A consulta é uma busca binária em arrays de
+    inteiros, sem rede: serve para rejeitar CEPs impossíveis antes do ViaCEP e
+    para respostas parciais (UF/cidade) quando o ViaCEP falha.
+    """
+
+    def __init__(self, data_file: Optional[str] = None):
+        origem = Path(data_file or os.getenv("CEP_INDEX_FILE") or DEFAULT_DATA_FILE)
+        binario = origem.with_suffix(".idx")
+        self._mmap: Optional[mmap.mmap] = None
+
+        try:
+            if not binario.exists() or binario.stat().st_mtime < origem.stat().st_mtime:
+                compilar_indice(origem, binario)
+            with open(binario, "rb") as arquivo:
+                self._mmap = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+            buffer = memoryview(self._mmap)
+        except OSError:
+            # Diretório somente leitura: compila em memória
+            buffer = memoryview(self._compilar_em_memoria(origem))
+
+        if bytes(buffer[: len(MAGIC)]) != MAGIC:
+            raise ValueError(f"Arquivo de índice de CEP inválido: {binario}")
+        n_uf, n_loc, tamanho_nomes = _CABECALHO.unpack_from(buffer, len(MAGIC))
+        inteiros = buffer[len(MAGIC) + _CABECALHO.size:].cast("B")
+        fim_arrays = 4 * 3 * (n_uf + n_loc)
+        arrays = inteiros[:fim_arrays].cast("I")
+        self._nomes: List[str] = json.loads(bytes(inteiros[fim_arrays:fim_arrays + tamanho_nomes]))
+
+        self._uf_inicio = arrays[0:n_uf]
+        self._uf_fim = arrays[n_uf:2 * n_uf]
+        self._uf_nome = arrays[2 * n_uf:3 * n_uf]
+        base = 3 * n_uf
+        self._loc_inicio = arrays[base:base + n_loc]
+        self._loc_fim = arrays[base + n_loc:base + 2 * n_loc]
+        self._loc_nome = arrays[base + 2 * n_loc:base + 3 * n_loc]
+
+    @staticmethod
+    def _compilar_em_memoria(origem: Path) -> bytes:
+        with tempfile.TemporaryDirectory() as pasta:
+            destino = Path(pasta) / "faixas.idx"
+            compilar_indice(origem, destino)
+            return destino.read_bytes()
+
+    def __len__(self) -> int:
+        return len(self._uf_inicio) + len(self._loc_inicio)
+
+    def lookup(self, cep_limpo: str) -> Optional[FaixaCEP]:
+        """Retorna a faixa do CEP (8 dígitos) ou None se ele está fora de todas as faixas."""
+        valor = int(cep_limpo)
+        i = self._buscar(self._uf_inicio, self._uf_fim, valor)
+        if i is None:
+            return None
+        uf = self._nomes[self._uf_nome[i]]
+        j = self._buscar(self._loc_inicio, self._loc_fim, valor)
+        if j is not None:
+            uf_loc, localidade = self._nomes[self._loc_nome[j]].split("|", 1)
+            if uf_loc == uf:
+                return FaixaCEP(uf=uf, localidade=localidade)
+        return FaixaCEP(uf=uf)
+
+    @staticmethod
+    def _buscar(inicios: Sequence[int], fins: Sequence[int], valor: int) -> Optional[int]:
+        i = bisect_right(inicios, valor) - 1
+        if i >= 0 and valor <= fins[i]:
+            return i
+        return None
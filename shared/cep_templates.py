@@ -0,0 +1,73 @@
+# cep_templates.py
+import json
+import os
+import re
+from typing import Dict, Optional
+
+from schemas.schemas import EnderecoCEP
+from shared.local_router import CEP_PATTERN, normalizar_texto
+
+# Modelos padrão por locale; podem ser sobrescritos por um arquivo JSON em CEP_TEMPLATES_FILE
+DEFAULT_TEMPLATES: Dict[str, Dict[str, str]] = {
+    "pt-BR": {
+        "vazio": "⚠️ Não informado",
+        "endereco": """📍 **CEP {cep}**
+
+🛣️ **Logradouro:** {logradouro}
+🏘️ **Bairro:** {bairro}
+🏙️ **Cidade:** {localidade}
+🗺️ **Estado:** {uf}
+📮 **DDD:** {ddd}
+
+✅ Consulta realizada via ViaCEP""",
+    },
+    "en": {
+        "vazio": "⚠️ Not available",
+        "endereco": """📍 **ZIP code {cep}**
+
+🛣️ **Street:** {logradouro}
+🏘️ **Neighborhood:** {bairro}
+🏙️ **City:** {localidade}
+🗺️ **State:** {uf}
+📮 **Area code:** {ddd}
+
+✅ Lookup via ViaCEP""",
+    },
+}
+
+# Palavras de um pedido de consulta simples; sobrando outras, o pedido vai além dos campos padrão
+PALAVRAS_CONSULTA_SIMPLES = {
+    "consulte", "consultar", "consulta", "verifique", "verificar", "busque", "buscar", "procure",
+    "mostre", "mostrar", "me", "diga", "informe", "qual", "quais", "e", "o", "a", "os", "as", "do",
+    "da", "de", "dos", "das", "no", "na", "para", "pra", "cep", "ceps", "endereco", "logradouro",
+    "rua", "bairro", "cidade", "estado", "uf", "ddd", "por", "favor", "pf", "pfv", "ola", "oi",
+    "lookup", "check", "zip", "code", "please", "address", "the", "of", "for",
+}
+
+
+def carregar_templates(caminho: Optional[str] = None) -> Dict[str, Dict[str, str]]:
+    """Modelos padrão mesclados com os do arquivo JSON ``{"locale": {"endereco": ..., "vazio": ...}}``."""
+    templates = {locale: dict(campos) for locale, campos in DEFAULT_TEMPLATES.items()}
+    caminho = caminho or os.getenv("CEP_TEMPLATES_FILE")
+    if caminho:
+        with open(caminho, encoding="utf-8") as arquivo:
+            for locale, campos in json.load(arquivo).items():
+                templates.setdefault(locale, dict(DEFAULT_TEMPLATES["pt-BR"])).update(campos)
+    return templates
+
+
+def renderizar_endereco(
+    endereco: EnderecoCEP, locale: str = "pt-BR", templates: Optional[Dict[str, Dict[str, str]]] = None
+) -> str:
+    """Renderiza o endereço sem LLM, usando o modelo do locale (ou pt-BR)."""
+    templates = templates or DEFAULT_TEMPLATES
+    modelo = templates.get(locale) or templates.get(locale.split("-")[0]) or templates["pt-BR"]
+    campos = {nome: valor or modelo["vazio"] for nome, valor in endereco.model_dump().items()}
+    return modelo["endereco"].format_map(campos)
+
+
+def pedido_simples(message: str) -> bool:
+    """True quando a mensagem só pede os campos padrão do CEP."""
+    texto = normalizar_texto(CEP_PATTERN.sub(" ", message))
+    palavras = re.findall(r"[a-z]+", texto)
+    return all(palavra in PALAVRAS_CONSULTA_SIMPLES for palavra in palavras)
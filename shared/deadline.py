@@ -0,0 +1,197 @@
+# deadline.py
+import asyncio
+import json
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from shared.telemetry import metrics
+
+# Orçamento restante da requisição, em segundos, repassado de salto em salto
+DEADLINE_HEADER = "X-Request-Timeout"
+# Folga descontada a cada salto (rede, serialização)
+HOP_MARGIN = float(os.getenv("DEADLINE_HOP_MARGIN", "0.1"))
+
+# Prazo da requisição atual, em time.monotonic(); None quando não há prazo
+_deadline_var: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """O prazo de ponta a ponta da requisição acabou; o trabalho restante é descartado."""
+
+    def __init__(self, message: str = "⏱️ Prazo da requisição esgotado."):
+        super().__init__(message)
+
+
+def remaining() -> Optional[float]:
+    """Segundos restantes do prazo da requisição atual (None quando não há prazo)."""
+    deadline = _deadline_var.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def timeout_for(default: float) -> float:
+    """Timeout de uma etapa: o padrão dela, limitado ao que resta do prazo."""
+    restante = remaining()
+    if restante is None:
+        return default
+    if restante <= 0:
+        raise DeadlineExceeded()
+    return min(default, restante)
+
+
+async def run_with_deadline(awaitable: Awaitable[Any]) -> Any:
+    """Aguarda ``awaitable`` até o fim do prazo, cancelando-o se ele acabar antes."""
+    restante = remaining()
+    if restante is None:
+        return await awaitable
+    if restante <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded()
+    try:
+        return await asyncio.wait_for(awaitable, timeout=restante)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded() from None
+
+
+async def detached(awaitable: Awaitable[Any]) -> Any:
+    """Roda ``awaitable`` (dentro de uma tarefa própria) sem o prazo de quem a criou."""
+    _deadline_var.set(None)
+    return await awaitable
+
+
+# ✅ Saída: o httpx repassa o prazo e limita os próprios timeouts a ele
+async def _aplicar_prazo(request: httpx.Request) -> None:
+    restante = remaining()
+    if restante is None:
+        return
+    orcamento = restante - HOP_MARGIN
+    if orcamento <= 0:
+        metrics.inc("requests_cancelled_total", reason="deadline_before_send")
+        raise DeadlineExceeded()
+    existente = request.headers.get(DEADLINE_HEADER)
+    if existente is None or _parse_orcamento(existente) is None or _parse_orcamento(existente) > orcamento:
+        request.headers[DEADLINE_HEADER] = f"{orcamento:.3f}"
+    timeouts = request.extensions.get("timeout") or {}
+    request.extensions["timeout"] = {
+        chave: orcamento if valor is None else min(valor, orcamento)
+        for chave, valor in ({"connect": None, "read": None, "write": None, "pool": None} | timeouts).items()
+    }
+
+
+def deadline_event_hooks() -> dict:
+    return {"request": [_aplicar_prazo]}
+
+
+def _parse_orcamento(valor: Optional[str]) -> Optional[float]:
+    try:
+        return max(0.0, float(valor)) if valor else None
+    except ValueError:
+        return None
+
+
+# ✅ Entrada: prazo por requisição, cancelamento por prazo ou desconexão do cliente
+class DeadlineMiddleware:
+    """
+    Middleware ASGI que lê o orçamento de ``X-Request-Timeout`` (ou aplica o
+    padrão do serviço nas rotas de entrada), guarda o prazo no contexto e
+    cancela o endpoint quando o prazo acaba ou o cliente desconecta. Sem
+    resposta iniciada, o prazo esgotado vira um 504.
+    """
+
+    def __init__(self, app, default_timeout: Optional[float] = None, default_paths: Tuple[str, ...] = ()):
+        self.app = app
+        self.default_timeout = default_timeout
+        self.default_paths = default_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        cabecalhos = dict(scope.get("headers") or [])
+        orcamento = _parse_orcamento(cabecalhos.get(DEADLINE_HEADER.lower().encode(), b"").decode() or None)
+        if orcamento is None and self.default_timeout and scope["path"] in self.default_paths:
+            orcamento = self.default_timeout
+        token = _deadline_var.set(time.monotonic() + orcamento if orcamento is not None else None)
+
+        estado = {"iniciada": False, "finalizada": False}
+        corpo_lido = asyncio.Event()
+        if cabecalhos.get(b"content-length", b"0") == b"0" and b"transfer-encoding" not in cabecalhos:
+            # Sem corpo o app não chama receive(); a desconexão fica a cargo das respostas em streaming
+            corpo_lido = None
+
+        async def receive_app():
+            mensagem = await receive()
+            if corpo_lido is not None and mensagem["type"] == "http.request" and not mensagem.get("more_body"):
+                corpo_lido.set()
+            return mensagem
+
+        async def send_app(mensagem):
+            if mensagem["type"] == "http.response.start":
+                estado["iniciada"] = True
+            elif mensagem["type"] == "http.response.body" and not mensagem.get("more_body"):
+                estado["finalizada"] = True
+            await send(mensagem)
+
+        tarefa = asyncio.ensure_future(self.app(scope, receive_app, send_app))
+        vigia = asyncio.ensure_future(self._vigiar_desconexao(receive, corpo_lido, estado, tarefa)) if corpo_lido else None
+        try:
+            concluidas, _ = await asyncio.wait({tarefa}, timeout=orcamento)
+            if not concluidas:
+                metrics.inc("requests_cancelled_total", reason="deadline")
+                tarefa.cancel()
+                await asyncio.gather(tarefa, return_exceptions=True)
+                if not estado["iniciada"]:
+                    await self._responder_prazo_esgotado(send)
+                return
+            if tarefa.cancelled():
+                # Cliente desconectou: não há para quem responder
+                return
+            tarefa.result()
+        except asyncio.CancelledError:
+            tarefa.cancel()
+            raise
+        finally:
+            if vigia is not None:
+                vigia.cancel()
+            _deadline_var.reset(token)
+
+    @staticmethod
+    async def _vigiar_desconexao(receive, corpo_lido: asyncio.Event, estado: dict, tarefa: asyncio.Future) -> None:
+        await corpo_lido.wait()
+        while not tarefa.done():
+            mensagem = await receive()
+            if mensagem["type"] == "http.disconnect":
+                if not estado["finalizada"] and not tarefa.done():
+                    metrics.inc("requests_cancelled_total", reason="disconnect")
+                    tarefa.cancel()
+                return
+
+    @staticmethod
+    async def _responder_prazo_esgotado(send) -> None:
+        corpo = json.dumps(
+            {"success": False, "error": str(DeadlineExceeded()), "error_code": "deadline_exceeded"}, ensure_ascii=False
+        ).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 504,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(corpo)).encode())],
+        })
+        await send({"type": "http.response.body", "body": corpo})
+
+
+def install_deadline(app: FastAPI, default_timeout: Optional[float] = None, default_paths: Tuple[str, ...] = ()) -> None:
+    """
+    Ativa o prazo de ponta a ponta no serviço. ``default_timeout`` vale só para
+    ``default_paths`` (os pontos de entrada) quando o cliente não envia o cabeçalho.
+    """
+    app.add_middleware(DeadlineMiddleware, default_timeout=default_timeout, default_paths=default_paths)
+
+    @app.exception_handler(DeadlineExceeded)
+    async def _prazo_esgotado(request: Request, exc: DeadlineExceeded):
+        return JSONResponse(status_code=504, content={"success": False, "error": str(exc), "error_code": "deadline_exceeded"})
@@ -0,0 +1,275 @@
+# discovery.py
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from schemas.schemas import AgentCard
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Disjuntor por endpoint: abre após ``failure_threshold`` falhas seguidas e,
+    depois de ``reset_timeout`` segundos, deixa passar uma tentativa (meio-aberto).
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._tentativa_em_andamento = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        estado = self.state
+        if estado == "closed":
+            return True
+        if estado == "half_open" and not self._tentativa_em_andamento:
+            return True
+        return False
+
+    def begin(self) -> None:
+        if self.state == "half_open":
+            self._tentativa_em_andamento = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._tentativa_em_andamento = False
+
+    def release(self) -> None:
+        """Encerra a tentativa sem veredito (chamada cancelada ou especialista sobrecarregado)."""
+        self._tentativa_em_andamento = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._tentativa_em_andamento = False
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+
+def _sobrecarga(exc: BaseException) -> bool:
+    return isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 503
+
+
+@dataclass
+class AgentEndpoint:
+    """Uma réplica de especialista: o cartão que ela anunciou e o seu estado de saúde."""
+    base_url: str
+    card: AgentCard
+    breaker: CircuitBreaker
+    healthy: bool = True
+    in_flight: int = 0
+    latency_ewma: float = 0.0
+    last_seen: float = field(default_factory=time.time)
+
+    @property
+    def invocation_url(self) -> str:
+        # O cartão pode trazer um host fixo; cada réplica é chamada no seu próprio endereço
+        caminho = urlparse(self.card.invocation_endpoint).path or "/sse"
+        return f"{self.base_url.rstrip('/')}{caminho}"
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and self.breaker.allow()
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "agent_id": self.card.agent_id,
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "circuit": self.breaker.state,
+            "in_flight": self.in_flight,
+            "latency_ms": round(self.latency_ewma * 1000, 1),
+        }
+
+
+class AgentDirectory:
+    """
+    Descoberta contínua dos especialistas: consulta ``GET /card`` de todas as
+    URLs em paralelo, repete periodicamente em segundo plano e mantém várias
+    réplicas por ``agent_id`` com balanceamento por menor número de chamadas em
+    andamento (``least_in_flight``) ou ponderado pela latência (``latency``).
+
+    Com um ``registry`` (ver ``shared/registry.py``), as réplicas que se
+    registraram também entram no diretório; a saúde delas vem do heartbeat,
+    então todos os workers do coordenador enxergam a mesma sociedade.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        http_client: httpx.AsyncClient,
+        interval: float = 15.0,
+        strategy: str = "least_in_flight",
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+        probe_timeout: float = 5.0,
+        registry=None,
+        registry_max_age: float = 15.0,
+    ):
+        self.urls = [url.rstrip("/") for url in urls if url.strip()]
+        self.http_client = http_client
+        self.interval = interval
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self.registry = registry
+        self.registry_max_age = registry_max_age
+        self._endpoints: Dict[str, AgentEndpoint] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def discover(self) -> None:
+        """Consulta todas as URLs em paralelo e atualiza a saúde de cada réplica."""
+        await asyncio.gather(*(self._probe(url) for url in self.urls))
+        if self.registry is not None:
+            await self._sincronizar_registro()
+
+    async def _sincronizar_registro(self) -> None:
+        """Atualiza as réplicas registradas a partir do registro compartilhado."""
+        entradas = await asyncio.to_thread(self.registry.entries)
+        limite = time.time() - self.registry_max_age
+        registradas = set()
+        for entrada in entradas:
+            url = entrada.base_url.rstrip("/")
+            registradas.add(url)
+            if url in self.urls:
+                # URLs fixas continuam sendo verificadas por GET /card
+                continue
+            vivo = entrada.last_heartbeat >= limite
+            endpoint = self._endpoints.get(url)
+            if endpoint is None:
+                if vivo:
+                    self._endpoints[url] = AgentEndpoint(
+                        base_url=url,
+                        card=entrada.card,
+                        breaker=CircuitBreaker(self.failure_threshold, self.reset_timeout),
+                        last_seen=entrada.last_heartbeat,
+                    )
+                    logger.info(f"Agente '{entrada.card.name}' registrado em {url}")
+                continue
+            if vivo != endpoint.healthy:
+                estado = "voltou a enviar heartbeat" if vivo else "parou de enviar heartbeat"
+                logger.info(f"Agente '{entrada.card.name}' em {url} {estado}")
+            endpoint.card = entrada.card
+            endpoint.healthy = vivo
+            endpoint.last_seen = entrada.last_heartbeat
+        for url in list(self._endpoints):
+            if url not in self.urls and url not in registradas:
+                logger.info(f"Agente '{self._endpoints[url].card.name}' em {url} saiu do registro")
+                del self._endpoints[url]
+
+    async def _probe(self, url: str) -> None:
+        endpoint = self._endpoints.get(url)
+        try:
+            response = await self.http_client.get(f"{url}/card", timeout=self.probe_timeout)
+            response.raise_for_status()
+            card = AgentCard(**response.json())
+        except Exception as e:
+            if endpoint is not None:
+                if endpoint.healthy:
+                    logger.warning(f"Agente '{endpoint.card.name}' em {url} ficou indisponível: {e}")
+                endpoint.healthy = False
+                endpoint.breaker.record_failure()
+            return
+
+        if endpoint is None:
+            self._endpoints[url] = AgentEndpoint(
+                base_url=url,
+                card=card,
+                breaker=CircuitBreaker(self.failure_threshold, self.reset_timeout),
+            )
+            logger.info(f"Agente '{card.name}' descoberto em {url}")
+            return
+        if not endpoint.healthy:
+            logger.info(f"Agente '{card.name}' em {url} voltou a responder")
+        endpoint.card = card
+        endpoint.healthy = True
+        endpoint.last_seen = time.time()
+        endpoint.breaker.record_success()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.discover()
+            except Exception as e:
+                logger.error(f"Erro na redescoberta de agentes: {e}")
+
+    def cards(self) -> List[AgentCard]:
+        """Um cartão por ``agent_id`` que tenha pelo menos uma réplica disponível."""
+        cards: Dict[str, AgentCard] = {}
+        for endpoint in self._endpoints.values():
+            if endpoint.available:
+                cards.setdefault(endpoint.card.agent_id, endpoint.card)
+        return list(cards.values())
+
+    def pick(self, agent_id: str) -> Optional[AgentEndpoint]:
+        """Escolhe a réplica disponível com menor carga segundo a estratégia configurada."""
+        candidatos = [
+            e for e in self._endpoints.values() if e.card.agent_id == agent_id and e.available
+        ]
+        if not candidatos:
+            return None
+        if self.strategy == "latency":
+            return min(candidatos, key=lambda e: (e.in_flight + 1) * (e.latency_ewma or 0.001))
+        return min(candidatos, key=lambda e: (e.in_flight, e.latency_ewma))
+
+    @asynccontextmanager
+    async def track(self, endpoint: AgentEndpoint):
+        """Conta a chamada em andamento e alimenta a latência e o disjuntor da réplica."""
+        endpoint.in_flight += 1
+        endpoint.breaker.begin()
+        inicio = time.monotonic()
+        try:
+            yield endpoint
+        except Exception as e:
+            if _sobrecarga(e):
+                # 503 de sobrecarga: a réplica está viva, só sem capacidade agora
+                endpoint.breaker.release()
+            else:
+                endpoint.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelamento (desconexão, prazo, ramo descartado) não diz nada sobre a réplica,
+            # mas precisa liberar a tentativa do meio-aberto
+            endpoint.breaker.release()
+            raise
+        else:
+            duracao = time.monotonic() - inicio
+            endpoint.latency_ewma = duracao if not endpoint.latency_ewma else 0.8 * endpoint.latency_ewma + 0.2 * duracao
+            endpoint.breaker.record_success()
+        finally:
+            endpoint.in_flight -= 1
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        return [endpoint.snapshot() for endpoint in self._endpoints.values()]
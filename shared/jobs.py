@@ -0,0 +1,369 @@
+# jobs.py
+import asyncio
+import csv
+import io
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from shared.local_router import CEP_PATTERN, normalizar_texto
+
+logger = logging.getLogger(__name__)
+
+JOB_FINAL_STATUS = ("completed", "failed", "cancelled")
+
+
+class JobRowRetry(Exception):
+    """A linha não pode ser processada agora (ex.: especialista fora do ar): fica pendente e é tentada de novo."""
+
+
+# ✅ Entrada: lista de CEPs ou planilha CSV
+def _linha(entrada: str, cep: Optional[str]) -> Dict[str, Optional[str]]:
+    digitos = "".join(filter(str.isdigit, cep or ""))
+    return {"input": entrada, "cep": f"{digitos[:5]}-{digitos[5:]}" if len(digitos) == 8 else None}
+
+
+def linhas_de_lista(ceps: List[str]) -> List[Dict[str, Optional[str]]]:
+    return [_linha(str(cep), str(cep)) for cep in ceps if str(cep).strip()]
+
+
+def linhas_de_csv(texto: str) -> List[Dict[str, Optional[str]]]:
+    """
+    Uma linha do job por linha da planilha. Usa a coluna ``cep`` quando o
+    cabeçalho tem uma; senão, o primeiro campo da linha que parece um CEP.
+    """
+    try:
+        dialeto = csv.Sniffer().sniff(texto[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialeto = csv.excel
+    registros = [r for r in csv.reader(io.StringIO(texto), dialeto) if any(c.strip() for c in r)]
+    if not registros:
+        return []
+    coluna = None
+    cabecalho = [normalizar_texto(c) for c in registros[0]]
+    if "cep" in cabecalho:
+        coluna = cabecalho.index("cep")
+        registros = registros[1:]
+    elif not any(CEP_PATTERN.search(c) or len("".join(filter(str.isdigit, c))) == 8 for c in registros[0]):
+        # Cabeçalho sem coluna "cep": descartado
+        registros = registros[1:]
+
+    linhas = []
+    for registro in registros:
+        entrada = dialeto.delimiter.join(c.strip() for c in registro)
+        if coluna is not None:
+            linhas.append(_linha(entrada, registro[coluna] if coluna < len(registro) else ""))
+            continue
+        cep = next((c for c in registro if len("".join(filter(str.isdigit, c))) == 8), None)
+        linhas.append(_linha(entrada, cep))
+    return linhas
+
+
+# ✅ Armazenamento com checkpoint por linha
+class JobStore:
+    """
+    Jobs e linhas em SQLite (WAL). Cada linha é gravada assim que termina, então
+    um job interrompido retoma só as linhas pendentes. Os jobs são reservados
+    com um lease, o que permite vários workers do coordenador no mesmo arquivo.
+    """
+
+    def __init__(self, db_path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, options TEXT NOT NULL, "
+            "owner TEXT, lease_until REAL NOT NULL DEFAULT 0, error TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_rows ("
+            "job_id TEXT NOT NULL, idx INTEGER NOT NULL, input TEXT NOT NULL, cep TEXT, "
+            "status TEXT NOT NULL, result TEXT, PRIMARY KEY (job_id, idx))"
+        )
+        self._db.commit()
+
+    def create(self, kind: str, linhas: List[Dict[str, Optional[str]]], options: Optional[Dict[str, Any]] = None) -> str:
+        job_id = uuid.uuid4().hex
+        agora = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, status, options, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(options or {}), agora, agora),
+            )
+            self._db.executemany(
+                "INSERT INTO job_rows (job_id, idx, input, cep, status, result) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        job_id, i, linha["input"], linha["cep"],
+                        "pending" if linha["cep"] else "failed",
+                        None if linha["cep"] else json.dumps({"success": False, "error": "CEP inválido"}),
+                    )
+                    for i, linha in enumerate(linhas)
+                ],
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, status, options, error, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            contagens = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM job_rows WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+        total = sum(contagens.values())
+        pendentes = contagens.get("pending", 0)
+        return {
+            "job_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "options": json.loads(row[3]),
+            "error": row[4],
+            "created_at": row[5],
+            "updated_at": row[6],
+            "total": total,
+            "done": contagens.get("done", 0),
+            "failed": contagens.get("failed", 0),
+            "pending": pendentes,
+            "progress": round((total - pendentes) / total, 4) if total else 1.0,
+        }
+
+    def list(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            ids = [r[0] for r in self._db.execute("SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))]
+        return [job for job in (self.get(job_id) for job_id in ids) if job is not None]
+
+    def claim_next(self, owner: str, lease: float) -> Optional[str]:
+        """Reserva o job mais antigo na fila (ou com lease vencido, de um worker que caiu)."""
+        agora = time.time()
+        with self._lock, self._db:
+            candidatos = self._db.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created_at LIMIT 5",
+                (agora,),
+            ).fetchall()
+            for (job_id,) in candidatos:
+                cursor = self._db.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, updated_at = ? "
+                    "WHERE id = ? AND (status = 'queued' OR (status = 'running' AND lease_until < ?))",
+                    (owner, agora + lease, agora, job_id, agora),
+                )
+                if cursor.rowcount == 1:
+                    return job_id
+        return None
+
+    def renew(self, job_id: str, owner: str, lease: float) -> bool:
+        """Renova o lease; False se o job foi cancelado ou assumido por outro worker."""
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                (time.time() + lease, time.time(), job_id, owner),
+            )
+            return cursor.rowcount == 1
+
+    def pending_rows(self, job_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT idx, input, cep FROM job_rows WHERE job_id = ? AND status = 'pending' ORDER BY idx", (job_id,)
+            ).fetchall()
+        return [{"idx": idx, "input": entrada, "cep": cep} for idx, entrada, cep in rows]
+
+    def finish_row(self, job_id: str, idx: int, resultado: Dict[str, Any]) -> None:
+        status = "done" if resultado.get("success") else "failed"
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE job_rows SET status = ?, result = ? WHERE job_id = ? AND idx = ?",
+                (status, json.dumps(resultado, ensure_ascii=False), job_id, idx),
+            )
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None, owner: Optional[str] = None) -> bool:
+        """Muda o status; com ``owner``, só se o job ainda for desse worker (e não tiver sido cancelado)."""
+        with self._lock, self._db:
+            if owner is None:
+                cursor = self._db.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status NOT IN (?, ?, ?)",
+                    (status, error, time.time(), job_id, *JOB_FINAL_STATUS),
+                )
+            else:
+                cursor = self._db.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                    (status, error, time.time(), job_id, owner),
+                )
+            return cursor.rowcount == 1
+
+    def results(self, job_id: str, offset: int = 0, limit: int = -1) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT idx, input, cep, status, result FROM job_rows WHERE job_id = ? ORDER BY idx LIMIT ? OFFSET ?",
+                (job_id, limit, offset),
+            ).fetchall()
+        return [
+            {"idx": idx, "input": entrada, "cep": cep, "status": status, **(json.loads(resultado) if resultado else {})}
+            for idx, entrada, cep, status, resultado in rows
+        ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+# ✅ Execução em segundo plano
+class JobManager:
+    """
+    Pool de workers que processa os jobs do ``JobStore``: até ``max_running_jobs``
+    jobs por processo, cada um com até ``row_concurrency`` linhas em paralelo.
+    ``processor(job, linha)`` devolve o resultado da linha (``{"success": ...}``)
+    ou levanta ``JobRowRetry``; nesse caso a linha continua pendente e volta a
+    ser tentada com backoff exponencial (de ``retry_base`` até ``retry_max`` s).
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        processor: Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        max_running_jobs: int = 2,
+        row_concurrency: int = 4,
+        lease: float = 30.0,
+        poll_interval: float = 5.0,
+        retry_base: float = 1.0,
+        retry_max: float = 30.0,
+    ):
+        self.store = store
+        self.processor = processor
+        self.max_running_jobs = max(1, max_running_jobs)
+        self.row_concurrency = max(1, row_concurrency)
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.owner = uuid.uuid4().hex
+        self._novo_job = asyncio.Event()
+        self._atualizado = asyncio.Condition()
+        self._workers: List[asyncio.Task] = []
+        self._cancelados: set = set()
+        self._executando: set = set()
+
+    async def start(self) -> None:
+        """Sobe os workers; jobs interrompidos (lease vencido) são retomados de onde pararam."""
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_running_jobs)]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, kind: str, linhas: List[Dict[str, Optional[str]]], options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        job_id = await asyncio.to_thread(self.store.create, kind, linhas, options)
+        self._novo_job.set()
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def cancel(self, job_id: str) -> bool:
+        cancelado = await asyncio.to_thread(self.store.set_status, job_id, "cancelled")
+        if cancelado and job_id in self._executando:
+            # Só jobs rodando neste manager precisam do aviso; os demais nem começaram aqui
+            self._cancelados.add(job_id)
+        await self._notificar()
+        return cancelado
+
+    async def wait_update(self, timeout: float) -> None:
+        """Espera a próxima linha concluída (de qualquer job) ou o timeout."""
+        async with self._atualizado:
+            try:
+                await asyncio.wait_for(self._atualizado.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _notificar(self) -> None:
+        async with self._atualizado:
+            self._atualizado.notify_all()
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job_id = await asyncio.to_thread(self.store.claim_next, self.owner, self.lease)
+            except Exception as e:
+                logger.error(f"Erro ao buscar jobs: {e}")
+                job_id = None
+            if job_id is None:
+                self._novo_job.clear()
+                try:
+                    await asyncio.wait_for(self._novo_job.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._executando.add(job_id)
+            try:
+                await self._executar(job_id)
+            finally:
+                self._executando.discard(job_id)
+                self._cancelados.discard(job_id)
+
+    async def _executar(self, job_id: str) -> None:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job["status"] == "cancelled":
+            # Cancelado entre a reserva e o início da execução
+            return
+        linhas = await asyncio.to_thread(self.store.pending_rows, job_id)
+        logger.info(f"Job {job_id}: {len(linhas)} linhas pendentes")
+        fila: asyncio.Queue = asyncio.Queue()
+        for linha in linhas:
+            fila.put_nowait(linha)
+        ativo = True
+
+        def continuar() -> bool:
+            return ativo and job_id not in self._cancelados
+
+        async def processar(linha: Dict[str, Any]) -> None:
+            espera = self.retry_base
+            while continuar():
+                try:
+                    resultado = await self.processor(job, linha)
+                except JobRowRetry as e:
+                    logger.warning(f"Job {job_id}, linha {linha['idx']}: {e} Nova tentativa em {espera:.0f}s.")
+                    await asyncio.sleep(espera)
+                    espera = min(self.retry_max, espera * 2)
+                    continue
+                except Exception as e:
+                    resultado = {"success": False, "error": str(e)}
+                await asyncio.to_thread(self.store.finish_row, job_id, linha["idx"], resultado)
+                await self._notificar()
+                return
+
+        async def trabalhador() -> None:
+            # Poucos trabalhadores puxando da fila, em vez de uma corrotina por linha
+            while continuar() and not fila.empty():
+                await processar(fila.get_nowait())
+
+        async def renovar() -> None:
+            nonlocal ativo
+            while ativo:
+                await asyncio.sleep(self.lease / 3)
+                if not await asyncio.to_thread(self.store.renew, job_id, self.owner, self.lease):
+                    # Cancelado (ou assumido por outro worker): para de pegar linhas novas
+                    ativo = False
+
+        renovacao = asyncio.create_task(renovar())
+        try:
+            await asyncio.gather(*(trabalhador() for _ in range(min(self.row_concurrency, len(linhas)))))
+            if ativo and job_id not in self._cancelados:
+                await asyncio.to_thread(self.store.set_status, job_id, "completed", None, self.owner)
+        except asyncio.CancelledError:
+            # Encerramento do serviço: devolve o job à fila; as linhas já gravadas não são refeitas
+            self.store.set_status(job_id, "queued", None, self.owner)
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} falhou: {e}")
+            await asyncio.to_thread(self.store.set_status, job_id, "failed", str(e), self.owner)
+        finally:
+            ativo = False
+            renovacao.cancel()
+            await self._notificar()
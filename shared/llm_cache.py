@@ -0,0 +1,258 @@
+# llm_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+from shared.telemetry import metrics, record_llm_usage, span
+from shared.upstream import UpstreamGuard, get_upstream
+
+
+class LLMCache:
+    """
+    Cache de respostas de LLM: LRU em memória limitado por número de entradas,
+    com um SQLite opcional compartilhado entre os serviços. Cada entrada
+    guarda o seu próprio TTL, então cada agente pode usar um prazo diferente.
+    """
+
+    def __init__(self, max_entries: int = 2_000, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self._memoria: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if db_path:
+            # WAL permite que os quatro serviços leiam e escrevam no mesmo arquivo
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, output TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        agora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(key)
+            if entrada is not None:
+                expires_at, output = entrada
+                if expires_at > agora:
+                    self._memoria.move_to_end(key)
+                    self.hits += 1
+                    return output
+                del self._memoria[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT output, expires_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > agora:
+                    self._guardar_memoria(key, row[1], row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, output: str, ttl: float) -> None:
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._guardar_memoria(key, expires_at, output)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, output, expires_at) VALUES (?, ?, ?)",
+                    (key, output, expires_at),
+                )
+                self._db.commit()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "entries": len(self._memoria),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "persistent": self._db is not None,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _guardar_memoria(self, key: str, expires_at: float, output: str) -> None:
+        self._memoria[key] = (expires_at, output)
+        self._memoria.move_to_end(key)
+        while len(self._memoria) > self.max_entries:
+            self._memoria.popitem(last=False)
+            self.evictions += 1
+
+
+_llm_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> LLMCache:
+    """Instância única por processo, configurada por LLM_CACHE_MAX_ENTRIES e LLM_CACHE_DB."""
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMCache(
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000")),
+            db_path=os.getenv("LLM_CACHE_DB") or None,
+        )
+    return _llm_cache
+
+
+# Modelos que já receberam a chamada de warm-up neste processo (o pool de conexões é compartilhado)
+_modelos_aquecidos: Set[str] = set()
+
+
+def _uso(resultado) -> object:
+    """``usage`` do resultado do pydantic-ai: método no 1.x, propriedade no 2.x."""
+    uso = getattr(resultado, "usage", None)
+    return uso() if callable(uso) else uso
+
+
+@dataclass
+class CachedRunResult:
+    """Resultado de ``CachedAgent.run``: a saída do modelo e se veio do cache."""
+    output: str
+    cached: bool
+
+
+class _CachedStream:
+    """Imita o ``stream_text`` do pydantic-ai para respostas vindas do cache."""
+
+    def __init__(self, output: str):
+        self.cached = True
+        self._output = output
+
+    async def stream_text(self, delta: bool = False) -> AsyncIterator[str]:
+        yield self._output
+
+
+class _RecordingStream:
+    """Repassa o stream do modelo e guarda o texto completo no cache ao final."""
+
+    def __init__(self, stream, salvar, agent_name: str):
+        self.cached = False
+        self._stream = stream
+        self._salvar = salvar
+        self._agent_name = agent_name
+
+    async def stream_text(self, delta: bool = False) -> AsyncIterator[str]:
+        partes = []
+        with span("llm_stream", agent=self._agent_name) as attrs:
+            async for parte in self._stream.stream_text(delta=True):
+                partes.append(parte)
+                yield parte
+            attrs.update(record_llm_usage(self._agent_name, _uso(self._stream)))
+        self._salvar("".join(partes))
+
+
+class CachedAgent:
+    """
+    Envolve um ``Agent`` do pydantic-ai com o ``LLMCache``. A chave combina o
+    modelo, as instruções e o prompt normalizado; ``run`` e ``run_stream``
+    seguem a interface do ``Agent``. As chamadas ao modelo passam pelo
+    upstream ``openai`` (limites e retry); o stream só ocupa a vaga, sem retry.
+
+    O ``Agent`` (e o import do pydantic-ai, que pesa no startup) só é criado
+    no primeiro uso ou no ``warm_up``.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        instructions: Optional[str] = None,
+        *,
+        name: str,
+        ttl: Optional[float] = None,
+        cache: Optional[LLMCache] = None,
+        upstream: Optional[UpstreamGuard] = None,
+    ):
+        self.model = model
+        self.instructions = instructions or ""
+        self.name = name
+        self.ttl = ttl if ttl is not None else float(
+            os.getenv(f"LLM_CACHE_TTL_{name.upper()}", os.getenv("LLM_CACHE_TTL", "3600"))
+        )
+        self.enabled = os.getenv("LLM_CACHE_ENABLED", "1") != "0" and self.ttl > 0
+        self.cache = cache or get_llm_cache()
+        self.upstream = upstream or get_upstream("openai", max_concurrency=16, max_wait=10.0, retries=2)
+        self._agent = None
+
+    @property
+    def agent(self):
+        if self._agent is None:
+            from pydantic_ai import Agent
+
+            self._agent = Agent(self.model, instructions=self.instructions) if self.instructions else Agent(self.model)
+        return self._agent
+
+    @agent.setter
+    def agent(self, agent) -> None:
+        self._agent = agent
+
+    async def warm_up(self, llm: bool = True) -> None:
+        """
+        Cria o ``Agent`` e, com ``llm``, faz uma chamada mínima ao modelo (fora do
+        cache) para abrir a conexão com o provedor; uma vez por modelo no processo.
+        """
+        agent = self.agent
+        if not llm or self.model in _modelos_aquecidos:
+            return
+        with span("llm_warmup", agent=self.name) as attrs:
+            result = await self.upstream.call(lambda: agent.run("Responda apenas: ok"))
+            attrs.update(record_llm_usage(self.name, _uso(result)))
+        # Só depois do sucesso: um erro passageiro no startup deixa o modelo para a próxima tentativa
+        _modelos_aquecidos.add(self.model)
+
+    def cache_key(self, prompt: str) -> str:
+        normalizado = " ".join(prompt.split())
+        bruto = json.dumps([self.model, self.instructions, normalizado], ensure_ascii=False)
+        return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+    async def run(self, prompt: str) -> CachedRunResult:
+        if self.enabled:
+            key = self.cache_key(prompt)
+            output = self.cache.get(key)
+            metrics.inc("llm_cache_requests_total", agent=self.name, result="hit" if output is not None else "miss")
+            if output is not None:
+                return CachedRunResult(output=output, cached=True)
+        with span("llm", agent=self.name) as attrs:
+            result = await self.upstream.call(lambda: self.agent.run(prompt))
+            attrs.update(record_llm_usage(self.name, _uso(result)))
+        if self.enabled:
+            self.cache.set(key, result.output, self.ttl)
+        return CachedRunResult(output=result.output, cached=False)
+
+    @asynccontextmanager
+    async def run_stream(self, prompt: str):
+        if not self.enabled:
+            async with self.upstream.slot(), self.agent.run_stream(prompt) as stream:
+                yield _RecordingStream(stream, lambda texto: None, self.name)
+            return
+        key = self.cache_key(prompt)
+        output = self.cache.get(key)
+        metrics.inc("llm_cache_requests_total", agent=self.name, result="hit" if output is not None else "miss")
+        if output is not None:
+            yield _CachedStream(output)
+            return
+        async with self.upstream.slot(), self.agent.run_stream(prompt) as stream:
+            yield _RecordingStream(stream, lambda texto: self.cache.set(key, texto, self.ttl), self.name)
@@ -0,0 +1,230 @@
+# local_router.py
+import math
+import re
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from schemas.schemas import AgentCard
+
+CEP_PATTERN = re.compile(r"\b\d{5}-?\d{3}\b")
+
+# Palavras de intenção (palavras inteiras, já sem acento) que complementam os termos citados
+# entre aspas nos cartões; as flexões são listadas para não depender de radicais ambíguos
+INTENT_KEYWORDS: Dict[str, List[str]] = {
+    "consult_specialist_v1": [
+        "consultar", "consulte", "consulta", "consultas", "verificar", "verifique", "verifica",
+        "buscar", "busque", "busca", "checar", "cheque", "checa",
+    ],
+    "analysis_specialist_v1": [
+        "analisar", "analise", "analisa", "analises", "detalhar", "detalhe", "detalhes", "detalhada",
+        "detalhado", "insight", "insights", "regiao", "caracteristica", "caracteristicas",
+    ],
+}
+
+# Palavras que podem separar duas intenções ligadas explicitamente ("consulte e analise",
+# "consulte o CEP A e analise o CEP B"); a ligação exige "e" ou vírgula entre elas
+CONECTIVOS = {",", "e", "tambem", "depois", "entao", "ainda", "o", "a", "os", "as", "cep", "ceps", "do", "da", "dos", "das", "de"}
+
+
+# Sub-tarefa enviada a cada especialista quando a mensagem vira um plano (vários CEPs/intenções)
+SUBTASK_TEMPLATES: Dict[str, str] = {
+    "consult_specialist_v1": "Consulte o CEP {cep}",
+    "analysis_specialist_v1": "Faça uma análise detalhada do endereço do CEP {cep}",
+}
+
+
+class RoutingDecision(BaseModel):
+    """Resultado do roteamento: o agente escolhido (ou None) e quem decidiu."""
+    agent_id: Optional[str]
+    router: str
+    confidence: float = 1.0
+
+
+class PlanStep(BaseModel):
+    """Um ramo do plano: o especialista e a sub-tarefa sobre um CEP."""
+    agent_id: str
+    cep: str
+    message: str
+
+
+class ExecutionPlan(BaseModel):
+    """Pares (especialista, sub-tarefa) executados em paralelo pelo coordenador."""
+    steps: List[PlanStep]
+    truncated: bool = False
+
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas, sem acentos e com espaços colapsados."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.split())
+
+
+def _palavras(texto: str) -> List[str]:
+    """Palavras do texto normalizado; a vírgula vira um token para marcar intenções ligadas."""
+    return re.findall(r"\w+|,", CEP_PATTERN.sub(" cep ", texto))
+
+
+def _ngramas(texto: str, n: int = 3) -> Counter:
+    texto = f" {texto} "
+    return Counter(texto[i:i + n] for i in range(len(texto) - n + 1))
+
+
+class LocalRouter:
+    """
+    Roteador local que pontua a mensagem contra os ``AgentCard`` descobertos
+    usando palavras de intenção, o padrão de CEP e similaridade TF-IDF de
+    n-gramas de caracteres. Só decide quando a confiança é alta; caso
+    contrário devolve ``None`` para que o coordenador consulte o LLM.
+    """
+
+    def __init__(self, threshold: float = 0.75, cache_size: int = 2048):
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self._cards: List[AgentCard] = []
+        self._assinatura: Tuple[Tuple[str, str], ...] = ()
+        self._palavras: Dict[str, set] = {}
+        self._vetores: Dict[str, Dict[str, float]] = {}
+        self._idf: Dict[str, float] = {}
+        self._cache: "OrderedDict[str, RoutingDecision]" = OrderedDict()
+
+    def update_agents(self, cards: List[AgentCard]) -> None:
+        """Recalcula os perfis sempre que os agentes ou o conteúdo dos cartões mudam."""
+        # O id sozinho não basta: um heartbeat pode trazer o mesmo agente com outra descrição
+        assinatura = tuple((c.agent_id, c.description) for c in cards)
+        if assinatura == self._assinatura:
+            return
+        self._assinatura = assinatura
+        self._cards = list(cards)
+        self._cache.clear()
+
+        docs = {card.agent_id: _ngramas(normalizar_texto(card.description)) for card in cards}
+        df: Counter = Counter()
+        for ngramas in docs.values():
+            df.update(ngramas.keys())
+        total = len(docs)
+        self._idf = {g: math.log((1 + total) / (1 + n)) + 1 for g, n in df.items()}
+        self._vetores = {agent_id: self._tfidf(ngramas) for agent_id, ngramas in docs.items()}
+
+        self._palavras = {}
+        for card in cards:
+            citadas = re.findall(r"'([^']+)'", normalizar_texto(card.description))
+            self._palavras[card.agent_id] = set(citadas + INTENT_KEYWORDS.get(card.agent_id, []))
+
+    def chave(self, message: str) -> str:
+        """Mensagem normalizada, com o CEP substituído para reaproveitar decisões."""
+        return CEP_PATTERN.sub("<cep>", normalizar_texto(message))
+
+    def cached(self, message: str) -> Optional[RoutingDecision]:
+        """Decisão já tomada para uma mensagem equivalente, marcada como vinda do cache."""
+        chave = self.chave(message)
+        decisao = self._cache.get(chave)
+        if decisao is None:
+            return None
+        self._cache.move_to_end(chave)
+        return decisao.model_copy(update={"router": f"cache:{decisao.router}"})
+
+    def remember(self, message: str, decisao: RoutingDecision) -> None:
+        chave = self.chave(message)
+        self._cache[chave] = decisao
+        self._cache.move_to_end(chave)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def route(self, message: str) -> Optional[RoutingDecision]:
+        """Retorna a decisão local ou None quando a mensagem é ambígua."""
+        if not self._cards or not CEP_PATTERN.search(message):
+            # Sem CEP nenhum especialista consegue trabalhar; o LLM decide (ou responde)
+            return None
+
+        pontuacoes = self._pontuar(normalizar_texto(message))
+        melhor, acertos, agent_id = pontuacoes[0]
+        segundo = pontuacoes[1][0] if len(pontuacoes) > 1 else 0.0
+        if acertos == 0:
+            return None
+        confianca = melhor / (melhor + segundo) if melhor + segundo else 0.0
+        if confianca < self.threshold:
+            return None
+        return RoutingDecision(agent_id=agent_id, router="local", confidence=round(confianca, 3))
+
+    def _pontuar(self, texto: str) -> List[Tuple[float, int, str]]:
+        """(acertos + similaridade, acertos, agent_id) por agente, do melhor para o pior."""
+        palavras_msg = set(_palavras(texto))
+        vetor_msg = self._tfidf(_ngramas(texto))
+        pontuacoes: List[Tuple[float, int, str]] = []
+        for card in self._cards:
+            acertos = len(palavras_msg & self._palavras.get(card.agent_id, set()))
+            similaridade = self._cosseno(vetor_msg, self._vetores.get(card.agent_id, {}))
+            pontuacoes.append((acertos + similaridade, acertos, card.agent_id))
+        pontuacoes.sort(reverse=True)
+        return pontuacoes
+
+    def intents(self, message: str) -> List[str]:
+        """
+        Agentes pedidos na mensagem, na ordem dos cartões. Vários agentes só
+        quando as intenções estão ligadas explicitamente ("consulte e analise");
+        se não, a mensagem vai para o agente de maior pontuação.
+        """
+        texto = normalizar_texto(message)
+        palavras_msg = set(_palavras(texto))
+        agentes = [card.agent_id for card in self._cards if palavras_msg & self._palavras.get(card.agent_id, set())]
+        if len(agentes) > 1 and not self._intencoes_ligadas(texto):
+            return [next(agent_id for _, acertos, agent_id in self._pontuar(texto) if acertos)]
+        return agentes
+
+    def _intencoes_ligadas(self, texto: str) -> bool:
+        """Há duas palavras de intenção de agentes diferentes separadas só por conectivos, com "e" ou vírgula."""
+        ultima: Optional[Tuple[str, List[str]]] = None
+        for palavra in _palavras(texto):
+            dono = next((agent_id for agent_id, palavras in self._palavras.items() if palavra in palavras), None)
+            if dono is not None:
+                if ultima is not None and ultima[0] != dono and ({"e", ","} & set(ultima[1])):
+                    return True
+                ultima = (dono, [])
+            elif ultima is not None:
+                if palavra in CONECTIVOS:
+                    ultima[1].append(palavra)
+                else:
+                    ultima = None
+        return False
+
+    def plan(
+        self, message: str, fallback_agent_id: Optional[str] = None, max_steps: int = 8
+    ) -> Optional[ExecutionPlan]:
+        """
+        Quebra pedidos compostos ("consulte e analise os CEPs A e B") em um ramo por
+        CEP e intenção. Retorna None quando a mensagem cabe em um único especialista.
+        Sem palavras de intenção, todos os CEPs vão para ``fallback_agent_id``.
+        """
+        ceps = list(dict.fromkeys(
+            f"{digitos[:5]}-{digitos[5:]}"
+            for digitos in ("".join(filter(str.isdigit, c)) for c in CEP_PATTERN.findall(message))
+        ))
+        agentes = self.intents(message) or ([fallback_agent_id] if fallback_agent_id else [])
+        if not ceps or not agentes or len(ceps) * len(agentes) < 2:
+            return None
+        resto = " ".join(CEP_PATTERN.sub(" ", message).split())
+        steps = [
+            PlanStep(
+                agent_id=agent_id,
+                cep=cep,
+                message=SUBTASK_TEMPLATES[agent_id].format(cep=cep) if agent_id in SUBTASK_TEMPLATES else f"{resto} (CEP {cep})",
+            )
+            for cep in ceps
+            for agent_id in agentes
+        ]
+        return ExecutionPlan(steps=steps[:max_steps], truncated=len(steps) > max_steps)
+
+    def _tfidf(self, ngramas: Counter) -> Dict[str, float]:
+        vetor = {g: n * self._idf.get(g, 0.0) for g, n in ngramas.items()}
+        norma = math.sqrt(sum(v * v for v in vetor.values())) or 1.0
+        return {g: v / norma for g, v in vetor.items() if v}
+
+    @staticmethod
+    def _cosseno(a: Dict[str, float], b: Dict[str, float]) -> float:
+        if len(a) > len(b):
+            a, b = b, a
+        return sum(v * b.get(g, 0.0) for g, v in a.items())
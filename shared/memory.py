@@ -0,0 +1,150 @@
+# memory.py
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from shared.local_router import CEP_PATTERN
+
+# Recebe o resumo atual e os turnos que saíram da janela; devolve o novo resumo
+Summarizer = Callable[[str, List["Turn"]], Awaitable[str]]
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimativa barata (~4 caracteres por token), suficiente para o orçamento da memória."""
+    return len(texto) // 4 + 1
+
+
+@dataclass
+class Turn:
+    role: str
+    content: str
+
+    @property
+    def tokens(self) -> int:
+        return estimar_tokens(self.content)
+
+
+async def resumo_extrativo(resumo: str, turnos: List[Turn], limite: int = 1200) -> str:
+    """Resumo sem LLM: guarda o início de cada turno antigo e corta o total pelo limite de caracteres."""
+    linhas = [resumo] if resumo else []
+    for turno in turnos:
+        texto = " ".join(turno.content.split())
+        linhas.append(f"{'Usuário' if turno.role == 'user' else 'Assistente'}: {texto[:160]}")
+    return "\n".join(linhas)[-limite:]
+
+
+@dataclass
+class ConversationSession:
+    """Memória de uma conversa: resumo dos turnos antigos, turnos recentes literais e o último CEP."""
+    session_id: str
+    summary: str = ""
+    turns: Deque[Turn] = field(default_factory=deque)
+    last_cep: Optional[str] = None
+    updated_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def tokens(self) -> int:
+        return estimar_tokens(self.summary) + sum(turno.tokens for turno in self.turns)
+
+    def context(self) -> Dict[str, Any]:
+        """Contexto repassado aos especialistas."""
+        return {
+            "session_id": self.session_id,
+            "cep": self.last_cep,
+            "summary": self.summary,
+            "history": [{"role": t.role, "content": t.content} for t in self.turns],
+        }
+
+
+class ConversationStore:
+    """
+    Memória de conversas no servidor, por ``session_id``. Cada sessão tem um
+    orçamento de tokens: quando ele estoura, os turnos mais antigos são
+    incorporados ao resumo e os ``min_recent_turns`` mais novos ficam literais.
+    Sessões são removidas por LRU (``max_sessions``) e por inatividade (``ttl``).
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 1500,
+        min_recent_turns: int = 4,
+        max_sessions: int = 1000,
+        ttl: float = 3600.0,
+        summarizer: Optional[Summarizer] = None,
+    ):
+        self.max_tokens = max_tokens
+        self.min_recent_turns = min_recent_turns
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.summarizer = summarizer or resumo_extrativo
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+
+    def get(self, session_id: Optional[str]) -> ConversationSession:
+        """Retorna a sessão (criando uma nova, com id gerado, se necessário)."""
+        self._expirar()
+        if session_id and session_id in self._sessions:
+            sessao = self._sessions[session_id]
+            self._sessions.move_to_end(session_id)
+        else:
+            sessao = ConversationSession(session_id=session_id or uuid.uuid4().hex)
+            self._sessions[sessao.session_id] = sessao
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        sessao.updated_at = time.monotonic()
+        return sessao
+
+    async def add_turn(self, sessao: ConversationSession, role: str, content: str) -> None:
+        sessao.turns.append(Turn(role=role, content=content))
+        if role == "user":
+            ceps = CEP_PATTERN.findall(content)
+            if ceps:
+                sessao.last_cep = ceps[-1]
+        sessao.updated_at = time.monotonic()
+        await self._compactar(sessao)
+
+    async def _compactar(self, sessao: ConversationSession) -> None:
+        antigos: List[Turn] = []
+        while sessao.tokens > self.max_tokens and len(sessao.turns) > self.min_recent_turns:
+            antigos.append(sessao.turns.popleft())
+        if antigos:
+            sessao.summary = await self.summarizer(sessao.summary, antigos)
+
+    def _expirar(self) -> None:
+        limite = time.monotonic() - self.ttl
+        while self._sessions:
+            sessao = next(iter(self._sessions.values()))
+            if sessao.updated_at >= limite:
+                break
+            self._sessions.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+def resultado_cep_do_contexto(context: Optional[Dict[str, Any]], cep: str) -> Optional[Dict[str, Any]]:
+    """
+    ``ToolResult`` de ``mcp:consultar_cep`` que o coordenador já buscou e mandou
+    em ``context["cep_result"]``, se for do mesmo CEP; evita uma nova consulta.
+    """
+    resultado = (context or {}).get("cep_result")
+    if not resultado:
+        return None
+    digitos = "".join(filter(str.isdigit, cep))
+    if "".join(filter(str.isdigit, str(resultado.get("input", "")))) != digitos:
+        return None
+    return resultado
+
+
+def contexto_para_prompt(context: Optional[Dict[str, Any]], max_turnos: int = 4) -> str:
+    """Trecho de prompt com o resumo e os últimos turnos recebidos do coordenador."""
+    if not context or not (context.get("summary") or context.get("history")):
+        return ""
+    linhas = ["", "", "Contexto da conversa:"]
+    if context.get("summary"):
+        linhas.append(f"Resumo: {context['summary']}")
+    for turno in (context.get("history") or [])[-max_turnos:]:
+        papel = "Usuário" if turno.get("role") == "user" else "Assistente"
+        linhas.append(f"{papel}: {' '.join(str(turno.get('content', '')).split())[:300]}")
+    return "\n".join(linhas)
@@ -0,0 +1,161 @@
+# registry.py
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from schemas.schemas import AgentCard
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RegistryEntry:
+    """Um especialista registrado: onde ele atende, o cartão e o último heartbeat."""
+    base_url: str
+    card: AgentCard
+    last_heartbeat: float
+
+
+class MemoryAgentRegistry:
+    """
+    Registro local (um processo só, ex.: modo sociedade). Mesma interface do
+    ``SqliteAgentRegistry``, que é o que permite vários workers e máquinas
+    compartilharem a mesma visão dos especialistas.
+    """
+
+    def __init__(self):
+        self._entradas: Dict[str, RegistryEntry] = {}
+        self._lock = threading.Lock()
+
+    def register(self, base_url: str, card: AgentCard) -> None:
+        """Cadastra ou atualiza a réplica; também serve de heartbeat."""
+        with self._lock:
+            self._entradas[base_url] = RegistryEntry(base_url, card, time.time())
+
+    def heartbeat(self, base_url: str) -> bool:
+        with self._lock:
+            entrada = self._entradas.get(base_url)
+            if entrada is None:
+                return False
+            entrada.last_heartbeat = time.time()
+            return True
+
+    def unregister(self, base_url: str) -> None:
+        with self._lock:
+            self._entradas.pop(base_url, None)
+
+    def entries(self, max_age: Optional[float] = None) -> List[RegistryEntry]:
+        """Réplicas com heartbeat nos últimos ``max_age`` segundos (todas, se ``None``)."""
+        limite = time.time() - max_age if max_age is not None else 0.0
+        with self._lock:
+            return [e for e in self._entradas.values() if e.last_heartbeat >= limite]
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteAgentRegistry:
+    """Registro compartilhado em um arquivo SQLite (WAL), seguro para vários processos."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS agents ("
+            "base_url TEXT PRIMARY KEY, agent_id TEXT NOT NULL, card TEXT NOT NULL, last_heartbeat REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def register(self, base_url: str, card: AgentCard) -> None:
+        """Cadastra ou atualiza a réplica; também serve de heartbeat."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO agents (base_url, agent_id, card, last_heartbeat) VALUES (?, ?, ?, ?)",
+                (base_url, card.agent_id, card.model_dump_json(), time.time()),
+            )
+            self._db.commit()
+
+    def heartbeat(self, base_url: str) -> bool:
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE agents SET last_heartbeat = ? WHERE base_url = ?", (time.time(), base_url)
+            )
+            self._db.commit()
+            return cursor.rowcount > 0
+
+    def unregister(self, base_url: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM agents WHERE base_url = ?", (base_url,))
+            self._db.commit()
+
+    def entries(self, max_age: Optional[float] = None) -> List[RegistryEntry]:
+        """Réplicas com heartbeat nos últimos ``max_age`` segundos (todas, se ``None``)."""
+        limite = time.time() - max_age if max_age is not None else 0.0
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT base_url, card, last_heartbeat FROM agents WHERE last_heartbeat >= ?", (limite,)
+            ).fetchall()
+        return [RegistryEntry(url, AgentCard(**json.loads(card)), visto) for url, card, visto in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_registry = None
+
+
+def get_agent_registry():
+    """
+    Instância única por processo: ``SqliteAgentRegistry`` quando ``AGENT_REGISTRY_DB``
+    está definido, senão o ``MemoryAgentRegistry`` local.
+    """
+    global _registry
+    if _registry is None:
+        db_path = os.getenv("AGENT_REGISTRY_DB")
+        _registry = SqliteAgentRegistry(db_path) if db_path else MemoryAgentRegistry()
+    return _registry
+
+
+class AgentHeartbeat:
+    """Registra o cartão de um especialista no startup e renova o heartbeat em segundo plano."""
+
+    def __init__(self, registry, base_url: str, card: AgentCard, interval: float = 5.0):
+        self.registry = registry
+        self.base_url = base_url.rstrip("/")
+        self.card = card
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self.registry.register, self.base_url, self.card)
+        logger.info(f"Agente '{self.card.name}' registrado em {self.base_url}")
+        self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # Com vários workers, um deles pode ter removido o registro ao encerrar
+                if not await asyncio.to_thread(self.registry.heartbeat, self.base_url):
+                    await asyncio.to_thread(self.registry.register, self.base_url, self.card)
+            except Exception as e:
+                logger.error(f"Erro ao enviar heartbeat de '{self.card.name}': {e}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.registry.unregister, self.base_url)
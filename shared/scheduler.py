@@ -0,0 +1,186 @@
+# scheduler.py
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from shared.deadline import DeadlineExceeded, remaining
+from shared.telemetry import metrics, record_timing
+from shared.upstream import UpstreamOverloaded
+
+# Configuração de uma classe sem entrada própria em ``classes``
+DEFAULT_CLASS = {"priority": 0, "weight": 1.0, "concurrency": 8, "max_queue": 100}
+
+
+class _Classe:
+    """Estado de uma classe de trabalho: pool próprio, fila FIFO e tempo virtual do fair sharing."""
+
+    def __init__(
+        self, name: str, label: str, priority: int, weight: float, concurrency: int, max_queue: int, max_wait: float
+    ):
+        self.name = name
+        self.label = label
+        self.priority = priority
+        self.weight = max(0.01, weight)
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.fila: deque = deque()
+        self.em_uso = 0
+        self.vtime = 0.0
+        self.esperas: deque = deque(maxlen=500)
+
+    def p95_espera(self) -> float:
+        if not self.esperas:
+            return 0.0
+        ordenadas = sorted(self.esperas)
+        return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))]
+
+
+class PriorityScheduler:
+    """
+    Escalonador das chamadas do coordenador aos especialistas. Cada classe
+    (um ``agent_id``, ou ``jobs`` para o processamento em lote) tem o seu pool
+    de concorrência e a sua fila, e todas dividem um limite global.
+
+    Quando uma vaga global abre, ela vai para a classe de maior ``priority``
+    com fila e com vaga no próprio pool; entre classes de mesma prioridade, a
+    divisão é proporcional ao ``weight`` (fair queuing por tempo virtual). Uma
+    fila acima de ``max_queue`` recusa na hora com ``UpstreamOverloaded`` (503),
+    e a espera na fila nunca passa do ``max_wait`` da classe nem do prazo da
+    requisição.
+
+    Os parâmetros de cada classe podem ser sobrescritos por
+    ``SCHED_<CLASSE>_<PARAMETRO>`` (ex.: ``SCHED_ANALYSIS_SPECIALIST_V1_CONCURRENCY``).
+    """
+
+    def __init__(self, max_concurrency: int, max_wait: float, classes: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_wait = max_wait
+        self._config = classes or {}
+        self._classes: Dict[str, _Classe] = {}
+        self.em_uso = 0
+        # Tempo virtual da última vaga concedida: classes que voltam a ter fila partem dele
+        self._virtual = 0.0
+
+    def _classe(self, name: str, label: Optional[str] = None) -> _Classe:
+        classe = self._classes.get(name)
+        if classe is None:
+            config: Dict[str, Any] = {**DEFAULT_CLASS, "max_wait": self.max_wait, **self._config.get(name, {})}
+            prefixo = "SCHED_" + re.sub(r"[^A-Z0-9]", "_", name.upper())
+            for parametro, tipo in (
+                ("priority", int), ("weight", float), ("concurrency", int), ("max_queue", int), ("max_wait", float),
+            ):
+                valor = os.getenv(f"{prefixo}_{parametro.upper()}")
+                if valor:
+                    config[parametro] = tipo(valor)
+            classe = self._classes[name] = _Classe(name, label or name, **config)
+        return classe
+
+    # ✅ Admissão
+    @asynccontextmanager
+    async def slot(self, name: str, label: Optional[str] = None):
+        """Reserva uma vaga da classe ``name``; ``label`` é o nome exibido no erro de sobrecarga."""
+        classe = self._classe(name, label)
+        inicio = time.perf_counter()
+        if not classe.fila and classe.em_uso < classe.concurrency and self.em_uso < self.max_concurrency:
+            self._ocupar(classe)
+        else:
+            await self._esperar(classe)
+        espera = time.perf_counter() - inicio
+        classe.esperas.append(espera)
+        metrics.observe("scheduler_wait_seconds", espera, queue=name)
+        if espera > 0.001:
+            record_timing("queue", espera, name)
+        try:
+            yield
+        finally:
+            classe.em_uso -= 1
+            self.em_uso -= 1
+            self._despachar()
+
+    async def _esperar(self, classe: _Classe) -> None:
+        if len(classe.fila) >= classe.max_queue:
+            metrics.inc("scheduler_requests_total", queue=classe.name, result="shed")
+            raise UpstreamOverloaded(classe.label, retry_after=max(1.0, classe.p95_espera()))
+        espera = classe.max_wait
+        prazo = remaining()
+        if prazo is not None:
+            espera = min(espera, max(0.0, prazo))
+        if not classe.fila:
+            # A classe estava parada: não acumula crédito de quando ninguém a usava
+            classe.vtime = max(classe.vtime, self._virtual)
+        vaga = asyncio.get_running_loop().create_future()
+        classe.fila.append(vaga)
+        try:
+            await asyncio.wait({vaga}, timeout=espera)
+        except asyncio.CancelledError:
+            self._desistir(classe, vaga)
+            raise
+        if vaga.done():
+            return
+        self._desistir(classe, vaga)
+        metrics.inc("scheduler_requests_total", queue=classe.name, result="timeout")
+        if prazo is not None and prazo <= classe.max_wait:
+            raise DeadlineExceeded()
+        raise UpstreamOverloaded(classe.label, retry_after=max(1.0, classe.p95_espera()))
+
+    def _desistir(self, classe: _Classe, vaga: asyncio.Future) -> None:
+        if vaga.done() and not vaga.cancelled():
+            # A vaga foi concedida no mesmo instante em que o chamador desistiu: devolve
+            classe.em_uso -= 1
+            self.em_uso -= 1
+            self._despachar()
+            return
+        vaga.cancel()
+        try:
+            classe.fila.remove(vaga)
+        except ValueError:
+            pass
+
+    # ✅ Despacho: prioridade estrita entre níveis, fair sharing ponderado dentro de cada nível
+    def _ocupar(self, classe: _Classe) -> None:
+        classe.em_uso += 1
+        self.em_uso += 1
+        self._virtual = classe.vtime
+        classe.vtime += 1.0 / classe.weight
+        metrics.inc("scheduler_requests_total", queue=classe.name, result="admitted")
+
+    def _despachar(self) -> None:
+        while self.em_uso < self.max_concurrency:
+            candidatas = [c for c in self._classes.values() if c.fila and c.em_uso < c.concurrency]
+            if not candidatas:
+                return
+            classe = min(candidatas, key=lambda c: (-c.priority, c.vtime))
+            vaga = classe.fila.popleft()
+            if vaga.done():
+                continue
+            self._ocupar(classe)
+            vaga.set_result(None)
+
+    def stats(self) -> Dict[str, float]:
+        """Gauges por classe (fila, vagas em uso, p95 da espera), no formato de ``register_collector``."""
+        gauges: Dict[str, float] = {"scheduler_in_use": self.em_uso, "scheduler_max_concurrency": self.max_concurrency}
+        for classe in self._classes.values():
+            prefixo = f"scheduler_{re.sub(r'[^a-z0-9]', '_', classe.name.lower())}"
+            gauges[f"{prefixo}_queue_depth"] = len(classe.fila)
+            gauges[f"{prefixo}_in_use"] = classe.em_uso
+            gauges[f"{prefixo}_wait_p95_seconds"] = classe.p95_espera()
+        return gauges
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            classe.name: {
+                "priority": classe.priority,
+                "weight": classe.weight,
+                "concurrency": classe.concurrency,
+                "in_use": classe.em_uso,
+                "queue_depth": len(classe.fila),
+                "max_queue": classe.max_queue,
+                "wait_p95_ms": round(classe.p95_espera() * 1000, 1),
+            }
+            for classe in self._classes.values()
+        }
@@ -0,0 +1,51 @@
+# single_flight.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from shared.deadline import detached, run_with_deadline
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas concorrentes idênticas: enquanto uma tarefa para a mesma
+    chave estiver em andamento, as chamadas seguintes aguardam o mesmo resultado
+    em vez de repetir o trabalho.
+
+    Cada chamador aguarda a tarefa através de ``asyncio.shield`` e dentro do
+    próprio prazo, então o cancelamento de um chamador não interrompe o trabalho
+    para os demais; quando o último desiste, a tarefa é cancelada.
+    """
+
+    def __init__(self):
+        self._em_andamento: Dict[Hashable, asyncio.Task] = {}
+        self._chamadores: Dict[asyncio.Task, int] = {}
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._em_andamento.get(key)
+        if task is None:
+            # O trabalho é compartilhado: não herda o prazo de quem chegou primeiro
+            task = asyncio.ensure_future(detached(factory()))
+            self._em_andamento[key] = task
+            task.add_done_callback(lambda t, k=key: self._finalizar(k, t))
+        else:
+            self.coalesced += 1
+        self._chamadores[task] = self._chamadores.get(task, 0) + 1
+        try:
+            return await run_with_deadline(asyncio.shield(task))
+        finally:
+            self._chamadores[task] -= 1
+            if not self._chamadores[task]:
+                del self._chamadores[task]
+                if not task.done():
+                    task.cancel()
+
+    def in_flight(self) -> int:
+        return len(self._em_andamento)
+
+    def _finalizar(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._em_andamento.get(key) is task:
+            del self._em_andamento[key]
+        # Evita o aviso "exception was never retrieved" quando todos os chamadores foram cancelados
+        if not task.cancelled():
+            task.exception()
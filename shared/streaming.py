@@ -0,0 +1,75 @@
+# streaming.py
+import json
+from typing import Any, AsyncIterator, Dict
+
+import httpx
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from shared.llm_cache import CachedAgent
+
+# Formato dos eventos trocados entre os serviços (Server-Sent Events):
+#   {"type": "meta", ...}                       informações sobre quem está respondendo
+#   {"type": "delta", "text": "..."}            pedaço de texto da resposta
+#   {"type": "done", "success": bool, ...}      fim da resposta (``cached`` indica resposta do cache de LLM;
+#                                               ``error`` traz o motivo quando ``success`` é false)
+SSE_MEDIA_TYPE = "text/event-stream"
+
+
+def sse_event(payload: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def wants_stream(request: Request, data: Dict[str, Any]) -> bool:
+    """O cliente pede streaming com ``"stream": true`` no payload ou ``Accept: text/event-stream``."""
+    return bool(data.get("stream")) or SSE_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def sse_response(eventos: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        eventos,
+        media_type=SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def sse_agent(agent: CachedAgent, prompt: str, prefixo: str = "", **done: Any) -> AsyncIterator[str]:
+    """Eventos SSE para a resposta de um agente, com um prefixo opcional."""
+    try:
+        if prefixo:
+            yield sse_event({"type": "delta", "text": prefixo})
+        async with agent.run_stream(prompt) as result:
+            async for delta in result.stream_text(delta=True):
+                yield sse_event({"type": "delta", "text": delta})
+        yield sse_event({"type": "done", "success": True, "cached": result.cached, **done})
+    except Exception as e:
+        aviso = f"❌ Erro na resposta do agente: {str(e)}"
+        yield sse_event({"type": "delta", "text": aviso})
+        yield sse_event({"type": "done", "success": False, "error": aviso, **done})
+
+
+async def sse_text(texto: str, success: bool, **done: Any) -> AsyncIterator[str]:
+    """Eventos SSE para uma resposta já pronta."""
+    yield sse_event({"type": "delta", "text": texto})
+    yield sse_event({"type": "done", "success": success, **done})
+
+
+async def responder_agente(agent: CachedAgent, prompt: str, stream: bool, prefixo: str = ""):
+    """Resposta padrão dos especialistas: SSE quando pedido, senão o JSON ``{"success", "response", "cached"}``."""
+    if stream:
+        return sse_response(sse_agent(agent, prompt, prefixo))
+    result = await agent.run(prompt)
+    return {"success": True, "response": f"{prefixo}{result.output}", "cached": result.cached}
+
+
+def responder_texto(texto: str, success: bool, stream: bool):
+    if stream:
+        return sse_response(sse_text(texto, success, cached=False))
+    return {"success": success, "response": texto, "cached": False}
+
+
+async def iter_sse(response: httpx.Response) -> AsyncIterator[Dict[str, Any]]:
+    """Lê os eventos de uma resposta SSE aberta com ``http_client.stream``."""
+    async for linha in response.aiter_lines():
+        if linha.startswith("data: "):
+            yield json.loads(linha[len("data: "):])
@@ -0,0 +1,240 @@
+# telemetry.py
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+
+REQUEST_ID_HEADER = "X-Request-ID"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Rótulo de path das requisições que não casaram com nenhuma rota (404, scanners)
+UNMATCHED_ROUTE = "<unmatched>"
+
+# Id da requisição atual (propagado entre os serviços pelo cabeçalho X-Request-ID)
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+# Tempos medidos durante a requisição atual, devolvidos no cabeçalho Server-Timing
+_timings_var: ContextVar[Optional[List[Tuple[str, float, str]]]] = ContextVar("timings", default=None)
+# Serviço que atende a requisição atual (no modo society vários serviços dividem o mesmo processo)
+_service_var: ContextVar[str] = ContextVar("service", default=os.getenv("SERVICE_NAME", ""))
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    servico = _service_var.get()
+    if servico:
+        labels = {"service": servico, **labels}
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    """Registro de métricas no formato de texto do Prometheus (contadores, histogramas e gauges)."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = {}
+        self._collectors: List[Tuple[str, Callable[[], Dict[str, float]]]] = []
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        with self._lock:
+            serie = self._counters.setdefault(name, {})
+            chave = _labels(labels)
+            serie[chave] = serie.get(chave, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        with self._lock:
+            serie = self._histograms.setdefault(name, {})
+            # [contagem por bucket..., soma, total]
+            dados = serie.setdefault(_labels(labels), [0.0] * (len(BUCKETS) + 2))
+            for i, limite in enumerate(BUCKETS):
+                if value <= limite:
+                    dados[i] += 1
+            dados[-2] += value
+            dados[-1] += 1
+
+    def register_collector(self, service: str, collector: Callable[[], Dict[str, float]]) -> None:
+        """Função chamada a cada /metrics que devolve gauges ``{nome: valor}`` (ex.: contadores de cache)."""
+        self._collectors.append((service, collector))
+
+    def render(self) -> str:
+        linhas: List[str] = []
+        with self._lock:
+            for name, serie in sorted(self._counters.items()):
+                linhas.append(f"# TYPE {name} counter")
+                for labels, valor in serie.items():
+                    linhas.append(f"{name}{_formatar_labels(labels)} {valor}")
+            for name, serie in sorted(self._histograms.items()):
+                linhas.append(f"# TYPE {name} histogram")
+                for todos, dados in serie.items():
+                    for limite, contagem in zip(BUCKETS, dados):
+                        linhas.append(f"{name}_bucket{_formatar_labels(todos + (('le', str(limite)),))} {contagem}")
+                    linhas.append(f"{name}_bucket{_formatar_labels(todos + (('le', '+Inf'),))} {dados[-1]}")
+                    linhas.append(f"{name}_sum{_formatar_labels(todos)} {dados[-2]}")
+                    linhas.append(f"{name}_count{_formatar_labels(todos)} {dados[-1]}")
+        gauges: Dict[str, List[str]] = {}
+        for servico, collector in self._collectors:
+            for name, valor in collector().items():
+                gauges.setdefault(name, []).append(f"{name}{_formatar_labels((('service', servico),))} {float(valor)}")
+        for name, series in sorted(gauges.items()):
+            linhas.append(f"# TYPE {name} gauge")
+            linhas.extend(series)
+        return "\n".join(linhas) + "\n"
+
+
+metrics = Metrics()
+
+try:
+    import logfire
+
+    if os.getenv("LOGFIRE_TOKEN"):
+        logfire.configure(service_name=os.getenv("SERVICE_NAME") or None, send_to_logfire="if-token-present")
+    else:
+        logfire = None
+except ImportError:
+    logfire = None
+
+
+def current_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+def record_timing(name: str, duration: float, desc: str = "") -> None:
+    timings = _timings_var.get()
+    if timings is not None:
+        timings.append((name, duration, desc))
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Mede um trecho da requisição: alimenta o histograma ``span_duration_seconds``,
+    o cabeçalho Server-Timing e, se configurado, um span do logfire. Os atributos
+    podem ser completados dentro do bloco (ex.: tokens usados).
+    """
+    inicio = time.perf_counter()
+    logfire_span = logfire.span(name, request_id=current_request_id(), **attrs) if logfire else None
+    if logfire_span is not None:
+        logfire_span.__enter__()
+    try:
+        yield attrs
+    finally:
+        duracao = time.perf_counter() - inicio
+        metrics.observe("span_duration_seconds", duracao, span=name)
+        record_timing(name, duracao, str(attrs.get("desc", "")))
+        if logfire_span is not None:
+            for chave, valor in attrs.items():
+                logfire_span.set_attribute(chave, valor)
+            logfire_span.__exit__(None, None, None)
+
+
+def record_llm_usage(agent_name: str, usage: Any) -> Dict[str, int]:
+    """Soma os tokens de uma chamada de LLM (aceita os nomes antigos e novos do pydantic-ai)."""
+    if usage is None:
+        return {}
+    tokens = {
+        "input": getattr(usage, "input_tokens", None) or getattr(usage, "request_tokens", None) or 0,
+        "output": getattr(usage, "output_tokens", None) or getattr(usage, "response_tokens", None) or 0,
+    }
+    for tipo, quantidade in tokens.items():
+        if quantidade:
+            metrics.inc("llm_tokens_total", quantidade, agent=agent_name, kind=tipo)
+    return tokens
+
+
+async def _propagar_request_id(request: httpx.Request) -> None:
+    request_id = current_request_id()
+    if request_id and REQUEST_ID_HEADER not in request.headers:
+        request.headers[REQUEST_ID_HEADER] = request_id
+    request.extensions["inicio"] = time.perf_counter()
+
+
+async def _medir_upstream(response: httpx.Response) -> None:
+    inicio = response.request.extensions.get("inicio")
+    if inicio is None:
+        return
+    duracao = time.perf_counter() - inicio
+    host = response.request.url.host
+    metrics.observe("upstream_request_seconds", duracao, host=host, status=response.status_code)
+    record_timing("upstream", duracao, f"{host}{response.request.url.path}")
+
+
+def http_event_hooks() -> Dict[str, list]:
+    """Ganchos do httpx que propagam o X-Request-ID e medem o tempo até a resposta de cada upstream."""
+    return {"request": [_propagar_request_id], "response": [_medir_upstream]}
+
+
+def _server_timing(timings: List[Tuple[str, float, str]], total: float) -> str:
+    partes = []
+    vistos: Dict[str, int] = {}
+    for nome, duracao, desc in timings:
+        # Métricas repetidas (ex.: duas chamadas upstream) recebem um sufixo para continuarem distintas
+        vistos[nome] = vistos.get(nome, 0) + 1
+        chave = nome if vistos[nome] == 1 else f"{nome}-{vistos[nome]}"
+        item = f"{chave};dur={duracao * 1000:.1f}"
+        if desc:
+            item += f';desc="{_escapar(desc)}"'
+        partes.append(item)
+    partes.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(partes)
+
+
+def _rota(request: Request) -> str:
+    """Template da rota (``/jobs/{job_id}``), para a cardinalidade do rótulo não crescer com cada id ou URL inválida."""
+    rota = request.scope.get("route")
+    return getattr(rota, "path", None) or UNMATCHED_ROUTE
+
+
+def instrument_app(app: FastAPI, service: str) -> None:
+    """Middleware de request id / Server-Timing e endpoint ``GET /metrics`` do serviço."""
+
+    @app.middleware("http")
+    async def telemetry_middleware(request: Request, call_next):
+        request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        token_service = _service_var.set(service)
+        token_id = request_id_var.set(request_id)
+        token_timings = _timings_var.set([])
+        inicio = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            response.headers[REQUEST_ID_HEADER] = request_id
+            response.headers["Server-Timing"] = _server_timing(_timings_var.get() or [], time.perf_counter() - inicio)
+            return response
+        finally:
+            duracao = time.perf_counter() - inicio
+            if request.url.path != "/metrics":
+                metrics.observe("http_request_duration_seconds", duracao, path=_rota(request), status=status)
+            request_id_var.reset(token_id)
+            _timings_var.reset(token_timings)
+            _service_var.reset(token_service)
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics_endpoint():
+        return metrics.render()
+
+
+def numeric_stats(prefix: str, stats: Dict[str, Any]) -> Dict[str, float]:
+    """Converte um dicionário de estatísticas (ex.: ``cache.stats()``) em gauges com prefixo."""
+    return {
+        f"{prefix}_{chave}": valor
+        for chave, valor in stats.items()
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool)
+    }
@@ -0,0 +1,179 @@
+# transport.py
+import asyncio
+import importlib.util
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import httpx
+
+from shared.deadline import deadline_event_hooks
+from shared.telemetry import http_event_hooks
+
+logger = logging.getLogger(__name__)
+
+# Transporte usado por todos os clientes HTTP do processo (modo "society")
+_default_transport: Optional[httpx.AsyncBaseTransport] = None
+
+# Pool de conexões: keep-alive mais longo que o padrão do httpx (5 s) para o
+# tráfego esparso não pagar DNS + TLS de novo; HTTP/2 quando o pacote h2 existe
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP2 = os.getenv("HTTP2", "1") != "0" and importlib.util.find_spec("h2") is not None
+
+
+class _CorpoASGI(httpx.AsyncByteStream):
+    """Corpo da resposta lido da fila alimentada pelo ``send`` da app, pedaço a pedaço."""
+
+    def __init__(self, fila: asyncio.Queue, tarefa: asyncio.Task, desconectado: asyncio.Event):
+        self._fila = fila
+        self._tarefa = tarefa
+        self._desconectado = desconectado
+        self._completo = False
+
+    async def __aiter__(self):
+        while not self._completo:
+            pedaco = await self._fila.get()
+            if isinstance(pedaco, BaseException):
+                # A app falhou no meio da resposta: para o cliente é uma conexão interrompida
+                raise httpx.RemoteProtocolError(f"Resposta interrompida: {pedaco}")
+            if pedaco is None:
+                self._completo = True
+                return
+            yield pedaco
+
+    async def aclose(self) -> None:
+        # O cliente largou a resposta: a app recebe http.disconnect e, se ainda estiver gerando, é cancelada
+        self._desconectado.set()
+        if not self._completo and not self._tarefa.done():
+            self._tarefa.cancel()
+
+
+class StreamingASGITransport(httpx.AsyncBaseTransport):
+    """
+    Chama uma app ASGI no mesmo processo devolvendo a resposta assim que os
+    cabeçalhos saem: o corpo chega ao cliente conforme a app envia cada pedaço
+    (o ``httpx.ASGITransport`` espera o corpo inteiro, o que anula o SSE).
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+        # Referências fortes às apps ainda rodando depois que o cliente leu a resposta
+        self._tarefas: set = set()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        corpo = await request.aread()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": request.method,
+            "headers": [(chave.lower(), valor) for chave, valor in request.headers.raw],
+            "scheme": request.url.scheme,
+            "path": request.url.path,
+            "raw_path": request.url.raw_path.split(b"?")[0],
+            "query_string": request.url.query,
+            "server": (request.url.host, request.url.port),
+            "client": ("127.0.0.1", 0),
+            "root_path": "",
+        }
+        inicio: asyncio.Future = asyncio.get_running_loop().create_future()
+        fila: asyncio.Queue = asyncio.Queue()
+        desconectado = asyncio.Event()
+        corpo_enviado = False
+
+        async def receive() -> dict:
+            nonlocal corpo_enviado
+            if not corpo_enviado:
+                corpo_enviado = True
+                return {"type": "http.request", "body": corpo, "more_body": False}
+            await desconectado.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(mensagem: dict) -> None:
+            if mensagem["type"] == "http.response.start":
+                if not inicio.done():
+                    inicio.set_result((mensagem["status"], mensagem.get("headers", [])))
+            elif mensagem["type"] == "http.response.body":
+                if mensagem.get("body") and request.method != "HEAD":
+                    fila.put_nowait(mensagem["body"])
+                if not mensagem.get("more_body", False):
+                    fila.put_nowait(None)
+
+        async def executar() -> None:
+            # Fim da app (normal, erro ou cancelamento): o leitor do corpo não fica esperando
+            try:
+                await self.app(scope, receive, send)
+            except BaseException as e:
+                fila.put_nowait(e)
+                raise
+            fila.put_nowait(None)
+
+        tarefa = asyncio.create_task(executar())
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._finalizar)
+        try:
+            await asyncio.wait({inicio, tarefa}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            tarefa.cancel()
+            raise
+        if not inicio.done():
+            # A app terminou sem responder: propaga o erro dela, como o ASGITransport
+            tarefa.result()
+            raise httpx.RemoteProtocolError("A app ASGI terminou sem enviar uma resposta.")
+        status, cabecalhos = inicio.result()
+        return httpx.Response(status, headers=cabecalhos, stream=_CorpoASGI(fila, tarefa, desconectado))
+
+    def _finalizar(self, tarefa: asyncio.Task) -> None:
+        self._tarefas.discard(tarefa)
+        if not tarefa.cancelled() and tarefa.exception() is not None:
+            logger.error(f"Erro na app ASGI em processo: {tarefa.exception()!r}")
+
+
+class InProcessTransport(httpx.AsyncBaseTransport):
+    """
+    Encaminha requisições para ``host:porta`` conhecidos direto para a app ASGI
+    no mesmo processo, com a resposta em streaming; os demais destinos (ViaCEP
+    etc.) seguem pela rede.
+    """
+
+    def __init__(self, apps: Dict[str, Any], fallback: Optional[httpx.AsyncBaseTransport] = None):
+        self._asgi = {endereco: StreamingASGITransport(app) for endereco, app in apps.items()}
+        self._fallback = fallback or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        transporte = self._asgi.get(f"{request.url.host}:{request.url.port}")
+        return await (transporte or self._fallback).handle_async_request(request)
+
+    async def aclose(self) -> None:
+        # Compartilhado entre os clientes de todos os serviços: fechado só por close()
+        pass
+
+    async def close(self) -> None:
+        await self._fallback.aclose()
+
+
+def set_default_transport(transport: Optional[httpx.AsyncBaseTransport]) -> None:
+    global _default_transport
+    _default_transport = transport
+
+
+def create_http_client(**kwargs: Any) -> httpx.AsyncClient:
+    """
+    Cria o ``httpx.AsyncClient`` do serviço, com os ganchos de prazo e de
+    telemetria, o pool keep-alive (HTTP/2 quando disponível) e o transporte em
+    processo quando configurado.
+    """
+    kwargs.setdefault("limits", httpx.Limits(
+        max_connections=100, max_keepalive_connections=HTTP_MAX_KEEPALIVE, keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    ))
+    kwargs.setdefault("http2", HTTP2)
+    if "event_hooks" not in kwargs:
+        ganchos = http_event_hooks()
+        kwargs["event_hooks"] = {
+            **ganchos,
+            "request": deadline_event_hooks()["request"] + list(ganchos.get("request", [])),
+        }
+    if _default_transport is not None:
+        kwargs.setdefault("transport", _default_transport)
+    return httpx.AsyncClient(**kwargs)
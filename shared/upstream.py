@@ -0,0 +1,296 @@
+# upstream.py
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from shared.deadline import DeadlineExceeded, remaining, run_with_deadline
+from shared.telemetry import metrics, record_timing
+
+# Status HTTP que indicam falha passageira do upstream
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# Erros de conexão do SDK da OpenAI (não herdam de httpx) reconhecidos pelo nome
+_ERROS_CONEXAO = {"APIConnectionError", "APITimeoutError"}
+
+
+class UpstreamOverloaded(Exception):
+    """O upstream está no limite de concorrência/taxa e a espera máxima foi excedida."""
+
+    def __init__(self, upstream: str, retry_after: float):
+        self.upstream = upstream
+        self.retry_after = retry_after
+        super().__init__(f"⏳ {upstream} sobrecarregado no momento. Tente novamente em {retry_after:.0f}s.")
+
+
+def erro_retentavel(exc: BaseException) -> bool:
+    """Timeouts, falhas de conexão e respostas 408/429/5xx valem uma nova tentativa."""
+    if isinstance(exc, (UpstreamOverloaded, DeadlineExceeded)):
+        return False
+    if isinstance(exc, (httpx.TimeoutException, httpx.TransportError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if type(exc).__name__ in _ERROS_CONEXAO:
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status in RETRYABLE_STATUS
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Limite de taxa: ``rate`` requisições por segundo com rajadas de até ``burst``."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._atualizado = time.monotonic()
+
+    def _reabastecer(self) -> None:
+        agora = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (agora - self._atualizado) * self.rate)
+        self._atualizado = agora
+
+    async def acquire(self, timeout: float) -> bool:
+        """Consome um token, esperando no máximo ``timeout`` segundos."""
+        limite = time.monotonic() + timeout
+        while True:
+            self._reabastecer()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            espera = (1 - self._tokens) / self.rate
+            if time.monotonic() + espera > limite:
+                return False
+            await asyncio.sleep(espera)
+
+
+class UpstreamGuard:
+    """
+    Controle de acesso a um upstream (ViaCEP, OpenAI): limita a concorrência e a
+    taxa, enfileira os chamadores por até ``max_wait`` segundos e, depois disso,
+    falha com ``UpstreamOverloaded`` em vez de deixar a requisição pendurada.
+
+    ``call`` ainda repete falhas passageiras com backoff exponencial com jitter e,
+    com ``hedge`` ligado, dispara uma segunda requisição quando a primeira passa
+    do p95 recente de latência, ficando com a que responder primeiro.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        max_concurrency: int = 10,
+        rate: float = 0.0,
+        burst: float = 0.0,
+        max_wait: float = 5.0,
+        retries: int = 2,
+        backoff_base: float = 0.2,
+        backoff_max: float = 5.0,
+        hedge: bool = False,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 0.05,
+    ):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_wait = max_wait
+        self.retries = max(0, retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self._semaforo = asyncio.Semaphore(self.max_concurrency)
+        self._bucket = TokenBucket(rate, burst or rate) if rate > 0 else None
+        self._latencias: deque = deque(maxlen=500)
+        self.em_uso = 0
+        self.aguardando = 0
+
+    # ✅ Admissão
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None):
+        """
+        Reserva uma vaga (concorrência + taxa) ou levanta ``UpstreamOverloaded``.
+        A espera nunca passa do prazo da requisição, e quem já não tem prazo para
+        uma resposta típica (mediana recente) é recusado antes de ocupar a vaga.
+        """
+        espera = self.max_wait if timeout is None else timeout
+        prazo = remaining()
+        if prazo is not None:
+            if prazo <= (self.percentil(0.5) or 0.0):
+                metrics.inc("upstream_requests_total", upstream=self.name, result="deadline")
+                raise DeadlineExceeded()
+            espera = min(espera, prazo)
+        inicio = time.perf_counter()
+        self.aguardando += 1
+        try:
+            try:
+                await asyncio.wait_for(self._semaforo.acquire(), timeout=espera)
+            except asyncio.TimeoutError:
+                self._rejeitar(prazo, espera)
+            restante = max(0.0, espera - (time.perf_counter() - inicio))
+            try:
+                liberado = self._bucket is None or await self._bucket.acquire(restante)
+            except BaseException:
+                # Cancelado esperando o token (hedge perdedor, prazo, desconexão): devolve a vaga
+                self._semaforo.release()
+                raise
+            if not liberado:
+                self._semaforo.release()
+                self._rejeitar(prazo, espera)
+        finally:
+            self.aguardando -= 1
+        fila = time.perf_counter() - inicio
+        if fila > 0.001:
+            record_timing("upstream_queue", fila, self.name)
+        self.em_uso += 1
+        try:
+            yield
+        finally:
+            self.em_uso -= 1
+            self._semaforo.release()
+
+    def _rejeitar(self, prazo: Optional[float] = None, espera: float = 0.0) -> None:
+        if prazo is not None and prazo <= espera:
+            # Quem acabou foi o prazo da requisição, não a paciência da fila
+            metrics.inc("upstream_requests_total", upstream=self.name, result="deadline")
+            raise DeadlineExceeded()
+        metrics.inc("upstream_requests_total", upstream=self.name, result="overloaded")
+        raise UpstreamOverloaded(self.name, retry_after=max(1.0, self.p95() or 1.0))
+
+    # ✅ Chamada com retry e hedge
+    async def call(self, factory: Callable[[], Awaitable[Any]], *, hedge: Optional[bool] = None) -> Any:
+        usar_hedge = self.hedge if hedge is None else hedge
+        tentativa = 0
+        while True:
+            try:
+                resultado = await (self._hedged(factory) if usar_hedge else self._tentativa(factory))
+                metrics.inc("upstream_requests_total", upstream=self.name, result="ok")
+                return resultado
+            except Exception as e:
+                if tentativa >= self.retries or not erro_retentavel(e):
+                    if not isinstance(e, (UpstreamOverloaded, DeadlineExceeded)):
+                        metrics.inc("upstream_requests_total", upstream=self.name, result="error")
+                    raise
+                tentativa += 1
+                metrics.inc("upstream_requests_total", upstream=self.name, result="retry")
+                espera = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** tentativa))
+                espera = max(espera, min(_retry_after(e) or 0.0, self.backoff_max))
+                prazo = remaining()
+                if prazo is not None and prazo <= espera:
+                    # Não há prazo para outra tentativa: devolve o erro original
+                    raise
+                await asyncio.sleep(espera)
+
+    async def _tentativa(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        async with self.slot():
+            inicio = time.perf_counter()
+            resultado = await run_with_deadline(factory())
+            self._latencias.append(time.perf_counter() - inicio)
+            return resultado
+
+    async def _hedged(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        atraso = self.p95() if len(self._latencias) >= self.hedge_min_samples else None
+        primeira = asyncio.ensure_future(self._tentativa(factory))
+        segunda: Optional[asyncio.Future] = None
+        if atraso is None:
+            return await primeira
+        try:
+            done, _ = await asyncio.wait({primeira}, timeout=max(atraso, self.hedge_min_delay))
+            if done or self._semaforo.locked():
+                # Respondeu a tempo, ou não há vaga livre: um hedge só aumentaria a carga
+                return await primeira
+            metrics.inc("upstream_requests_total", upstream=self.name, result="hedge")
+            segunda = asyncio.ensure_future(self._tentativa(factory))
+            pendentes = {primeira, segunda}
+            while pendentes:
+                done, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+                for tarefa in done:
+                    # Uma tentativa cancelada (ex.: prazo propagado) não tem exception(): conta como falha
+                    if not tarefa.cancelled() and tarefa.exception() is None:
+                        if tarefa is segunda:
+                            metrics.inc("upstream_requests_total", upstream=self.name, result="hedge_won")
+                        return tarefa.result()
+            # As duas falharam: propaga o erro da primeira (ou da segunda, se a primeira foi cancelada)
+            return (segunda if primeira.cancelled() else primeira).result()
+        finally:
+            for tarefa in (primeira, segunda):
+                if tarefa is not None and not tarefa.done():
+                    tarefa.cancel()
+
+    def percentil(self, q: float) -> Optional[float]:
+        if not self._latencias:
+            return None
+        ordenadas = sorted(self._latencias)
+        return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * q))]
+
+    def p95(self) -> Optional[float]:
+        return self.percentil(0.95)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "in_use": self.em_uso,
+            "waiting": self.aguardando,
+            "max_concurrency": self.max_concurrency,
+            "p95_seconds": self.p95() or 0.0,
+        }
+
+
+# ✅ Registro por processo, configurado por variáveis de ambiente
+_upstreams: Dict[str, UpstreamGuard] = {}
+
+
+def get_upstream(name: str, **defaults: Any) -> UpstreamGuard:
+    """
+    Instância única por upstream. Cada parâmetro pode ser sobrescrito por
+    ``UPSTREAM_<NOME>_<PARAMETRO>`` (ex.: ``UPSTREAM_VIACEP_MAX_CONCURRENCY``).
+    """
+    if name not in _upstreams:
+        config: Dict[str, Any] = dict(defaults)
+        for parametro, tipo in (
+            ("max_concurrency", int), ("rate", float), ("burst", float), ("max_wait", float),
+            ("retries", int), ("backoff_base", float), ("backoff_max", float),
+        ):
+            valor = os.getenv(f"UPSTREAM_{name.upper()}_{parametro.upper()}")
+            if valor:
+                config[parametro] = tipo(valor)
+        hedge = os.getenv(f"UPSTREAM_{name.upper()}_HEDGE")
+        if hedge:
+            config["hedge"] = hedge != "0"
+        _upstreams[name] = UpstreamGuard(name, **config)
+    return _upstreams[name]
+
+
+def upstream_stats() -> Dict[str, float]:
+    """Gauges de todos os upstreams do processo, no formato de ``register_collector``."""
+    return {
+        f"upstream_{guard.name}_{chave}": valor
+        for guard in _upstreams.values()
+        for chave, valor in guard.stats().items()
+    }
+
+
+def register_overload_handler(app: FastAPI) -> None:
+    """Responde 503 com Retry-After quando um upstream recusa a requisição por sobrecarga."""
+
+    @app.exception_handler(UpstreamOverloaded)
+    async def _sobrecarga(request: Request, exc: UpstreamOverloaded):
+        return JSONResponse(
+            status_code=503,
+            content={"success": False, "error": str(exc), "error_code": "overloaded"},
+            headers={"Retry-After": str(int(exc.retry_after))},
+        )
@@ -0,0 +1,135 @@
+# warmup.py
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from shared.telemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+# Warm-up opcional antes de o serviço se declarar pronto em /ready
+WARMUP = os.getenv("WARMUP", "0") != "0"
+# Com WARMUP ligado, faz também uma chamada mínima ao modelo (abre a conexão TLS com a OpenAI)
+WARMUP_LLM = os.getenv("WARMUP_LLM", "1") != "0"
+# Conexões abertas em paralelo para cada destino aquecido
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "2"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "30"))
+
+
+async def aquecer_conexoes(http_client: httpx.AsyncClient, urls: List[str], conexoes: int = WARMUP_CONNECTIONS) -> None:
+    """
+    Faz ``conexoes`` requisições simultâneas a cada URL para deixar conexões
+    keep-alive no pool (DNS, TCP e TLS resolvidos antes do primeiro usuário).
+    O status da resposta não importa, só a conexão aberta.
+    """
+    async def tocar(url: str) -> None:
+        try:
+            await http_client.get(url, timeout=10)
+        except httpx.HTTPError as e:
+            logger.warning(f"Warm-up de {url} falhou: {e}")
+
+    await asyncio.gather(*(tocar(url) for url in urls for _ in range(max(1, conexoes))))
+
+
+class ServiceReadiness:
+    """
+    Prontidão e tempos de startup de um serviço. ``GET /`` continua sendo o
+    health check (o processo está vivo); ``GET /ready`` só responde 200 depois
+    do warm-up, para o balanceador não mandar tráfego a um processo frio.
+
+    As fases (``import``, ``lifespan``, ``warmup``) viram gauges
+    ``startup_<fase>_seconds`` em /metrics e aparecem no corpo do /ready.
+    """
+
+    def __init__(self, service: str, started_at: float):
+        self.service = service
+        self.started_at = started_at
+        self.phases: Dict[str, float] = {"import": time.perf_counter() - started_at}
+        self.ready = False
+        self.errors: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+        metrics.register_collector(service, self.stats)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - inicio
+
+    async def start_warmup(
+        self, *etapas: Callable[[], Awaitable[None]], on_ready: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> None:
+        """
+        Roda as etapas de warm-up em segundo plano (com WARMUP ligado) e então
+        marca o serviço como pronto e chama ``on_ready`` (ex.: entrar no registro
+        de agentes). Sem WARMUP, fica pronto na hora.
+        """
+        if not WARMUP or not etapas:
+            if on_ready is not None:
+                await on_ready()
+            self._marcar_pronto()
+            return
+        self._task = asyncio.create_task(self._aquecer(etapas, on_ready))
+
+    async def _aquecer(self, etapas, on_ready) -> None:
+        with self.phase("warmup"):
+            try:
+                resultados = await asyncio.wait_for(
+                    asyncio.gather(*(etapa() for etapa in etapas), return_exceptions=True), timeout=WARMUP_TIMEOUT
+                )
+                self.errors = [str(r) for r in resultados if isinstance(r, Exception)]
+            except asyncio.TimeoutError:
+                self.errors = [f"warm-up excedeu {WARMUP_TIMEOUT:.0f}s"]
+        for erro in self.errors:
+            # Warm-up é só otimização: um erro aqui não deixa o serviço fora do ar
+            logger.warning(f"Warm-up de {self.service}: {erro}")
+        if on_ready is not None:
+            await on_ready()
+        self._marcar_pronto()
+
+    def _marcar_pronto(self) -> None:
+        self.ready = True
+        self.phases["total"] = time.perf_counter() - self.started_at
+        print(f"🟢 {self.service} pronto em {self.phases['total']:.2f}s ({self.resumo()})")
+
+    def resumo(self) -> str:
+        return ", ".join(f"{fase} {segundos:.2f}s" for fase, segundos in self.phases.items() if fase != "total")
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.ready = False
+
+    def status(self) -> dict:
+        return {
+            "service": self.service,
+            "ready": self.ready,
+            "startup": {fase: round(segundos, 3) for fase, segundos in self.phases.items()},
+            "warmup_errors": self.errors,
+        }
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "service_ready": 1.0 if self.ready else 0.0,
+            **{f"startup_{fase}_seconds": segundos for fase, segundos in self.phases.items()},
+        }
+
+    def install(self, app: FastAPI) -> None:
+        """Registra ``GET /ready``: 200 quando pronto, 503 enquanto aquece."""
+
+        @app.get("/ready", include_in_schema=False)
+        async def ready():
+            return JSONResponse(status_code=200 if self.ready else 503, content=self.status())
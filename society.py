@@ -0,0 +1,77 @@
+# society.py - executa a sociedade inteira (MCP, especialistas e coordenador) em um único processo
+import importlib.util
+import os
+import sys
+from contextlib import AsyncExitStack, asynccontextmanager
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT))
+
+from shared.transport import InProcessTransport, set_default_transport
+
+
+def carregar_servico(nome: str, caminho: Path):
+    """Importa o módulo de um serviço pelo caminho do arquivo (as pastas têm espaços no nome)."""
+    spec = importlib.util.spec_from_file_location(nome, caminho)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nome] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+mcp_server = carregar_servico("mcp_server", ROOT / "MCP" / "mcp_server.py")
+agent_analysis = carregar_servico("agent_analysis", ROOT / "Agent A2A" / "agent_analysis.py")
+agent_consult = carregar_servico("agent_consult", ROOT / "Agent A2A" / "agent_consult.py")
+agent_central = carregar_servico("agent_central_a2a", ROOT / "Agent A2A" / "agent_central _a2a.py")
+
+# As URLs usadas na implantação distribuída continuam valendo; aqui elas viram chamadas ASGI em memória
+SERVICOS = {
+    "localhost:8000": mcp_server.app,
+    "localhost:8001": agent_analysis.app,
+    "localhost:8002": agent_consult.app,
+}
+# Ordem de inicialização: o coordenador descobre os especialistas, que dependem do MCP
+ORDEM = [mcp_server.app, agent_analysis.app, agent_consult.app, agent_central.app]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    transporte = InProcessTransport(SERVICOS)
+    set_default_transport(transporte)
+    try:
+        # Cada serviço roda o próprio lifespan; a pilha encerra na ordem inversa
+        async with AsyncExitStack() as pilha:
+            for servico in ORDEM:
+                await pilha.enter_async_context(servico.router.lifespan_context(servico))
+            print("\n🏛️ SOCIEDADE DE AGENTES em processo único (coordenador na porta 8004)")
+            yield
+    finally:
+        await transporte.close()
+        set_default_transport(None)
+
+
+app = FastAPI(title="Dynamic Agents Society", lifespan=lifespan)
+
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    """A sociedade está pronta quando os quatro serviços terminaram o warm-up."""
+    servicos = [modulo.readiness.status() for modulo in (mcp_server, agent_analysis, agent_consult, agent_central)]
+    pronta = all(servico["ready"] for servico in servicos)
+    return JSONResponse(status_code=200 if pronta else 503, content={"ready": pronta, "services": servicos})
+
+
+# Os serviços internos ficam acessíveis por prefixo para depuração; o coordenador responde na raiz
+app.mount("/mcp-server", mcp_server.app)
+app.mount("/analysis", agent_analysis.app)
+app.mount("/consult", agent_consult.app)
+app.mount("/", agent_central.app)
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("SOCIETY_PORT", "8004")), log_level="info")
@@ -0,0 +1,5 @@
+# conftest.py - os módulos de shared/ são importados a partir da raiz do repositório
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
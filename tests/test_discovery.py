@@ -0,0 +1,140 @@
+# test_discovery.py
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from shared.discovery import AgentDirectory, CircuitBreaker
+
+CARD = {
+    "agent_id": "consult_specialist_v1",
+    "name": "Agente de Consulta de CEP",
+    "description": "Consulta de CEP.",
+    "version": "1.0.0",
+    "invocation_endpoint": "http://localhost:8002/sse",
+}
+
+
+def test_disjuntor_abre_depois_das_falhas_seguidas():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_meio_aberto_deixa_passar_uma_tentativa():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == "half_open" and breaker.allow()
+    breaker.begin()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_falha_no_meio_aberto_reabre():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.01)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.02)
+    breaker.begin()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def _diretorio(urls, handler=None) -> AgentDirectory:
+    def responder(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json=CARD)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler or responder))
+    return AgentDirectory(urls, client, failure_threshold=1, reset_timeout=0.01)
+
+
+async def _usar(diretorio: AgentDirectory, endpoint) -> None:
+    async with diretorio.track(endpoint):
+        await asyncio.sleep(10)
+
+
+def test_descobre_replicas_e_escolhe_a_menos_ocupada():
+    async def cenario():
+        diretorio = _diretorio(["http://a:8002", "http://b:8002"])
+        await diretorio.discover()
+        assert [card.agent_id for card in diretorio.cards()] == ["consult_specialist_v1"]
+        primeira = diretorio.pick("consult_specialist_v1")
+        primeira.in_flight = 3
+        segunda = diretorio.pick("consult_specialist_v1")
+        assert segunda is not primeira
+        assert segunda.invocation_url.endswith(":8002/sse")
+
+    asyncio.run(cenario())
+
+
+def test_replica_que_para_de_responder_sai_do_roteamento():
+    async def cenario():
+        fora = set()
+
+        def responder(request: httpx.Request) -> httpx.Response:
+            if request.url.host in fora:
+                raise httpx.ConnectError("recusada")
+            return httpx.Response(200, json=CARD)
+
+        diretorio = _diretorio(["http://a:8002"], responder)
+        await diretorio.discover()
+        fora.add("a")
+        await diretorio.discover()
+        assert diretorio.pick("consult_specialist_v1") is None
+        fora.clear()
+        await diretorio.discover()
+        assert diretorio.pick("consult_specialist_v1") is not None
+
+    asyncio.run(cenario())
+
+
+def test_track_conta_falhas_mas_nao_sobrecarga_nem_cancelamento():
+    async def cenario():
+        diretorio = _diretorio(["http://a:8002"])
+        await diretorio.discover()
+        endpoint = diretorio.pick("consult_specialist_v1")
+
+        resposta = httpx.Response(503, request=httpx.Request("POST", endpoint.invocation_url))
+        with pytest.raises(httpx.HTTPStatusError):
+            async with diretorio.track(endpoint):
+                resposta.raise_for_status()
+        assert endpoint.breaker.state == "closed"
+
+        tarefa = asyncio.ensure_future(_usar(diretorio, endpoint))
+        await asyncio.sleep(0.01)
+        tarefa.cancel()
+        await asyncio.gather(tarefa, return_exceptions=True)
+        assert endpoint.breaker.state == "closed"
+        assert endpoint.in_flight == 0
+
+        with pytest.raises(httpx.ConnectError):
+            async with diretorio.track(endpoint):
+                raise httpx.ConnectError("recusada")
+        assert endpoint.breaker.state == "open"
+        assert diretorio.pick("consult_specialist_v1") is None
+
+    asyncio.run(cenario())
+
+
+def test_cancelamento_no_meio_aberto_libera_a_tentativa():
+    async def cenario():
+        diretorio = _diretorio(["http://a:8002"])
+        await diretorio.discover()
+        endpoint = diretorio.pick("consult_specialist_v1")
+        endpoint.breaker.record_failure()
+        await asyncio.sleep(0.02)
+        assert endpoint.breaker.state == "half_open"
+
+        tarefa = asyncio.ensure_future(_usar(diretorio, endpoint))
+        await asyncio.sleep(0.01)
+        assert not endpoint.breaker.allow()
+        tarefa.cancel()
+        await asyncio.gather(tarefa, return_exceptions=True)
+        assert endpoint.breaker.allow()
+
+    asyncio.run(cenario())
@@ -0,0 +1,91 @@
+# test_jobs.py
+import asyncio
+
+from shared.jobs import JobManager, JobRowRetry, JobStore, linhas_de_lista
+
+CEPS = ["01001-000", "20040-020", "30130-010"]
+
+
+async def _processar_ok(job, linha):
+    return {"success": True, "cep": linha["cep"]}
+
+
+def test_cancelar_job_na_fila_nao_deixa_marca_no_manager():
+    async def cenario():
+        store = JobStore()
+        manager = JobManager(store, _processar_ok)
+        job = await manager.submit("consult", linhas_de_lista(CEPS))
+        assert await manager.cancel(job["job_id"])
+        assert store.get(job["job_id"])["status"] == "cancelled"
+        assert manager._cancelados == set()
+
+    asyncio.run(cenario())
+
+
+def test_reserva_com_lease_e_retomada_por_outro_worker():
+    store = JobStore()
+    job_id = store.create("consult", linhas_de_lista(CEPS))
+    assert store.claim_next("worker-1", lease=60) == job_id
+    # Lease válido: ninguém mais pega o job
+    assert store.claim_next("worker-2", lease=60) is None
+    assert store.renew(job_id, "worker-1", lease=-1)
+    # Lease vencido (worker caiu): outro worker assume e o antigo perde o job
+    assert store.claim_next("worker-2", lease=60) == job_id
+    assert not store.renew(job_id, "worker-1", lease=60)
+    assert not store.set_status(job_id, "completed", None, "worker-1")
+
+
+def test_checkpoint_por_linha_retoma_so_as_pendentes():
+    async def cenario():
+        store = JobStore()
+        job_id = store.create("consult", linhas_de_lista(CEPS))
+        store.claim_next("worker-antigo", lease=-1)
+        store.finish_row(job_id, 0, {"success": True})
+        processadas = []
+
+        async def processar(job, linha):
+            processadas.append(linha["idx"])
+            return {"success": True}
+
+        manager = JobManager(store, processar, poll_interval=0.01)
+        await manager.start()
+        try:
+            for _ in range(200):
+                if store.get(job_id)["status"] == "completed":
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await manager.stop()
+        assert store.get(job_id)["status"] == "completed"
+        assert sorted(processadas) == [1, 2]
+
+    asyncio.run(cenario())
+
+
+def test_linha_sem_especialista_fica_pendente_e_e_tentada_de_novo():
+    async def cenario():
+        store = JobStore()
+        tentativas = []
+
+        async def processar(job, linha):
+            tentativas.append(linha["idx"])
+            if tentativas.count(linha["idx"]) < 3:
+                raise JobRowRetry("Nenhum especialista disponível no momento.")
+            return {"success": True}
+
+        manager = JobManager(store, processar, row_concurrency=2, retry_base=0.01, retry_max=0.02, poll_interval=0.01)
+        await manager.start()
+        try:
+            job = await manager.submit("consult", linhas_de_lista(CEPS))
+            for _ in range(200):
+                if store.get(job["job_id"])["status"] == "completed":
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await manager.stop()
+        final = store.get(job["job_id"])
+        assert final["status"] == "completed"
+        assert final["failed"] == 0 and final["done"] == len(CEPS)
+        assert len(tentativas) == 3 * len(CEPS)
+
+    asyncio.run(cenario())
@@ -0,0 +1,74 @@
+# test_local_router.py
+from schemas.schemas import AgentCard
+from shared.local_router import LocalRouter
+
+CONSULTA = AgentCard(
+    agent_id="consult_specialist_v1",
+    name="Agente de Consulta de CEP",
+    description="Especialista em realizar consultas rápidas e básicas de CEP, retornando logradouro, bairro, cidade e estado. Ideal para quando o usuário pede para 'consultar' ou 'verificar' um CEP.",
+    version="1.0.0",
+    invocation_endpoint="http://localhost:8002/sse",
+)
+ANALISE = AgentCard(
+    agent_id="analysis_specialist_v1",
+    name="Agente de Análise de Endereço",
+    description="Especialista em realizar análises detalhadas de endereços a partir de um CEP. Fornece insights sobre o tipo de região, características da área e contexto geográfico. Ideal para quando o usuário pede para 'analisar' ou 'detalhar' um endereço.",
+    version="1.0.0",
+    invocation_endpoint="http://localhost:8001/sse",
+)
+
+
+def _router() -> LocalRouter:
+    router = LocalRouter()
+    router.update_agents([ANALISE, CONSULTA])
+    return router
+
+
+def test_pedido_simples_vai_para_um_especialista():
+    router = _router()
+    assert router.plan("Consulte o CEP 01001-000") is None
+    assert router.route("Consulte o CEP 01001-000").agent_id == "consult_specialist_v1"
+    assert router.route("Analise o endereço do CEP 01001-000").agent_id == "analysis_specialist_v1"
+
+
+def test_frases_ambiguas_nao_viram_plano():
+    router = _router()
+    for mensagem in (
+        "Verifique a região do CEP 01001-000",
+        "Busque as características do CEP 01001-000",
+        "Verifique os detalhes do CEP 01001000",
+    ):
+        assert router.plan(mensagem) is None, mensagem
+        assert len(router.intents(mensagem)) == 1, mensagem
+
+
+def test_frase_ambigua_com_varios_ceps_usa_um_so_especialista():
+    plano = _router().plan("Verifique a região dos CEPs 01001-000 e 20040-020")
+    assert plano is not None
+    assert len({step.agent_id for step in plano.steps}) == 1
+    assert [step.cep for step in plano.steps] == ["01001-000", "20040-020"]
+
+
+def test_prefixos_parecidos_nao_contam_como_intencao():
+    # "verificacao"/"regional" compartilham o prefixo de palavras-chave, mas não são palavras-chave
+    assert _router().intents("Faça a verificação regional do CEP 01001-000") == []
+
+
+def test_conjuncao_explicita_gera_plano_com_os_dois():
+    router = _router()
+    for mensagem in (
+        "Consulte e analise o CEP 01001-000",
+        "Consulte o CEP 01001-000 e analise o CEP 20040-020",
+        "Analise, consulte o CEP 01001-000",
+    ):
+        plano = router.plan(mensagem)
+        assert plano is not None, mensagem
+        assert {step.agent_id for step in plano.steps} == {"consult_specialist_v1", "analysis_specialist_v1"}, mensagem
+
+
+def test_cartao_com_nova_descricao_atualiza_as_palavras():
+    router = _router()
+    assert router.intents("Geocodifique o CEP 01001-000") == []
+    nova = CONSULTA.model_copy(update={"description": CONSULTA.description + " Também pode 'geocodifique' um CEP."})
+    router.update_agents([ANALISE, nova])
+    assert router.intents("Geocodifique o CEP 01001-000") == ["consult_specialist_v1"]
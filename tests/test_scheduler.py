@@ -0,0 +1,106 @@
+# test_scheduler.py
+import asyncio
+
+import pytest
+
+from shared.scheduler import PriorityScheduler
+from shared.upstream import UpstreamOverloaded
+
+
+async def _ocupar(scheduler: PriorityScheduler, classe: str, liberar: asyncio.Event, ordem: list) -> None:
+    async with scheduler.slot(classe):
+        ordem.append(classe)
+        await liberar.wait()
+
+
+async def _usar(scheduler: PriorityScheduler, classe: str, ordem: list) -> None:
+    async with scheduler.slot(classe):
+        ordem.append(classe)
+        await asyncio.sleep(0)
+
+
+def test_classe_de_maior_prioridade_passa_na_frente():
+    async def cenario():
+        scheduler = PriorityScheduler(1, max_wait=5, classes={"consulta": {"priority": 10}, "analise": {"priority": 0}})
+        liberar, ordem = asyncio.Event(), []
+        ocupante = asyncio.ensure_future(_ocupar(scheduler, "analise", liberar, ordem))
+        await asyncio.sleep(0)
+        # A análise entra na fila antes, mas a consulta tem prioridade
+        tarefas = [asyncio.ensure_future(_usar(scheduler, "analise", ordem))]
+        await asyncio.sleep(0)
+        tarefas.append(asyncio.ensure_future(_usar(scheduler, "consulta", ordem)))
+        await asyncio.sleep(0)
+        liberar.set()
+        await asyncio.gather(ocupante, *tarefas)
+        assert ordem == ["analise", "consulta", "analise"]
+
+    asyncio.run(cenario())
+
+
+def test_mesma_prioridade_divide_as_vagas_pelo_peso():
+    async def cenario():
+        scheduler = PriorityScheduler(1, max_wait=5, classes={"a": {"weight": 3.0}, "b": {"weight": 1.0}})
+        liberar, ordem = asyncio.Event(), []
+        ocupante = asyncio.ensure_future(_ocupar(scheduler, "a", liberar, []))
+        await asyncio.sleep(0)
+        tarefas = [asyncio.ensure_future(_usar(scheduler, classe, ordem)) for _ in range(8) for classe in ("a", "b")]
+        await asyncio.sleep(0)
+        liberar.set()
+        await asyncio.gather(ocupante, *tarefas)
+        primeiras = ordem[:8]
+        assert primeiras.count("a") == 6
+        assert primeiras.count("b") == 2
+
+    asyncio.run(cenario())
+
+
+def test_pool_da_classe_nao_bloqueia_as_outras():
+    async def cenario():
+        scheduler = PriorityScheduler(4, max_wait=0.05, classes={"analise": {"concurrency": 1}})
+        liberar, ordem = asyncio.Event(), []
+        ocupante = asyncio.ensure_future(_ocupar(scheduler, "analise", liberar, ordem))
+        await asyncio.sleep(0)
+        # O pool da análise está cheio: a segunda análise espera e desiste, a consulta entra na hora
+        await _usar(scheduler, "consulta", ordem)
+        with pytest.raises(UpstreamOverloaded):
+            await _usar(scheduler, "analise", ordem)
+        liberar.set()
+        await ocupante
+        assert ordem == ["analise", "consulta"]
+
+    asyncio.run(cenario())
+
+
+def test_fila_cheia_recusa_na_hora():
+    async def cenario():
+        scheduler = PriorityScheduler(1, max_wait=5, classes={"analise": {"max_queue": 1}})
+        liberar = asyncio.Event()
+        ocupante = asyncio.ensure_future(_ocupar(scheduler, "analise", liberar, []))
+        await asyncio.sleep(0)
+        na_fila = asyncio.ensure_future(_usar(scheduler, "analise", []))
+        await asyncio.sleep(0)
+        with pytest.raises(UpstreamOverloaded):
+            await _usar(scheduler, "analise", [])
+        liberar.set()
+        await asyncio.gather(ocupante, na_fila)
+        assert scheduler.em_uso == 0
+
+    asyncio.run(cenario())
+
+
+def test_chamador_cancelado_sai_da_fila():
+    async def cenario():
+        scheduler = PriorityScheduler(1, max_wait=5)
+        liberar = asyncio.Event()
+        ocupante = asyncio.ensure_future(_ocupar(scheduler, "a", liberar, []))
+        await asyncio.sleep(0)
+        na_fila = asyncio.ensure_future(_usar(scheduler, "a", []))
+        await asyncio.sleep(0)
+        na_fila.cancel()
+        await asyncio.gather(na_fila, return_exceptions=True)
+        assert scheduler.snapshot()["a"]["queue_depth"] == 0
+        liberar.set()
+        await ocupante
+        assert scheduler.em_uso == 0
+
+    asyncio.run(cenario())
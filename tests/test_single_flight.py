@@ -0,0 +1,99 @@
+# test_single_flight.py
+import asyncio
+
+import pytest
+
+from shared.single_flight import SingleFlight
+
+
+def test_chamadas_iguais_compartilham_uma_execucao():
+    async def cenario():
+        flight = SingleFlight()
+        execucoes = []
+
+        async def trabalho():
+            execucoes.append(1)
+            await asyncio.sleep(0.02)
+            return "resultado"
+
+        resultados = await asyncio.gather(*(flight.run("cep", trabalho) for _ in range(5)))
+        assert resultados == ["resultado"] * 5
+        assert len(execucoes) == 1
+        assert flight.coalesced == 4
+        assert flight.in_flight() == 0
+
+    asyncio.run(cenario())
+
+
+def test_chaves_diferentes_nao_sao_agrupadas():
+    async def cenario():
+        flight = SingleFlight()
+
+        async def trabalho(valor):
+            await asyncio.sleep(0.01)
+            return valor
+
+        assert await asyncio.gather(flight.run("a", lambda: trabalho(1)), flight.run("b", lambda: trabalho(2))) == [1, 2]
+        assert flight.coalesced == 0
+
+    asyncio.run(cenario())
+
+
+def test_erro_chega_a_todos_os_chamadores_e_nao_fica_em_cache():
+    async def cenario():
+        flight = SingleFlight()
+
+        async def falha():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream fora do ar")
+
+        resultados = await asyncio.gather(*(flight.run("cep", falha) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in resultados)
+
+        async def ok():
+            return "ok"
+
+        assert await flight.run("cep", ok) == "ok"
+
+    asyncio.run(cenario())
+
+
+def test_cancelar_um_chamador_nao_interrompe_os_outros():
+    async def cenario():
+        flight = SingleFlight()
+
+        async def trabalho():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        primeiro = asyncio.ensure_future(flight.run("cep", trabalho))
+        segundo = asyncio.ensure_future(flight.run("cep", trabalho))
+        await asyncio.sleep(0.01)
+        primeiro.cancel()
+        assert await segundo == "ok"
+        with pytest.raises(asyncio.CancelledError):
+            await primeiro
+
+    asyncio.run(cenario())
+
+
+def test_ultimo_chamador_que_desiste_cancela_o_trabalho():
+    async def cenario():
+        flight = SingleFlight()
+        cancelado = asyncio.Event()
+
+        async def trabalho():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelado.set()
+                raise
+
+        chamador = asyncio.ensure_future(flight.run("cep", trabalho))
+        await asyncio.sleep(0.01)
+        chamador.cancel()
+        await asyncio.wait_for(cancelado.wait(), timeout=1)
+        await asyncio.sleep(0)
+        assert flight.in_flight() == 0
+
+    asyncio.run(cenario())
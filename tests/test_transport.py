@@ -0,0 +1,79 @@
+# test_transport.py
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from shared.transport import InProcessTransport
+
+
+def _app_sse(liberar: asyncio.Event, terminou: asyncio.Event) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/sse")
+    async def sse():
+        async def eventos():
+            yield "data: primeiro\n\n"
+            await liberar.wait()
+            yield "data: segundo\n\n"
+            terminou.set()
+
+        return StreamingResponse(eventos(), media_type="text/event-stream")
+
+    return app
+
+
+def test_primeiro_evento_chega_antes_de_a_app_terminar():
+    async def cenario():
+        liberar, terminou = asyncio.Event(), asyncio.Event()
+        transporte = InProcessTransport({"localhost:8001": _app_sse(liberar, terminou)})
+        async with httpx.AsyncClient(transport=transporte) as client:
+            async with client.stream("GET", "http://localhost:8001/sse") as response:
+                assert response.status_code == 200
+                linhas = response.aiter_lines()
+                primeira = await asyncio.wait_for(linhas.__anext__(), timeout=2)
+                assert primeira == "data: primeiro"
+                assert not terminou.is_set()
+                liberar.set()
+                restantes = [linha async for linha in linhas if linha]
+        assert restantes == ["data: segundo"]
+        assert terminou.is_set()
+        await transporte.close()
+
+    # Com um transporte que espera o corpo inteiro, nem os cabeçalhos chegariam
+    asyncio.run(asyncio.wait_for(cenario(), timeout=5))
+
+
+def test_cliente_que_larga_a_resposta_cancela_a_app():
+    async def cenario():
+        liberar, terminou = asyncio.Event(), asyncio.Event()
+        transporte = InProcessTransport({"localhost:8001": _app_sse(liberar, terminou)})
+        async with httpx.AsyncClient(transport=transporte) as client:
+            async with client.stream("GET", "http://localhost:8001/sse") as response:
+                await response.aiter_lines().__anext__()
+        await asyncio.sleep(0.05)
+        liberar.set()
+        await asyncio.sleep(0.05)
+        assert not terminou.is_set()
+        await transporte.close()
+
+    asyncio.run(cenario())
+
+
+def test_resposta_comum_e_corpo_da_requisicao():
+    async def cenario():
+        app = FastAPI()
+
+        @app.post("/eco")
+        async def eco(payload: dict):
+            return {"recebido": payload}
+
+        transporte = InProcessTransport({"localhost:8001": app})
+        async with httpx.AsyncClient(transport=transporte) as client:
+            response = await client.post("http://localhost:8001/eco", json={"cep": "01001000"})
+        assert response.status_code == 200
+        assert response.json() == {"recebido": {"cep": "01001000"}}
+        await transporte.close()
+
+    asyncio.run(cenario())
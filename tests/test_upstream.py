@@ -0,0 +1,160 @@
+# test_upstream.py
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from shared.upstream import TokenBucket, UpstreamGuard, UpstreamOverloaded, erro_retentavel
+
+
+def _guard(**kwargs) -> UpstreamGuard:
+    return UpstreamGuard("teste", **kwargs)
+
+
+def test_hedge_usa_a_segunda_quando_a_primeira_e_cancelada():
+    async def cenario():
+        guard = _guard(hedge=True, hedge_min_samples=1, hedge_min_delay=0.01, retries=0)
+        guard._latencias.extend([0.01] * 20)
+        chamadas = []
+
+        async def requisicao():
+            chamadas.append(len(chamadas))
+            if len(chamadas) == 1:
+                await asyncio.sleep(0.05)
+                # A requisição interna foi cancelada (ex.: prazo propagado pelo httpx)
+                raise asyncio.CancelledError()
+            await asyncio.sleep(0.1)
+            return "ok"
+
+        assert await guard.call(requisicao) == "ok"
+        assert len(chamadas) == 2
+
+    asyncio.run(cenario())
+
+
+def test_token_bucket_limita_a_taxa():
+    async def cenario():
+        bucket = TokenBucket(rate=20, burst=2)
+        inicio = time.monotonic()
+        for _ in range(4):
+            assert await bucket.acquire(timeout=1)
+        # 2 tokens na rajada, os outros 2 a 20/s
+        assert time.monotonic() - inicio >= 0.09
+
+    asyncio.run(cenario())
+
+
+def test_token_bucket_desiste_quando_a_espera_passa_do_timeout():
+    async def cenario():
+        bucket = TokenBucket(rate=1, burst=1)
+        assert await bucket.acquire(timeout=0)
+        assert not await bucket.acquire(timeout=0.1)
+
+    asyncio.run(cenario())
+
+
+def test_slot_cheio_vira_sobrecarga_depois_do_max_wait():
+    async def cenario():
+        guard = _guard(max_concurrency=1, max_wait=0.05)
+        async with guard.slot():
+            with pytest.raises(UpstreamOverloaded):
+                async with guard.slot():
+                    pass
+        # A vaga volta depois do uso
+        async with guard.slot():
+            assert guard.em_uso == 1
+        assert guard.em_uso == 0
+
+    asyncio.run(cenario())
+
+
+def test_cancelado_esperando_o_token_devolve_a_vaga():
+    async def cenario():
+        guard = _guard(max_concurrency=2, rate=1, burst=1, max_wait=5)
+        async with guard.slot():
+            pass
+        esperando = asyncio.ensure_future(guard.slot().__aenter__())
+        await asyncio.sleep(0.05)
+        esperando.cancel()
+        await asyncio.gather(esperando, return_exceptions=True)
+        assert guard._semaforo._value == 2
+
+    asyncio.run(cenario())
+
+
+def test_call_repete_falhas_passageiras():
+    async def cenario():
+        guard = _guard(retries=2, backoff_base=0.001, backoff_max=0.01)
+        tentativas = []
+
+        async def requisicao():
+            tentativas.append(1)
+            if len(tentativas) < 3:
+                raise httpx.ConnectError("conexão recusada")
+            return "ok"
+
+        assert await guard.call(requisicao) == "ok"
+        assert len(tentativas) == 3
+
+    asyncio.run(cenario())
+
+
+def test_call_nao_repete_erro_definitivo():
+    async def cenario():
+        guard = _guard(retries=3, backoff_base=0.001)
+        tentativas = []
+
+        async def requisicao():
+            tentativas.append(1)
+            raise ValueError("resposta inválida")
+
+        with pytest.raises(ValueError):
+            await guard.call(requisicao)
+        assert len(tentativas) == 1
+
+    asyncio.run(cenario())
+
+
+def test_erros_retentaveis():
+    resposta = httpx.Response(503, request=httpx.Request("GET", "http://viacep"))
+    assert erro_retentavel(httpx.HTTPStatusError("503", request=resposta.request, response=resposta))
+    assert erro_retentavel(httpx.ReadTimeout("timeout"))
+    resposta = httpx.Response(404, request=httpx.Request("GET", "http://viacep"))
+    assert not erro_retentavel(httpx.HTTPStatusError("404", request=resposta.request, response=resposta))
+    assert not erro_retentavel(UpstreamOverloaded("viacep", 1))
+
+
+def test_hedge_dispara_segunda_requisicao_quando_a_primeira_demora():
+    async def cenario():
+        guard = _guard(hedge=True, hedge_min_samples=1, hedge_min_delay=0.01, retries=0)
+        guard._latencias.extend([0.01] * 20)
+        chamadas = []
+
+        async def requisicao():
+            chamadas.append(1)
+            if len(chamadas) == 1:
+                await asyncio.sleep(1)
+                return "lenta"
+            return "rapida"
+
+        assert await guard.call(requisicao) == "rapida"
+        assert len(chamadas) == 2
+
+    asyncio.run(cenario())
+
+
+def test_sem_historico_de_latencia_nao_ha_hedge():
+    async def cenario():
+        guard = _guard(hedge=True, hedge_min_samples=20, retries=0)
+        chamadas = []
+
+        async def requisicao():
+            chamadas.append(1)
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        assert await guard.call(requisicao) == "ok"
+        assert len(chamadas) == 1
+
+    asyncio.run(cenario())
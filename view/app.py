@@ -1,4 +1,6 @@
 # app.py (Ajustado para conversar com a arquitetura Pydantic A2A)
+import json
+import uuid
 import streamlit as st
 import httpx
 from datetime import datetime
@@ -6,38 +8,65 @@ from datetime import datetime
 # O endpoint padrão do .to_a2a() pode ser diferente. Verifique em http://localhost:8004/docs
 AGENT_URL = "http://localhost:8004/sse" 
 TIMEOUT = 45
+# Prazo repassado ao coordenador: um pouco menor que o TIMEOUT, para o erro vir dele e não do cliente
+DEADLINE_HEADERS = {"X-Request-Timeout": str(TIMEOUT - 1)}
 
 st.set_page_config(page_title="🤖 Chatbot A2A", page_icon="💬", layout="centered")
 
-async def enviar_mensagem(mensagem: str, historico: list) -> dict:
+def montar_payload(mensagem: str, session_id: str, stream: bool = False) -> dict:
+    # Só o turno novo é enviado; o histórico fica na memória do coordenador, por session_id
+    return {
+        "input": {"input": mensagem},
+        "session_id": session_id,
+        "stream": stream,
+    }
+
+async def enviar_mensagem_stream(mensagem: str, session_id: str, placeholder) -> dict:
+    """Recebe a resposta em SSE e vai desenhando o texto no placeholder conforme os tokens chegam."""
+    texto = ""
+    fim = {}
     try:
-        # O payload do .to_a2a() é mais complexo
-        payload = {
-            "input": {
-                "input": mensagem,
-                "chat_history": [
-                    {"role": "user" if msg["tipo"] == "usuario" else "assistant", "content": msg["conteudo"]}
-                    for msg in historico
-                ]
-            }
-        }
+        payload = montar_payload(mensagem, session_id, stream=True)
         async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-            response = await client.post(AGENT_URL, json=payload)
-        
-        if response.status_code == 200:
-            # A resposta também vem em uma estrutura diferente
-            return {"sucesso": True, "resposta": response.json().get("output", {}).get("output", "Sem resposta")}
-        else:
-            return {"sucesso": False, "erro": f"Erro HTTP {response.status_code}: {response.text}"}
+            async with client.stream("POST", AGENT_URL, json=payload, headers={"Accept": "text/event-stream", **DEADLINE_HEADERS}) as response:
+                if response.status_code != 200:
+                    corpo = (await response.aread()).decode("utf-8", errors="ignore")
+                    return {"sucesso": False, "erro": f"Erro HTTP {response.status_code}: {corpo}"}
+                async for linha in response.aiter_lines():
+                    if not linha.startswith("data: "):
+                        continue
+                    evento = json.loads(linha[len("data: "):])
+                    if evento.get("type") == "delta":
+                        texto += evento.get("text", "")
+                        placeholder.markdown(texto + "▌")
+                    elif evento.get("type") == "done":
+                        fim = evento
+        placeholder.markdown(texto)
+        if fim.get("success") is False:
+            # O evento final traz o motivo da falha; o texto parcial não é uma resposta
+            return {"sucesso": False, "erro": fim.get("error") or texto or "❌ O agente não conseguiu responder."}
+        return {"sucesso": True, "resposta": texto or "Sem resposta"}
     except Exception as e:
+        if texto:
+            return {"sucesso": True, "resposta": f"{texto}\n\n⚠️ Resposta interrompida: {str(e)}"}
         return {"sucesso": False, "erro": f"🐛 Erro inesperado: {str(e)}"}
 
+def avatar_da_mensagem(msg: dict) -> str:
+    return "👤" if msg["tipo"] == "usuario" else "🤖" if msg["tipo"] == "agent" else "❌"
+
+def mostrar_historico(historico: list):
+    for msg in historico:
+        with st.chat_message(msg["tipo"], avatar=avatar_da_mensagem(msg)):
+            st.markdown(msg["conteudo"])
+
 async def main():
     st.title("🤖 Chatbot A2A - Pydantic Native")
     st.info(f"🔗 Conectado ao endpoint: {AGENT_URL}")
 
     if "historico" not in st.session_state:
         st.session_state.historico = []
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
 
     with st.form("chat_form", clear_on_submit=True):
         mensagem_usuario = st.text_input("💬 Sua mensagem:", placeholder="Ex: Analise o CEP 13571-385")
@@ -46,19 +75,20 @@ async def main():
     if enviado and mensagem_usuario.strip():
         st.session_state.historico.append({"tipo": "usuario", "conteudo": mensagem_usuario})
         
-        with st.spinner("🤖 Coordenador A2A processando..."):
-            resultado = await enviar_mensagem(mensagem_usuario, st.session_state.historico)
-            
-            if resultado["sucesso"]:
-                st.session_state.historico.append({"tipo": "agent", "conteudo": resultado["resposta"]})
-            else:
-                 st.session_state.historico.append({"tipo": "erro", "conteudo": resultado["erro"]})
+        # Mostra o histórico e a resposta sendo escrita enquanto os tokens chegam
+        mostrar_historico(st.session_state.historico)
+        with st.chat_message("agent", avatar="🤖"):
+            placeholder = st.empty()
+            placeholder.markdown("🤖 Coordenador A2A processando...")
+            resultado = await enviar_mensagem_stream(mensagem_usuario, st.session_state.session_id, placeholder)
+
+        if resultado["sucesso"]:
+            st.session_state.historico.append({"tipo": "agent", "conteudo": resultado["resposta"]})
+        else:
+             st.session_state.historico.append({"tipo": "erro", "conteudo": resultado["erro"]})
         st.rerun()
 
-    for msg in st.session_state.historico:
-        avatar = "👤" if msg["tipo"] == "usuario" else "🤖" if msg["tipo"] == "agent" else "❌"
-        with st.chat_message(msg["tipo"], avatar=avatar):
-            st.markdown(msg["conteudo"])
+    mostrar_historico(st.session_state.historico)
 
 if __name__ == "__main__":
     import asyncio
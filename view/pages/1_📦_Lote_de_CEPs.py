@@ -0,0 +1,85 @@
+# Lote_de_CEPs.py - envio de planilhas de CEPs como job em lote no coordenador
+import json
+import httpx
+import streamlit as st
+
+JOBS_URL = "http://localhost:8004/jobs"
+TIPOS = {"🔍 Consulta (validação de endereço)": "consult", "🧠 Análise detalhada": "analysis"}
+
+st.set_page_config(page_title="📦 Lote de CEPs", page_icon="📦", layout="centered")
+
+def criar_job(arquivo, texto: str, kind: str) -> dict:
+    try:
+        with httpx.Client(timeout=60) as client:
+            if arquivo is not None:
+                response = client.post(JOBS_URL, params={"kind": kind}, content=arquivo.getvalue(), headers={"Content-Type": "text/csv"})
+            else:
+                ceps = [linha.strip() for linha in texto.splitlines() if linha.strip()]
+                response = client.post(JOBS_URL, json={"ceps": ceps, "kind": kind})
+        if response.status_code == 202:
+            return {"sucesso": True, "job": response.json()}
+        return {"sucesso": False, "erro": f"Erro HTTP {response.status_code}: {response.text}"}
+    except Exception as e:
+        return {"sucesso": False, "erro": f"🐛 Erro inesperado: {str(e)}"}
+
+def acompanhar_job(job_id: str, barra, status) -> dict:
+    """Lê o SSE de progresso do job e atualiza a barra a cada linha concluída."""
+    job = {}
+    with httpx.Client(timeout=None) as client:
+        with client.stream("GET", f"{JOBS_URL}/{job_id}/events") as response:
+            for linha in response.iter_lines():
+                if not linha.startswith("data: "):
+                    continue
+                job = json.loads(linha[len("data: "):])
+                barra.progress(job["progress"], text=f"{job['total'] - job['pending']} de {job['total']} linhas")
+                status.markdown(f"**Status:** {job['status']} · ✅ {job['done']} · ⚠️ {job['failed']}")
+                if job["type"] == "done":
+                    break
+    return job
+
+def baixar_resultados(job_id: str) -> bytes:
+    with httpx.Client(timeout=60) as client:
+        response = client.get(f"{JOBS_URL}/{job_id}/results", params={"format": "csv"})
+        response.raise_for_status()
+        return response.content
+
+def main():
+    st.title("📦 Lote de CEPs")
+    st.info("Envie uma planilha (CSV com uma coluna 'cep') ou cole um CEP por linha. O processamento continua no servidor mesmo que você feche a página.")
+
+    with st.form("job_form"):
+        arquivo = st.file_uploader("📄 Planilha CSV", type=["csv", "txt"])
+        texto = st.text_area("✍️ Ou cole os CEPs", placeholder="01001-000\n04538-132")
+        tipo = st.radio("Tipo de processamento", list(TIPOS))
+        enviado = st.form_submit_button("🚀 Iniciar job", type="primary")
+
+    if enviado:
+        if arquivo is None and not texto.strip():
+            st.warning("Informe uma planilha ou pelo menos um CEP.")
+        else:
+            resultado = criar_job(arquivo, texto, TIPOS[tipo])
+            if resultado["sucesso"]:
+                st.session_state.job_id = resultado["job"]["job_id"]
+            else:
+                st.error(resultado["erro"])
+
+    job_id = st.session_state.get("job_id")
+    if job_id:
+        st.subheader(f"Job {job_id[:8]}")
+        barra = st.progress(0.0)
+        status = st.empty()
+        try:
+            job = acompanhar_job(job_id, barra, status)
+        except Exception as e:
+            st.error(f"🐛 Erro ao acompanhar o job: {str(e)}")
+            job = {}
+        if job.get("status") in ("completed", "cancelled", "failed"):
+            st.download_button(
+                "⬇️ Baixar resultados (CSV)",
+                data=baixar_resultados(job_id),
+                file_name=f"job_{job_id}.csv",
+                mime="text/csv",
+            )
+
+if __name__ == "__main__":
+    main()